@@ -10,28 +10,26 @@ convert_height_gui_asl_no_offset.py (ver. GUI61)
 • Global設定とLocal設定の両方で適切に制御
 • オフセット補正機能を削除し、それ以外の機能は維持
 
+変換処理は kmz_converter.py（tkinter に依存しないライブラリ）にある。このファイルは GUI のみ。
 """
 
 import os
-import shutil
-import zipfile
-import glob
+import copy
+import queue
 import threading
+import time
+import importlib
+from concurrent.futures import ThreadPoolExecutor
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
 from tkinterdnd2 import TkinterDnD, DND_FILES
-from lxml import etree
-from datetime import datetime
-import pyperclip
-import math
+# 変換処理（kmz_converter・lxml）と変換キャッシュは起動時に読み込まない。
+# ウィンドウ表示後にワーカースレッドで先読みし、最初のドロップまでに読み込みを終えておく
+from kmz_options import (SENSOR_MODES, DEFAULT_VARIANT_SPEC, MAX_WORKERS, HEADING_MODE_NAMES,
+                         collect_kmz_paths, parse_variant_spec)
 
 # --- 定数 ------------------------------------------------------------------
 
-NS = {
-    "kml": "http://www.opengis.net/kml/2.2",
-    "wpml": "http://www.dji.com/wpmz/1.0.6"
-}
-
 HEIGHT_OPTIONS = {
     "613.5 – 事務所前": 613.5,
     "962.02 – 烏帽子": 962.02,
@@ -62,831 +60,120 @@ ZOOM_RATIO_OPTIONS = {
 }
 
 # 機体ヘディング制御の選択肢
-HEADING_MODE_OPTIONS = {
-    "次の撮影方向を向く": "follow_gimbal",
-    "飛行方向を向く": "follow_wayline",
-    "元の設定を維持": "original",
-    "手動モード": "manually"
-}
+HEADING_MODE_OPTIONS = {name: mode for mode, name in HEADING_MODE_NAMES.items()}
 
-SENSOR_MODES = ["Wide", "Zoom", "IR"]
+# ログ欄に残す最大行数（超えた分は古い行から削除）と、ワーカーからのログを書き込む間隔
+LOG_MAX_LINES = 5000
+LOG_DRAIN_MS = 100
+# 1 回の書き込みで取り出すログの最大件数（大量のログでも GUI を止めない）
+LOG_DRAIN_BATCH = 20000
 
-# --- ジンバル・ズーム情報取得 ---------------------------------------------
+# ウィンドウ表示後に先読みするモジュール（変換処理）
+PRELOAD_MODULES = ("kmz_converter", "kmz_cache")
 
-def extract_original_gimbal_angles(tree):
-    """
-    KMLツリーから、各ウェイポイントのジンバルピッチ／ヨー／機体ヘディング／焦点距離を取得。
-    - orientedShoot → gimbalRotate → rotateYaw → zoom アクションの順で情報を収集し、
-    - 最後に payloadParam の zoom 設定をフォールバックで補う。
-    """
-    original = {}
-
-    for pm in tree.findall(".//kml:Placemark", NS):
-        idx_elem = pm.find("wpml:index", NS)
-        if idx_elem is None:
-            continue
-        idx = int(idx_elem.text)
-        info = {}
-
-        # 1) orientedShoot から pitch/yaw/heading/focalLength
-        for action in pm.findall(".//wpml:action", NS):
-            if action.findtext("wpml:actionActuatorFunc", namespaces=NS) == "orientedShoot":
-                p = action.findtext(".//wpml:gimbalPitchRotateAngle", namespaces=NS)
-                y = action.findtext(".//wpml:gimbalYawRotateAngle",   namespaces=NS)
-                h = action.findtext(".//wpml:aircraftHeading",         namespaces=NS)
-                f = action.findtext(".//wpml:focalLength",             namespaces=NS)
-                if p: info["pitch"]   = float(p)
-                if y: info["yaw"]     = float(y)
-                if h: info["heading"] = float(h)
-                if f:
-                    fl = float(f)
-                    info["focal_length"] = fl
-                    info["zoom_ratio"]   = fl / 24.0
-                break
-
-        # 2) gimbalRotate から pitch/yaw （フォールバック）
-        if "pitch" not in info or "yaw" not in info:
-            for action in pm.findall(".//wpml:action", NS):
-                if action.findtext("wpml:actionActuatorFunc", namespaces=NS) == "gimbalRotate":
-                    param = action.find("wpml:actionActuatorFuncParam", NS)
-                    if param is None:
-                        continue
-                    if param.findtext("wpml:gimbalPitchRotateEnable", namespaces=NS) == "1" and "pitch" not in info:
-                        ap = param.findtext("wpml:gimbalPitchRotateAngle", namespaces=NS)
-                        if ap: info["pitch"] = float(ap)
-                    if param.findtext("wpml:gimbalYawRotateEnable", namespaces=NS) == "1" and "yaw" not in info:
-                        ay = param.findtext("wpml:gimbalYawRotateAngle", namespaces=NS)
-                        if ay: info["yaw"] = float(ay)
-                    if "pitch" in info and "yaw" in info:
-                        break
-
-        # 3) rotateYaw から heading （フォールバック）
-        if "heading" not in info:
-            for action in pm.findall(".//wpml:action", NS):
-                if action.findtext("wpml:actionActuatorFunc", namespaces=NS) == "rotateYaw":
-                    h = action.findtext(".//wpml:aircraftHeading", namespaces=NS)
-                    if h:
-                        info["heading"] = float(h)
-                        break
-
-        # 4) zoom アクションから focalLength （フォールバック）
-        if "zoom_ratio" not in info:
-            for action in pm.findall(".//wpml:action", NS):
-                if action.findtext("wpml:actionActuatorFunc", namespaces=NS) == "zoom":
-                    f = action.findtext(".//wpml:focalLength", namespaces=NS)
-                    if f:
-                        fl = float(f)
-                        info["focal_length"] = fl
-                        info["zoom_ratio"]   = fl / 24.0
-                    break
-
-        # 5) payloadParam に zoom 指定がある場合の最終フォールバック
-        fmt = tree.findtext(".//wpml:payloadParam/wpml:imageFormat", namespaces=NS) or ""
-        if "zoom" in fmt.lower() and "zoom_ratio" not in info:
-            info["zoom_ratio"] = None
-
-        if info:
-            original[idx] = info
-
-    return original
-
-def extract_original_heading_settings(tree):
-    """元のヘディング設定を取得"""
-    heading_settings = {}
-    
-    # グローバル設定取得
-    global_heading = tree.find(".//wpml:globalWaypointHeadingParam", NS)
-    if global_heading is not None:
-        mode_elem = global_heading.find("wpml:waypointHeadingMode", NS)
-        angle_elem = global_heading.find("wpml:waypointHeadingAngle", NS)
-        poi_elem = global_heading.find("wpml:waypointPoiPoint", NS)
-        poi_idx_elem = global_heading.find("wpml:waypointHeadingPoiIndex", NS)
-        
-        heading_settings["global"] = {
-            "mode": mode_elem.text if mode_elem is not None else "followWayline",
-            "angle": float(angle_elem.text) if angle_elem is not None else 0,
-            "poi_point": poi_elem.text if poi_elem is not None else "0.000000,0.000000,0.000000",
-            "poi_index": int(poi_idx_elem.text) if poi_idx_elem is not None else 0
-        }
-    else:
-        heading_settings["global"] = {
-            "mode": "followWayline",
-            "angle": 0,
-            "poi_point": "0.000000,0.000000,0.000000",
-            "poi_index": 0
-        }
-    
-    # 各ウェイポイント設定取得
-    for pm in tree.findall(".//kml:Placemark", NS):
-        idx_elem = pm.find("wpml:index", NS)
-        if idx_elem is None:
-            continue
-        idx = int(idx_elem.text)
-        
-        heading_param = pm.find("wpml:waypointHeadingParam", NS)
-        if heading_param is not None:
-            mode_elem = heading_param.find("wpml:waypointHeadingMode", NS)
-            angle_elem = heading_param.find("wpml:waypointHeadingAngle", NS)
-            poi_elem = heading_param.find("wpml:waypointPoiPoint", NS)
-            poi_idx_elem = heading_param.find("wpml:waypointHeadingPoiIndex", NS)
-            path_mode_elem = heading_param.find("wpml:waypointHeadingPathMode", NS)
-            
-            heading_settings[idx] = {
-                "mode": mode_elem.text if mode_elem is not None else None,
-                "angle": float(angle_elem.text) if angle_elem is not None else None,
-                "poi_point": poi_elem.text if poi_elem is not None else None,
-                "poi_index": int(poi_idx_elem.text) if poi_idx_elem is not None else None,
-                "path_mode": path_mode_elem.text if path_mode_elem is not None else "followBadArc"
-            }
-    
-    return heading_settings
+# 設定変更からプレビューを更新するまでの待ち時間（入力中に何度も計算しない）
+PREVIEW_DELAY_MS = 150
 
-def calculate_gimbal_heading_direction(gimbal_yaw, aircraft_heading):
-    """ジンバルヨー角と機体ヘディングから撮影方向を計算"""
-    # ジンバルヨーは機体基準での角度、機体ヘディングは北基準
-    # 撮影方向 = 機体ヘディング + ジンバルヨー
-    direction = aircraft_heading + gimbal_yaw
-    
-    # -180 ~ 180 の範囲に正規化
-    while direction > 180:
-        direction -= 360
-    while direction <= -180:
-        direction += 360
-    
-    return direction
-
-def get_next_waypoint_shooting_direction(waypoints_info, current_idx, original_angles):
-    """次のウェイポイントの撮影方向を取得"""
-    next_idx = current_idx + 1
-    if next_idx in original_angles:
-        next_gimbal = original_angles[next_idx]
-        if "yaw" in next_gimbal and "heading" in next_gimbal:
-            return calculate_gimbal_heading_direction(
-                next_gimbal["yaw"], 
-                next_gimbal["heading"]
-            )
-    return None
-
-def zoom_ratio_to_focal_length(ratio):
-    return ratio * 24.0
-
-# --- KMZ ユーティリティ -----------------------------------------------------
-def extract_kmz(path, work_dir="_kmz_work"):
-    if os.path.exists(work_dir):
-        shutil.rmtree(work_dir)
-    os.makedirs(work_dir)
-    
-    with zipfile.ZipFile(path, "r") as zf:
-        zf.extractall(work_dir)
-    
-    return work_dir
+# この環境変数があれば、最初のウィンドウを描画した直後に終了する（benchmark_startup.py で exe の起動時間を測る用）
+STARTUP_PROBE_ENV = "KMZ_STARTUP_PROBE"
 
-def prepare_output_dirs(input_kmz, do_photo, do_video, sensor_modes):
-    base = os.path.splitext(os.path.basename(input_kmz))[0]
-    
-    if do_photo:
-        mode_suffix = "Photo"
-    elif do_video:
-        mode_suffix = "Video"
-    else:
-        mode_suffix = "None"
-    
-    sensor_suffix = ""
-    if sensor_modes:
-        chars = []
-        for s in sensor_modes:
-            if s == "Wide": chars.append("W")
-            elif s == "Zoom": chars.append("Z")
-            elif s == "IR": chars.append("IR")
-        sensor_suffix = "".join(chars)
-    
-    if sensor_suffix:
-        out_root = os.path.join(os.path.dirname(input_kmz),
-                               f"{base}_{mode_suffix}_{sensor_suffix}")
-    else:
-        out_root = os.path.join(os.path.dirname(input_kmz),
-                               f"{base}_{mode_suffix}")
-    
-    if os.path.exists(out_root):
-        shutil.rmtree(out_root)
-    os.makedirs(out_root)
-    
-    wpmz_dir = os.path.join(out_root, "wpmz")
-    os.makedirs(wpmz_dir)
-    
-    return out_root, wpmz_dir
-
-def repackage_to_kmz(out_root, input_kmz, do_photo, do_video, sensor_modes):
-    base = os.path.splitext(os.path.basename(input_kmz))[0]
-    
-    if do_photo:
-        mode_suffix = "Photo"
-    elif do_video:
-        mode_suffix = "Video"
-    else:
-        mode_suffix = "None"
-    
-    sensor_suffix = ""
-    if sensor_modes:
-        chars = []
-        for s in sensor_modes:
-            if s == "Wide": chars.append("W")
-            elif s == "Zoom": chars.append("Z")
-            elif s == "IR": chars.append("IR")
-        sensor_suffix = "".join(chars)
-    
-    if sensor_suffix:
-        out_kmz = os.path.join(os.path.dirname(out_root),
-                              f"{base}_{mode_suffix}_{sensor_suffix}.kmz")
-    else:
-        out_kmz = os.path.join(os.path.dirname(out_root),
-                              f"{base}_{mode_suffix}.kmz")
-    
-    tmp = out_kmz + ".zip"
-    
-    with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as zf:
-        for root_dir, _, files in os.walk(out_root):
-            for f in files:
-                if f.lower().endswith(".wpml"):
-                    continue
-                full = os.path.join(root_dir, f)
-                rel = os.path.relpath(full, out_root)
-                zf.write(full, rel)
-    
-    if os.path.exists(out_kmz):
-        os.remove(out_kmz)
-    os.rename(tmp, out_kmz)
-    
-    return out_kmz
+# --- ログ出力 ---------------------------------------------------------------
+# 変換処理（kmz_converter）はログウィジェット互換のオブジェクト（insert / detail / see）に書き込む。
 
-# --- KML 変換 ---------------------------------------------------------------
+class LogSink:
+    """
+    ワーカースレッドから Tk のログ欄へ書き込むためのログ。
+    • insert / detail / call はキューに積むだけなので、どのスレッドからでも呼べる
+    • Tk スレッドで LOG_DRAIN_MS 毎にキューをまとめて取り出し、1 回の insert で書き込む
+    • ログ欄は LOG_MAX_LINES 行までのリングバッファ（古い行から削除）
+    """
 
-def create_gimbal_yaw_action(group, yaw_angle):
-    act = etree.SubElement(group, f"{{{NS['wpml']}}}action")
-    etree.SubElement(act, f"{{{NS['wpml']}}}actionId").text = "0"
-    etree.SubElement(act, f"{{{NS['wpml']}}}actionActuatorFunc").text = "gimbalRotate"
-    
-    p = etree.SubElement(act, f"{{{NS['wpml']}}}actionActuatorFuncParam")
-    etree.SubElement(p, f"{{{NS['wpml']}}}gimbalRotateMode").text = "absoluteAngle"
-    etree.SubElement(p, f"{{{NS['wpml']}}}gimbalPitchRotateEnable").text = "0"
-    etree.SubElement(p, f"{{{NS['wpml']}}}gimbalPitchRotateAngle").text = "0"
-    etree.SubElement(p, f"{{{NS['wpml']}}}gimbalRollRotateEnable").text = "0"
-    etree.SubElement(p, f"{{{NS['wpml']}}}gimbalRollRotateAngle").text = "0"
-    etree.SubElement(p, f"{{{NS['wpml']}}}gimbalYawRotateEnable").text = "1"
-    etree.SubElement(p, f"{{{NS['wpml']}}}gimbalYawRotateAngle").text = str(yaw_angle)
-    etree.SubElement(p, f"{{{NS['wpml']}}}gimbalRotateTimeEnable").text = "0"
-    etree.SubElement(p, f"{{{NS['wpml']}}}gimbalRotateTime").text = "0"
-    etree.SubElement(p, f"{{{NS['wpml']}}}payloadPositionIndex").text = "0"
-
-def apply_heading_settings(tree, heading_mode, original_heading_settings, original_angles, log):
-    """ヘディング設定を適用"""
-    log.insert(tk.END, f"\n=== 機体ヘディング制御設定 ===\n")
-    log.insert(tk.END, f"制御モード: {heading_mode}\n")
-    
-    # ウェイポイントリスト取得
-    waypoints = sorted(
-        [p for p in tree.findall(".//kml:Placemark", NS) if p.find("wpml:index", NS) is not None],
-        key=lambda x: int(x.find("wpml:index", NS).text)
-    )
-    
-    if heading_mode == "follow_wayline":
-        # 飛行経路に従う
-        log.insert(tk.END, "飛行経路に従う設定を適用\n")
-        
-        # グローバル設定
-        for hp in tree.findall(".//wpml:globalWaypointHeadingParam", NS):
-            m = hp.find("wpml:waypointHeadingMode", NS)
-            if m is not None:
-                m.text = "followWayline"
-        
-        # 各ウェイポイントのローカル設定をクリア（グローバル設定を使用）
-        for pm in waypoints:
-            hp = pm.find("wpml:waypointHeadingParam", NS)
-            if hp is not None:
-                pm.remove(hp)
-    
-    elif heading_mode == "original":
-        # 元の設定を維持
-        log.insert(tk.END, "元のヘディング設定を維持\n")
-        
-        # グローバル設定復元
-        global_settings = original_heading_settings.get("global", {})
-        for hp in tree.findall(".//wpml:globalWaypointHeadingParam", NS):
-            m = hp.find("wpml:waypointHeadingMode", NS)
-            a = hp.find("wpml:waypointHeadingAngle", NS)
-            p = hp.find("wpml:waypointPoiPoint", NS)
-            pi = hp.find("wpml:waypointHeadingPoiIndex", NS)
-            
-            if m is not None:
-                m.text = global_settings.get("mode", "followWayline")
-            if a is not None:
-                a.text = str(int(global_settings.get("angle", 0)))
-            if p is not None:
-                p.text = global_settings.get("poi_point", "0.000000,0.000000,0.000000")
-            if pi is not None:
-                pi.text = str(global_settings.get("poi_index", 0))
-        
-        # ローカル設定復元
-        for pm in waypoints:
-            idx = int(pm.find("wpml:index", NS).text)
-            if idx in original_heading_settings:
-                local_settings = original_heading_settings[idx]
-                
-                hp = pm.find("wpml:waypointHeadingParam", NS)
-                if hp is None:
-                    hp = etree.SubElement(pm, f"{{{NS['wpml']}}}waypointHeadingParam")
-                else:
-                    # 既存の設定をクリア
-                    for child in list(hp):
-                        hp.remove(child)
-                
-                # ローカル設定を適用（Noneでない値のみ）
-                if local_settings.get("mode") is not None:
-                    etree.SubElement(hp, f"{{{NS['wpml']}}}waypointHeadingMode").text = local_settings["mode"]
-                if local_settings.get("angle") is not None:
-                    etree.SubElement(hp, f"{{{NS['wpml']}}}waypointHeadingAngle").text = str(int(local_settings["angle"]))
-                if local_settings.get("poi_point") is not None:
-                    etree.SubElement(hp, f"{{{NS['wpml']}}}waypointPoiPoint").text = local_settings["poi_point"]
-                if local_settings.get("path_mode") is not None:
-                    etree.SubElement(hp, f"{{{NS['wpml']}}}waypointHeadingPathMode").text = local_settings["path_mode"]
-                if local_settings.get("poi_index") is not None:
-                    etree.SubElement(hp, f"{{{NS['wpml']}}}waypointHeadingPoiIndex").text = str(local_settings["poi_index"])
-    
-    elif heading_mode == "follow_gimbal":
-        # 撮影方向に合わせる
-        log.insert(tk.END, "撮影方向に合わせる設定を適用\n")
-        
-        # グローバル設定を固定モードに設定
-        for hp in tree.findall(".//wpml:globalWaypointHeadingParam", NS):
-            m = hp.find("wpml:waypointHeadingMode", NS)
-            if m is not None:
-                m.text = "fixed"
-        
-        # 各ウェイポイントで次のウェイポイントの撮影方向を設定
-        for i, pm in enumerate(waypoints):
-            idx = int(pm.find("wpml:index", NS).text)
-            
-            # 次のウェイポイントの撮影方向を取得
-            shooting_direction = get_next_waypoint_shooting_direction(waypoints, i, original_angles)
-            
-            if shooting_direction is not None:
-                # ローカル設定で撮影方向を設定
-                hp = pm.find("wpml:waypointHeadingParam", NS)
-                if hp is None:
-                    hp = etree.SubElement(pm, f"{{{NS['wpml']}}}waypointHeadingParam")
-                else:
-                    # 既存設定をクリア
-                    for child in list(hp):
-                        hp.remove(child)
-                
-                etree.SubElement(hp, f"{{{NS['wpml']}}}waypointHeadingMode").text = "fixed"
-                etree.SubElement(hp, f"{{{NS['wpml']}}}waypointHeadingAngle").text = str(int(shooting_direction))
-                etree.SubElement(hp, f"{{{NS['wpml']}}}waypointPoiPoint").text = "0.000000,0.000000,0.000000"
-                etree.SubElement(hp, f"{{{NS['wpml']}}}waypointHeadingPathMode").text = "followBadArc"
-                etree.SubElement(hp, f"{{{NS['wpml']}}}waypointHeadingPoiIndex").text = "0"
-                
-                log.insert(tk.END, f"[WP {idx}] 次の撮影方向: {shooting_direction:.1f}°\n")
-            else:
-                # 撮影方向が取得できない場合はfollowWaylineを使用
-                hp = pm.find("wpml:waypointHeadingParam", NS)
-                if hp is None:
-                    hp = etree.SubElement(pm, f"{{{NS['wpml']}}}waypointHeadingParam")
+    def __init__(self, widget, verbose=True, max_lines=LOG_MAX_LINES):
+        self.widget = widget
+        self.verbose = verbose
+        self.max_lines = max_lines
+        self.queue = queue.SimpleQueue()
+        widget.after(LOG_DRAIN_MS, self._drain)
+
+    def with_verbose(self, verbose):
+        """同じログ欄に書き込む、詳細ログの有無だけが異なるログを返す（ジョブ毎に切り替える）"""
+        sink = copy.copy(self)
+        sink.verbose = verbose
+        return sink
+
+    def insert(self, index, text):
+        self.queue.put(text)
+
+    def detail(self, text):
+        if self.verbose:
+            self.queue.put(text)
+
+    def see(self, index):
+        # 書き込む度に末尾へスクロールするので不要
+        pass
+
+    def call(self, func, *args):
+        """func(*args) を Tk スレッドで呼ぶ（それまでに積んだログを書き込んだ後）"""
+        self.queue.put((func, args))
+
+    def _drain(self):
+        chunks = []
+        try:
+            for _ in range(LOG_DRAIN_BATCH):
+                item = self.queue.get_nowait()
+                if isinstance(item, str):
+                    chunks.append(item)
                 else:
-                    for child in list(hp):
-                        hp.remove(child)
-                
-                etree.SubElement(hp, f"{{{NS['wpml']}}}waypointHeadingMode").text = "followWayline"
-                etree.SubElement(hp, f"{{{NS['wpml']}}}waypointHeadingAngle").text = "0"
-                etree.SubElement(hp, f"{{{NS['wpml']}}}waypointPoiPoint").text = "0.000000,0.000000,0.000000"
-                etree.SubElement(hp, f"{{{NS['wpml']}}}waypointHeadingPathMode").text = "followBadArc"
-                etree.SubElement(hp, f"{{{NS['wpml']}}}waypointHeadingPoiIndex").text = "0"
-                
-                log.insert(tk.END, f"[WP {idx}] 撮影方向取得不可→経路に従う\n")
-
-    elif heading_mode == "manually":
-        # 手動モード
-        log.insert(tk.END, "手動モード設定を適用\n")
-        
-        # グローバル設定をmanuallyに設定
-        for hp in tree.findall(".//wpml:globalWaypointHeadingParam", NS):
-            m = hp.find("wpml:waypointHeadingMode", NS)
-            if m is not None:
-                m.text = "manually"
-            # 必要に応じて angle や POI もデフォルト0／空に
-            a = hp.find("wpml:waypointHeadingAngle", NS)
-            if a is not None:
-                a.text = "0"
-        
-        # 各ウェイポイントはグローバル設定を使用（local 設定は削除）
-        for pm in waypoints:
-            local_hp = pm.find("wpml:waypointHeadingParam", NS)
-            if local_hp is not None:
-                pm.remove(local_hp)
-        
-        log.insert(tk.END, "手動モード：グローバルmanuallyを適用し、各WPではlocal設定をクリア\n")
-
-    log.insert(tk.END, "=== 機体ヘディング制御設定完了 ===\n\n")
-    log.see(tk.END)
-
-def convert_kml(tree,
-                do_photo, do_video,
-                do_gimbal, gimbal_pitch_angle, gimbal_pitch_mode,
-                yaw_fix, yaw_angle, yaw_mode, speed,
-                sensor_modes, hover_time,
-                zoom_ratio, zoom_mode,
-                original_angles, heading_mode, original_heading_settings, log, wp_stop_mode):
-
-    # 1) グローバル WP 停止モード設定
-    gw_turn = tree.find(".//wpml:globalWaypointTurnMode", NS)
-    if gw_turn is not None:
-        if wp_stop_mode == "stop":
-            gw_turn.text = "toPointAndStopWithDiscontinuityCurvature"
-        else:
-            gw_turn.text = "coordinateTurn"
-        log.insert(tk.END, f"globalWaypointTurnMode → {gw_turn.text}\n")
-    
-    # グローバル高度モード確認
-    global_height_mode_elem = tree.find(".//wpml:waylineCoordinateSysParam/wpml:heightMode", NS)
-    global_height_mode = global_height_mode_elem.text if global_height_mode_elem is not None else "ATL"
-    
-    log.insert(tk.END, "\n=== 高度補正なし処理 ===\n")
-    log.insert(tk.END, f"グローバル高度モード: {global_height_mode}\n")
-    log.see(tk.END)
-    
-    processed_count = 0
-    skipped_count = 0
-    
-    for pm in tree.findall(".//kml:Placemark", NS):
-        idx_elem = pm.find("wpml:index", NS)
-        idx = int(idx_elem.text) if idx_elem is not None else "不明"
-        
-        height_mode_elem = pm.find("wpml:heightMode", NS)
-        height_mode = height_mode_elem.text if height_mode_elem is not None else global_height_mode
-        
-        # ASL判定
-        is_asl = height_mode in ["ASL", "EGM96", "absoluteHeight", "WGS84"]
-        
-        for tag in ("height", "ellipsoidHeight"):
-            el = pm.find(f"wpml:{tag}", NS)
-            if el is not None and el.text:
-                try:
-                    original_height = float(el.text)
-                    log.insert(tk.END, f"[WP {idx}] 標高モード: {height_mode}, 高度維持: {original_height}m\n")
-                    if is_asl:
-                        skipped_count += 1
-                    else:
-                        processed_count += 1
-                except ValueError:
-                    log.insert(tk.END, f"[WP {idx}] 高度値解析エラー: {el.text}\n")
-    
-    log.insert(tk.END, f"処理サマリー: 処理点 {processed_count}点, ASLスキップ {skipped_count}点\n")
-    log.see(tk.END)
-    
-    # 高度モードをEGM96に統一
-    for hm in tree.findall(".//wpml:heightMode", NS):
-        if hm.text not in ["ASL", "EGM96", "absoluteHeight", "WGS84"]:
-            old = hm.text
-            hm.text = "EGM96"
-            log.insert(tk.END, f"高度モード変更: {old} → EGM96\n")
-    
-    if global_height_mode_elem is not None and global_height_mode_elem.text not in ["ASL", "EGM96", "absoluteHeight", "WGS84"]:
-        old = global_height_mode_elem.text
-        global_height_mode_elem.text = "EGM96"
-        log.insert(tk.END, f"グローバル高度モード変更: {old} → EGM96\n")
-    
-    # 機体ヘディング制御設定を適用
-    apply_heading_settings(tree, heading_mode, original_heading_settings, original_angles, log)
-    
-    # 速度設定
-    for tag, path in [
-        ("globalTransitionalSpeed", ".//wpml:missionConfig"),
-        ("autoFlightSpeed", ".//kml:Folder")
-    ]:
-        el = tree.find(f"{path}/wpml:{tag}", NS)
-        if el is not None:
-            el.text = str(speed)
+                    self._write(chunks)
+                    chunks = []
+                    self.widget.after_idle(item[0], *item[1])
+        except queue.Empty:
+            delay = LOG_DRAIN_MS
         else:
-            parent = tree.find(path, NS)
-            if parent is not None:
-                etree.SubElement(parent, f"{{{NS['wpml']}}}{tag}").text = str(speed)
-    
-    for pm in tree.findall(".//kml:Placemark", NS):
-        for t, v in [("waypointSpeed", speed), ("useGlobalSpeed", 1)]:
-            el = pm.find(f"wpml:{t}", NS)
-            if el is not None:
-                el.text = str(v)
-            else:
-                etree.SubElement(pm, f"{{{NS['wpml']}}}{t}").text = str(v)
-    
-    # アクション削除
-    for pm in tree.findall(".//kml:Placemark", NS):
-        for ag in list(pm.findall("wpml:actionGroup", NS)):
-            pm.remove(ag)
-    
-    pp = tree.find(".//wpml:payloadParam", NS)
-    if pp is not None:
-        img = pp.find("wpml:imageFormat", NS)
-        if img is not None:
-            pp.remove(img)
-    
-    # センサー選択
-    if sensor_modes:
-        if pp is None:
-            fld = tree.find(".//kml:Folder", NS)
-            pp = etree.SubElement(fld, f"{{{NS['wpml']}}}payloadParam")
-            etree.SubElement(pp, f"{{{NS['wpml']}}}payloadPositionIndex").text = "0"
-        
-        fmt = ",".join(m.lower() for m in sensor_modes)
-        etree.SubElement(pp, f"{{{NS['wpml']}}}imageFormat").text = fmt
-    
-    # ヨー固定
-    if yaw_fix and yaw_mode != "original" and yaw_angle is not None:
-        for hp in tree.findall(".//wpml:globalWaypointHeadingParam", NS):
-            m = hp.find("wpml:waypointHeadingMode", NS)
-            a = hp.find("wpml:waypointHeadingAngle", NS)
-            if m is not None: m.text = "fixed"
-            if a is not None: a.text = str(int(yaw_angle))
-        
-        for pm in tree.findall(".//kml:Placemark", NS):
-            hp = pm.find("wpml:waypointHeadingParam", NS)
-            if hp is None:
-                hp = etree.SubElement(pm, f"{{{NS['wpml']}}}waypointHeadingParam")
-            
-            for child in list(hp):
-                hp.remove(child)
-            
-            etree.SubElement(hp, f"{{{NS['wpml']}}}waypointHeadingMode").text = "fixed"
-            etree.SubElement(hp, f"{{{NS['wpml']}}}waypointHeadingAngle").text = str(int(yaw_angle))
-            etree.SubElement(hp, f"{{{NS['wpml']}}}waypointPoiPoint").text = "0.000000,0.000000,0.000000"
-            etree.SubElement(hp, f"{{{NS['wpml']}}}waypointHeadingPathMode").text = "followBadArc"
-            etree.SubElement(hp, f"{{{NS['wpml']}}}waypointHeadingPoiIndex").text = "0"
-    
-    # ウェイポイント取得・アクション追加
-    pms = sorted(
-        [p for p in tree.findall(".//kml:Placemark", NS) if p.find("wpml:index", NS) is not None],
-        key=lambda x: int(x.find("wpml:index", NS).text)
-    )
-    
-    for i, pm in enumerate(pms):
-        idx = int(pm.find("wpml:index", NS).text)
-        ag = etree.SubElement(pm, f"{{{NS['wpml']}}}actionGroup")
-        etree.SubElement(ag, f"{{{NS['wpml']}}}actionGroupId").text = str(idx)
-        etree.SubElement(ag, f"{{{NS['wpml']}}}actionGroupStartIndex").text = str(idx)
-        etree.SubElement(ag, f"{{{NS['wpml']}}}actionGroupEndIndex").text = str(idx)
-        etree.SubElement(ag, f"{{{NS['wpml']}}}actionGroupMode").text = "sequence"
-        
-        trg = etree.SubElement(ag, f"{{{NS['wpml']}}}actionTrigger")
-        etree.SubElement(trg, f"{{{NS['wpml']}}}actionTriggerType").text = "reachPoint"
-        
-        # 動画開始 (最初のみ)
-        if do_video and i == 0:
-            sr = etree.SubElement(ag, f"{{{NS['wpml']}}}action")
-            etree.SubElement(sr, f"{{{NS['wpml']}}}actionId").text = "0"
-            etree.SubElement(sr, f"{{{NS['wpml']}}}actionActuatorFunc").text = "startRecord"
-            sp = etree.SubElement(sr, f"{{{NS['wpml']}}}actionActuatorFuncParam")
-            etree.SubElement(sp, f"{{{NS['wpml']}}}payloadPositionIndex").text = "0"
-        
-        # ヨー固定
-        if yaw_fix:
-            yt = None
-            if yaw_mode == "original" and idx in original_angles:
-                yt = original_angles[idx].get("heading")
-            elif yaw_angle is not None:
-                yt = yaw_angle
-            
-            if yt is not None:
-                ya = etree.SubElement(ag, f"{{{NS['wpml']}}}action")
-                etree.SubElement(ya, f"{{{NS['wpml']}}}actionId").text = "0"
-                etree.SubElement(ya, f"{{{NS['wpml']}}}actionActuatorFunc").text = "rotateYaw"
-                yp = etree.SubElement(ya, f"{{{NS['wpml']}}}actionActuatorFuncParam")
-                etree.SubElement(yp, f"{{{NS['wpml']}}}aircraftHeading").text = str(int(yt))
-                etree.SubElement(yp, f"{{{NS['wpml']}}}aircraftPathMode").text = "counterClockwise"
-            
-            # ジンバルヨー自動維持
-            if yaw_mode == "original" and idx in original_angles:
-                gy = original_angles[idx].get("yaw")
-                if gy is not None:
-                    create_gimbal_yaw_action(ag, gy)
-        
-        # ジンバルピッチ
-        if do_gimbal:
-            pt = None
-            if gimbal_pitch_mode == "original" and idx in original_angles:
-                pt = original_angles[idx].get("pitch")
-            elif gimbal_pitch_angle is not None:
-                pt = gimbal_pitch_angle
-            
-            if pt is not None:
-                gp = etree.SubElement(ag, f"{{{NS['wpml']}}}action")
-                etree.SubElement(gp, f"{{{NS['wpml']}}}actionId").text = "0"
-                etree.SubElement(gp, f"{{{NS['wpml']}}}actionActuatorFunc").text = "gimbalRotate"
-                param = etree.SubElement(gp, f"{{{NS['wpml']}}}actionActuatorFuncParam")
-                etree.SubElement(param, f"{{{NS['wpml']}}}gimbalRotateMode").text = "absoluteAngle"
-                etree.SubElement(param, f"{{{NS['wpml']}}}gimbalPitchRotateEnable").text = "1"
-                etree.SubElement(param, f"{{{NS['wpml']}}}gimbalPitchRotateAngle").text = str(int(pt))
-                etree.SubElement(param, f"{{{NS['wpml']}}}gimbalRollRotateEnable").text = "0"
-                etree.SubElement(param, f"{{{NS['wpml']}}}gimbalRollRotateAngle").text = "0"
-                etree.SubElement(param, f"{{{NS['wpml']}}}gimbalYawRotateEnable").text = "0"
-                etree.SubElement(param, f"{{{NS['wpml']}}}gimbalYawRotateAngle").text = "0"
-                etree.SubElement(param, f"{{{NS['wpml']}}}gimbalRotateTimeEnable").text = "0"
-                etree.SubElement(param, f"{{{NS['wpml']}}}gimbalRotateTime").text = "0"
-                etree.SubElement(param, f"{{{NS['wpml']}}}payloadPositionIndex").text = "0"
-        
-        # Zoom センサー選択時
-        if "Zoom" in sensor_modes:
-            if zoom_mode == "fixed" and zoom_ratio is not None:
-                # 指定倍率設定
-                ft = zoom_ratio_to_focal_length(zoom_ratio)
-                za = etree.SubElement(ag, f"{{{NS['wpml']}}}action")
-                etree.SubElement(za, f"{{{NS['wpml']}}}actionId").text = "0"
-                etree.SubElement(za, f"{{{NS['wpml']}}}actionActuatorFunc").text = "zoom"
-                zp = etree.SubElement(za, f"{{{NS['wpml']}}}actionActuatorFuncParam")
-                etree.SubElement(zp, f"{{{NS['wpml']}}}focalLength").text = str(ft)
-                etree.SubElement(zp, f"{{{NS['wpml']}}}payloadPositionIndex").text = "0"
-            elif zoom_mode == "original" and idx in original_angles:
-                # 元データの focal_length を維持
-                ft = original_angles[idx].get("focal_length")
-                if ft is not None:
-                    za = etree.SubElement(ag, f"{{{NS['wpml']}}}action")
-                    etree.SubElement(za, f"{{{NS['wpml']}}}actionId").text = "0"
-                    etree.SubElement(za, f"{{{NS['wpml']}}}actionActuatorFunc").text = "zoom"
-                    zp = etree.SubElement(za, f"{{{NS['wpml']}}}actionActuatorFuncParam")
-                    etree.SubElement(zp, f"{{{NS['wpml']}}}focalLength").text = str(ft)
-                    etree.SubElement(zp, f"{{{NS['wpml']}}}payloadPositionIndex").text = "0"
-
-
-        # 写真撮影
-        if do_photo and not do_video:
-            # 先にホバリング
-            if hover_time > 0:
-                hv = etree.SubElement(ag, f"{{{NS['wpml']}}}action")
-                etree.SubElement(hv, f"{{{NS['wpml']}}}actionId").text = "0"
-                etree.SubElement(hv, f"{{{NS['wpml']}}}actionActuatorFunc").text = "hover"
-                hp = etree.SubElement(hv, f"{{{NS['wpml']}}}actionActuatorFuncParam")
-                etree.SubElement(hp, f"{{{NS['wpml']}}}hoverTime").text = str(int(hover_time))
-            
-            # その後に写真撮影
-            ph = etree.SubElement(ag, f"{{{NS['wpml']}}}action")
-            etree.SubElement(ph, f"{{{NS['wpml']}}}actionId").text = "0"
-            etree.SubElement(ph, f"{{{NS['wpml']}}}actionActuatorFunc").text = "takePhoto"
-            pp_act = etree.SubElement(ph, f"{{{NS['wpml']}}}actionActuatorFuncParam")
-            etree.SubElement(pp_act, f"{{{NS['wpml']}}}fileSuffix").text = f"ウェイポイント{idx}"
-            etree.SubElement(pp_act, f"{{{NS['wpml']}}}payloadPositionIndex").text = "0"
-            etree.SubElement(pp_act, f"{{{NS['wpml']}}}useGlobalPayloadLensIndex").text = "1"
-        
-        # 動画モードホバリング（制御後）
-        if do_video and hover_time > 0:
-            hv2 = etree.SubElement(ag, f"{{{NS['wpml']}}}action")
-            etree.SubElement(hv2, f"{{{NS['wpml']}}}actionId").text = "0"
-            etree.SubElement(hv2, f"{{{NS['wpml']}}}actionActuatorFunc").text = "hover"
-            hp2 = etree.SubElement(hv2, f"{{{NS['wpml']}}}actionActuatorFuncParam")
-            etree.SubElement(hp2, f"{{{NS['wpml']}}}hoverTime").text = str(int(hover_time))
-        
-        # 動画停止 (最後のみ)
-        if do_video and i == len(pms) - 1:
-            st = etree.SubElement(ag, f"{{{NS['wpml']}}}action")
-            etree.SubElement(st, f"{{{NS['wpml']}}}actionId").text = "0"
-            etree.SubElement(st, f"{{{NS['wpml']}}}actionActuatorFunc").text = "stopRecord"
-            sparam = etree.SubElement(st, f"{{{NS['wpml']}}}actionActuatorFuncParam")
-            etree.SubElement(sparam, f"{{{NS['wpml']}}}payloadPositionIndex").text = "0"
-
-# --- KMZ 一括処理 -----------------------------------------------------------
-def process_kmz(path,
-                do_photo, do_video,
-                do_gimbal, gimbal_pitch_angle, gimbal_pitch_mode,
-                yaw_fix, yaw_angle, yaw_mode,
-                speed, sensor_modes, hover_time,
-                zoom_ratio, zoom_mode,
-                heading_mode, wp_stop_mode, log):
-
-    try:
-        log.insert(tk.END, f"=== 処理開始: {os.path.basename(path)} ===\n")
-
-        wd = extract_kmz(path)
-        
-        # 解凍後すぐに res フォルダを削除
-        res_paths = glob.glob(os.path.join(wd, "**", "res"), recursive=True)
-        for res_path in res_paths:
-            if os.path.isdir(res_path):
-                shutil.rmtree(res_path)
-                log.insert(tk.END, f"削除: {res_path}\n")
-        
-        kmls = glob.glob(os.path.join(wd, "**", "template.kml"), recursive=True)
-        if not kmls:
-            raise FileNotFoundError("template.kml が見つかりませんでした。")
-
-        sensor_list = ', '.join(sensor_modes) if sensor_modes else 'デフォルト'
-        log.insert(tk.END, f"使用センサー: {sensor_list}\n")
-
-        heading_mode_name = next((k for k, v in HEADING_MODE_OPTIONS.items() if v == heading_mode), "不明")
-        log.insert(tk.END, f"機体ヘディング制御: {heading_mode_name}\n")
-
-        if "Zoom" in sensor_modes:
-            if zoom_mode == "original":
-                log.insert(tk.END, "ズーム設定: 元を維持\n")
-            elif zoom_mode == "fixed" and zoom_ratio is not None:
-                log.insert(tk.END, f"ズーム設定: {zoom_ratio:.1f}倍 ({zoom_ratio*24.0:.1f}mm)\n")
-
-
-        out_root, outdir = prepare_output_dirs(path, do_photo, do_video, sensor_modes)
-
-        for kml in kmls:
-            log.insert(tk.END, f"-- テンプレート読み込み: {os.path.basename(kml)}\n")
+            delay = 1  # まだ残っているので、イベント処理を挟んですぐに続きを書き込む
+        self._write(chunks)
+        self.widget.after(delay, self._drain)
 
-            parser = etree.XMLParser(remove_blank_text=True)
-            tree = etree.parse(kml, parser)
-
-            global_height_elem = tree.find(".//wpml:globalHeight", NS)
-            global_height = global_height_elem.text if global_height_elem is not None else "未設定"
-
-            global_height_mode_elem = tree.find(
-                ".//wpml:waylineCoordinateSysParam/wpml:heightMode", NS)
-            global_height_mode = global_height_mode_elem.text if global_height_mode_elem is not None else "未設定"
-
-            log.insert(tk.END,
-                       f"グローバル高度: {global_height}, 標高モード: {global_height_mode}\n")
+    def _write(self, chunks):
+        if not chunks:
+            return
+        text = "".join(chunks)
+        # ログ欄に残らない分は最初から書き込まない
+        if text.count("\n") > self.max_lines:
+            text = "\n".join(text.split("\n")[-self.max_lines - 1:])
+
+        w = self.widget
+        w.insert(tk.END, text)
+        excess = int(w.index("end-1c").split(".")[0]) - self.max_lines
+        if excess > 0:
+            w.delete("1.0", f"{excess + 1}.0")
+        w.see(tk.END)
 
-            placemarks = tree.findall(".//kml:Placemark", NS)
-            wpms = [pm for pm in placemarks if pm.find("wpml:index", NS) is not None]
-            log.insert(tk.END, f"総ウェイポイント数: {len(wpms)}\n")
+# --- KMZ 一括処理 -----------------------------------------------------------
 
-            original_angles = extract_original_gimbal_angles(tree)
-            if original_angles:
-                log.insert(tk.END,
-                           f"ジンバル・ズーム情報を持つウェイポイント: {len(original_angles)}個\n")
-            else:
-                log.insert(tk.END, "元データにジンバル・ズーム情報なし\n")
-
-            original_heading_settings = extract_original_heading_settings(tree)
-            log.insert(tk.END, "元のヘディング設定取得完了\n")
-
-            # 各ウェイポイント詳細表示
-            for pm in wpms:
-                idx = int(pm.find("wpml:index", NS).text)
-                mode = pm.find("wpml:heightMode", NS)
-                height_mode = mode.text if mode is not None else global_height_mode
-                h_elem = pm.find("wpml:ellipsoidHeight", NS)
-                if h_elem is None:
-                    h_elem = pm.find("wpml:height", NS)
-                height_val = h_elem.text if h_elem is not None else global_height
-
-                g = original_angles.get(idx, {})
-                pitch = g.get("pitch", "N/A")
-                yaw   = g.get("yaw",   "N/A")
-                head  = g.get("heading","N/A")
-                fl    = g.get("focal_length", "N/A")
-                zr    = g.get("zoom_ratio",    None)
-
-                # zoom_ratio が None の場合は "元設定維持"、数値ならフォーマット
-                if zr is None:
-                    zoom_info = "元設定維持"
-                else:
-                    zoom_info = f"{zr:.1f}倍({fl:.1f}mm)"
-
-                log.insert(tk.END,
-                           f"[WP {idx}] 標高モード={height_mode}, 高度={height_val}, "
-                           f"ジンバルピッチ={pitch}°, ジンバルヨー={yaw}°, "
-                           f"機体ヘディング={head}°, ズーム={zoom_info}\n")
-
-            log.insert(tk.END, "\n高度補正なし処理開始\n")
-
-            convert_kml(tree,
-                        do_photo, do_video,
-                        do_gimbal, gimbal_pitch_angle, gimbal_pitch_mode,
-                        yaw_fix, yaw_angle, yaw_mode, speed,
-                        sensor_modes, hover_time,
-                        zoom_ratio, zoom_mode,
-                        original_angles, heading_mode, original_heading_settings, log, wp_stop_mode)
-
-            log.insert(tk.END, "高度補正なし処理完了\n\n")
-
-            out_path = os.path.join(outdir, os.path.basename(kml))
-            tree.write(out_path, encoding="utf-8", pretty_print=True, xml_declaration=True)
-            log.insert(tk.END, f"書き出し完了: {out_path}\n")
-
-        # リソースコピー部分を削除（resフォルダをコピーしない）
-        # 元のコードの以下の部分をコメントアウト
-        # for name in ["res"]:
-        #     srcs = glob.glob(os.path.join(wd, "**", name), recursive=True)
-        #     if srcs:
-        #         src = srcs[0]; dst = os.path.join(outdir, os.path.basename(src))
-        #         if os.path.isdir(src):
-        #             shutil.copytree(src, dst, dirs_exist_ok=True)
-        #         else:
-        #             shutil.copy2(src, dst)
-
-        out_kmz = repackage_to_kmz(out_root, path, do_photo, do_video, sensor_modes)
-        log.insert(tk.END, f"最終KMZ: {out_kmz}\n")
-        log.insert(tk.END, "=== 処理完了 ===\n\n")
-
-        messagebox.showinfo("完了", f"変換完了:\n{out_kmz}")
+def process_kmz(path, log, notify=True, **settings):
+    """
+    kmz_converter.convert_kmz の GUI 用ラッパー（settings は convert_kmz のキーワード引数。
+    既定値も convert_kmz と同じ）。
+    log は LogSink 互換（insert / detail / see / call）。完了・エラーのメッセージボックスは log.call で表示する。
+    notify=False の場合はメッセージボックスを出さず、エラーは（ログに出した上で）送出する（ジョブキュー用）。
+    戻り値: 出力 KMZ のパスのリスト（中止・エラーの場合は None）
+    """
+    from kmz_converter import convert_kmz
 
+    try:
+        result = convert_kmz(path, log=log, **settings)
     except Exception as e:
-        messagebox.showerror("エラー", str(e))
-        log.insert(tk.END, f"エラー: {e}\n\n")
-    finally:
-        if os.path.exists("_kmz_work"):
-            shutil.rmtree("_kmz_work")
+        if not notify:
+            raise
+        log.call(messagebox.showerror, "エラー", str(e))
+        return None
+
+    if result.cancelled:
+        return None
+    if notify:
+        log.call(messagebox.showinfo, "完了", "変換完了:\n" + "\n".join(result.outputs))
+    return result.outputs
 
 
 
@@ -999,6 +286,50 @@ class AppGUI(ttk.Frame):
         self.hover_time_label = ttk.Label(self, text="ホバリング時間 (秒):")
         self.hover_time_var = tk.StringVar(value="2")
         self.hover_time_entry = ttk.Entry(self, textvariable=self.hover_time_var, width=8)
+        # ジンバル・機体ヨー・ズームの動きに合わせて短くする（ホバリング時間が上限）
+        self.adaptive_hover_var = tk.BooleanVar(value=False)
+        self.adaptive_hover_check = ttk.Checkbutton(self, text="動きに合わせて短縮", variable=self.adaptive_hover_var)
+
+        # --- 処理方式 ---
+        self.in_memory_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(self, text="メモリ上で処理（作業フォルダを使わない）", variable=self.in_memory_var).grid(row=10, column=0, columnspan=3, sticky="w", pady=5)
+        self.keep_res_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self, text="resフォルダを保持", variable=self.keep_res_var).grid(row=10, column=3, sticky="w", pady=5)
+
+        # --- バリエーション一括出力（例: W,Z,WZ,IR / Photo_WZ,Video_IR） ---
+        self.variants_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self, text="バリエーション一括出力", variable=self.variants_var, command=self.update_variants).grid(row=11, column=0, sticky="w", pady=5)
+        self.variant_spec_var = tk.StringVar(value=DEFAULT_VARIANT_SPEC)
+        self.variant_spec_entry = ttk.Entry(self, textvariable=self.variant_spec_var, width=24, state="disabled")
+        self.variant_spec_entry.grid(row=11, column=1, columnspan=2, sticky="w", padx=5)
+
+        # --- 変換キャッシュ（同じ入力・同じ設定なら再変換しない） ---
+        self.use_cache_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(self, text="変換キャッシュを使う", variable=self.use_cache_var).grid(row=12, column=0, columnspan=2, sticky="w", pady=5)
+
+        # --- ストリーミング変換（Placemark 単位で読み書きし、メモリ使用量を一定に保つ） ---
+        self.streaming_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self, text="ストリーミング処理（大規模テンプレート向け）", variable=self.streaming_var).grid(row=12, column=2, columnspan=2, sticky="w", pady=5)
+
+        # --- 出力 XML の整形（インデント無しは小さく速い） ---
+        self.pretty_print_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(self, text="template.kml を整形して出力", variable=self.pretty_print_var).grid(row=13, column=0, columnspan=2, sticky="w", pady=5)
+
+        # --- ログの詳細度（OFF ならウェイポイント毎のログを出さず、概要のみ） ---
+        self.verbose_log_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(self, text="ウェイポイント毎の詳細ログ", variable=self.verbose_log_var).grid(row=13, column=2, columnspan=2, sticky="w", pady=5)
+
+        # --- 飛行時間見積り（ログと <出力 KMZ 名>.estimate.json に出力） ---
+        self.estimate_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(self, text="飛行時間・バッテリーを見積もる", variable=self.estimate_var).grid(row=14, column=0, columnspan=2, sticky="w", pady=5)
+
+        # --- 前の点と同じ値のジンバル・ズーム・ヨーのアクションを省く ---
+        self.prune_actions_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self, text="重複アクションを省く", variable=self.prune_actions_var).grid(row=14, column=2, columnspan=2, sticky="w", pady=5)
+
+        # --- 機体ヨー・ジンバル・ズームを同時に動かしてから撮影する（parallel のアクショングループ） ---
+        self.parallel_actions_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self, text="ヨー・ジンバル・ズームを同時に動かす", variable=self.parallel_actions_var).grid(row=15, column=0, columnspan=2, sticky="w", pady=5)
 
         # --- UI 初期化 ---
         self.update_capture_mode()    # 最初に「撮影なし」の状態を反映
@@ -1111,9 +442,30 @@ class AppGUI(ttk.Frame):
         if self.hv.get():
             self.hover_time_label.grid(row=9, column=1, sticky="e", padx=(10, 2))
             self.hover_time_entry.grid(row=9, column=2, sticky="w")
+            self.adaptive_hover_check.grid(row=9, column=3, sticky="w")
         else:
             self.hover_time_label.grid_forget()
             self.hover_time_entry.grid_forget()
+            self.adaptive_hover_check.grid_forget()
+    
+    def bind_changes(self, callback):
+        """変換設定が変わったときに callback() を呼ぶ（プレビューの更新用）"""
+        variables = [self.sp, self.capture_mode_var, self.yf, self.heading_mode_var, self.stop_mode_var,
+                     self.hv, self.hover_time_var, self.adaptive_hover_var, self.variants_var, self.variant_spec_var,
+                     self.estimate_var, self.prune_actions_var, self.parallel_actions_var,
+                     *self.sm_vars.values()]
+        for var in variables:
+            var.trace_add("write", lambda *_: callback())
+        for combo in (self.zm_mode, self.gp_mode, self.yc):
+            combo.bind("<<ComboboxSelected>>", lambda e: callback(), add="+")
+        for entry in (self.zm_entry, self.gp_entry, self.ye):
+            entry.bind("<KeyRelease>", lambda e: callback(), add="+")
+    
+    def update_variants(self):
+        if self.variants_var.get():
+            self.variant_spec_entry.config(state="normal")
+        else:
+            self.variant_spec_entry.config(state="disabled")
     
     def get_params(self):
         # offset削除 -> 高度オフセットは常に0
@@ -1196,6 +548,11 @@ class AppGUI(ttk.Frame):
 
         mode = capture_mode
 
+        # バリエーション一括出力（指定が不正な場合は ValueError）
+        variants = None
+        if self.variants_var.get():
+            variants = parse_variant_spec(self.variant_spec_var.get(), mode == "photo", mode == "video")
+
         return {
             "do_photo": (mode == "photo"),
             "do_video": (mode == "video"),
@@ -1211,11 +568,210 @@ class AppGUI(ttk.Frame):
             "zoom_ratio": zoom_ratio,
             "zoom_mode": zoom_mode,
             "heading_mode": heading_mode,
-            "wp_stop_mode": self.stop_mode_var.get()
+            "wp_stop_mode": self.stop_mode_var.get(),
+            "in_memory": self.in_memory_var.get(),
+            "keep_res": self.keep_res_var.get(),
+            "variants": variants,
+            "use_cache": self.use_cache_var.get(),
+            "streaming": self.streaming_var.get(),
+            "pretty_print": self.pretty_print_var.get(),
+            "estimate": self.estimate_var.get(),
+            "prune_actions": self.prune_actions_var.get(),
+            "parallel_actions": self.parallel_actions_var.get(),
+            "adaptive_hover": self.adaptive_hover_var.get(),
+            "verbose_log": self.verbose_log_var.get()
         }
 
 
 
+# --- ジョブキュー -----------------------------------------------------------
+
+def format_duration(seconds):
+    """秒数を「1時間2分」「3分4秒」「5秒」形式にする"""
+    seconds = int(round(seconds))
+    h, rem = divmod(seconds, 3600)
+    m, sec = divmod(rem, 60)
+    if h:
+        return f"{h}時間{m}分"
+    if m:
+        return f"{m}分{sec}秒"
+    return f"{sec}秒"
+
+class Job:
+    """ジョブキューの 1 ファイル分（状態は Tk スレッドでのみ書き換える）"""
+    __slots__ = ("path", "params", "cancel", "future", "status", "started", "finished")
+
+    def __init__(self, path, params):
+        self.path = path
+        self.params = params
+        self.cancel = threading.Event()
+        self.future = None
+        self.status = "待機中"
+        self.started = None
+        self.finished = None
+
+    @property
+    def active(self):
+        return self.finished is None
+
+class JobQueue(ttk.LabelFrame):
+    """
+    ドロップされた KMZ の変換ジョブ一覧。
+    • on_finished(job) はジョブの終了時に Tk スレッドで呼ぶ
+    • ジョブは executor（上限付きワーカープール）で処理し、ファイル毎の状態と処理時間を表示する
+    • 進捗バーは一覧にあるジョブのうち終了したものの割合。残り時間は終了したジョブの平均処理時間から見積もる
+    • 中止は待機中ならその場で取り消し、処理中なら次の区切りで止める（process_kmz の cancel）
+    ワーカーからの状態通知は log.call で Tk スレッドに渡す。
+    """
+
+    def __init__(self, master, executor, log, on_finished=None):
+        super().__init__(master, text="ジョブ")
+        self.executor = executor
+        self.log = log
+        self.on_finished = on_finished
+        self.jobs = {}    # Treeview の iid → Job
+
+        self.tree = ttk.Treeview(self, columns=("status", "time"), height=6, selectmode="extended")
+        self.tree.heading("#0", text="ファイル")
+        self.tree.heading("status", text="状態")
+        self.tree.heading("time", text="処理時間")
+        self.tree.column("#0", width=460)
+        self.tree.column("status", width=90, anchor="center")
+        self.tree.column("time", width=90, anchor="e")
+        scroll = ttk.Scrollbar(self, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scroll.set)
+        self.tree.grid(row=0, column=0, columnspan=4, sticky="nsew")
+        scroll.grid(row=0, column=4, sticky="ns")
+
+        self.progress = ttk.Progressbar(self, mode="determinate")
+        self.progress.grid(row=1, column=0, columnspan=5, sticky="we", pady=(5, 0))
+        self.summary = ttk.Label(self, text="")
+        self.summary.grid(row=2, column=0, sticky="w")
+        ttk.Button(self, text="選択を中止", command=self.cancel_selected).grid(row=2, column=1, sticky="e")
+        ttk.Button(self, text="すべて中止", command=self.cancel_all).grid(row=2, column=2, sticky="e")
+        ttk.Button(self, text="終了分を消去", command=self.clear_finished).grid(row=2, column=3, columnspan=2, sticky="e")
+        self.columnconfigure(0, weight=1)
+
+        self._ticking = False
+
+    def submit(self, paths, params):
+        """paths をそれぞれ 1 ジョブとして登録する（処理待ち・処理中の同じファイルは登録しない）"""
+        busy = {job.path for job in self.jobs.values() if job.active}
+        added = 0
+        for path in paths:
+            if path in busy:
+                self.log.insert(tk.END, f"処理中のためスキップ: {path}\n")
+                continue
+            job = Job(path, dict(params, path=path))
+            iid = self.tree.insert("", tk.END, text=path, values=(job.status, ""))
+            self.jobs[iid] = job
+            job.future = self.executor.submit(self._run, iid, job)
+            added += 1
+        self.refresh()
+        return added
+
+    def _run(self, iid, job):
+        """ワーカースレッドで 1 ジョブを処理する（開始前に中止されていれば process_kmz がすぐに返る）"""
+        started = time.monotonic()
+        self.log.call(self._started, iid, started)
+        try:
+            result = process_kmz(**job.params, cancel=job.cancel, notify=False)
+            status = "中止" if result is None else "完了"
+        except Exception:
+            # 内容は process_kmz がログに出している
+            status = "エラー"
+        self.log.call(self._finished, iid, status, time.monotonic())
+
+    def _started(self, iid, started):
+        job = self.jobs.get(iid)
+        if job is None or not job.active:
+            return
+        job.started = started
+        if not job.cancel.is_set():
+            job.status = "処理中"
+        self._show(iid, job)
+        self.refresh()
+
+    def _finished(self, iid, status, finished):
+        job = self.jobs.get(iid)
+        if job is None:
+            return
+        job.status = status
+        job.finished = finished
+        self._show(iid, job)
+        self.refresh()
+        if self.on_finished is not None:
+            self.on_finished(job)
+
+    def _show(self, iid, job):
+        elapsed = ""
+        if job.started is not None:
+            elapsed = format_duration((job.finished or time.monotonic()) - job.started)
+        self.tree.item(iid, values=(job.status, elapsed))
+
+    def _cancel(self, iids):
+        for iid in iids:
+            job = self.jobs[iid]
+            if not job.active:
+                continue
+            job.cancel.set()
+            if job.future.cancel():
+                # 待機中のジョブはその場で取り消し
+                job.status = "中止"
+                job.finished = time.monotonic()
+            else:
+                job.status = "中止中"
+            self._show(iid, job)
+        self.refresh()
+
+    def cancel_selected(self):
+        self._cancel(self.tree.selection())
+
+    def cancel_all(self):
+        self._cancel(list(self.jobs))
+
+    def clear_finished(self):
+        for iid, job in list(self.jobs.items()):
+            if not job.active:
+                self.tree.delete(iid)
+                del self.jobs[iid]
+        self.refresh()
+
+    def refresh(self):
+        """進捗バー・件数・残り時間を更新する（処理中のジョブがある間は 1 秒毎）"""
+        jobs = list(self.jobs.values())
+        done = [job for job in jobs if not job.active]
+        running = [job for job in jobs if job.active and job.started is not None]
+        waiting = len(jobs) - len(done) - len(running)
+
+        self.progress.configure(maximum=max(len(jobs), 1), value=len(done))
+        text = f"{len(done)}/{len(jobs)} 件終了"
+        durations = [job.finished - job.started for job in done
+                     if job.started is not None and job.status == "完了"]
+        if durations and (running or waiting):
+            avg = sum(durations) / len(durations)
+            now = time.monotonic()
+            left = sum(max(avg - (now - job.started), 0) for job in running) + avg * waiting
+            text += f"（残り約 {format_duration(left / min(MAX_WORKERS, len(running) + waiting))}）"
+        self.summary.configure(text=text)
+
+        for iid, job in self.jobs.items():
+            if job.active and job.started is not None:
+                self._show(iid, job)
+
+        if (running or waiting) and not self._ticking:
+            self._ticking = True
+            self.after(1000, self._tick)
+
+    def _tick(self):
+        self._ticking = False
+        self.refresh()
+
+    def stop(self):
+        """終了時用: 全ジョブに中止を指示する（ウィジェットには触れない）"""
+        for job in self.jobs.values():
+            job.cancel.set()
+
 # --- エントリポイント -------------------------------------------------------
 
 def main():
@@ -1229,30 +785,130 @@ def main():
     app = AppGUI(frm)
     app.pack(fill="x", pady=(0, 10))
     
-    drop = tk.Label(frm, text=".kmz をここにドロップ", bg="lightgray",
+    drop = tk.Label(frm, text=".kmz またはフォルダをここにドロップ（複数可）", bg="lightgray",
                    width=70, height=5, relief=tk.RIDGE)
     drop.pack(pady=12, fill="x")
     drop.drop_target_register(DND_FILES)
     
+    # --- プレビュー・再変換（最後にドロップした KMZ の解析結果を使い回す） ---
+    preview_frame = ttk.LabelFrame(frm, text="プレビュー（最後にドロップした KMZ）")
+    preview_frame.pack(fill="x", pady=(0, 10))
+    preview_label = ttk.Label(preview_frame, text="KMZ をドロップすると、現在の設定での変換結果の概要を表示します。",
+                              justify="left", anchor="w")
+    preview_label.pack(side="left", fill="x", expand=True, padx=5, pady=5)
+    reconvert_button = ttk.Button(preview_frame, text="再変換", state="disabled")
+    reconvert_button.pack(side="right", padx=5, pady=5)
+    
+    job_frame = ttk.Frame(frm)
+    job_frame.pack(fill="x", pady=(0, 10))
+    
     log_frame = ttk.LabelFrame(frm, text="ログ")
     log_frame.pack(fill="both", expand=True)
     
-    log = scrolledtext.ScrolledText(log_frame, height=16)
-    log.pack(fill="both", expand=True)
+    log_text = scrolledtext.ScrolledText(log_frame, height=16)
+    log_text.pack(fill="both", expand=True)
+    # ワーカースレッドからはキュー経由で書き込む
+    log = LogSink(log_text)
+    
+    # 変換ジョブは上限付きのワーカープールで処理する
+    executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="kmz")
+    conversion_cache = None
+    # 最近ドロップした KMZ の解析結果（kmz_converter.MissionCache）。設定を変えた再変換とプレビューで使う
+    # （メモリ上で処理する設定で変換したものだけ）
+    mission_cache = None
+    last_paths = []
+    preview_after = None
+    
+    def update_preview():
+        """最後にドロップした KMZ を現在の設定で変換した場合の概要を表示する（解析結果があれば数 ms）"""
+        nonlocal preview_after
+        preview_after = None
+        if not last_paths or mission_cache is None:
+            return
+        parsed = mission_cache.get(last_paths[0], touch=False)
+        if parsed is None:
+            preview_label.configure(text=f"{os.path.basename(last_paths[0])}: 解析待ち")
+            return
+        try:
+            params = app.get_params()
+        except ValueError as e:
+            preview_label.configure(text=str(e))
+            return
+        from kmz_converter import preview_conversion
+        from wpml_estimate import AircraftLimits
+        if params["variants"]:
+            params.update(params["variants"][0])
+        params["aircraft"] = AircraftLimits()
+        text = preview_conversion(parsed, params).summary()
+        if len(last_paths) > 1:
+            text += f"\n（ほか {len(last_paths) - 1} 件）"
+        preview_label.configure(text=text)
+    
+    def schedule_preview():
+        nonlocal preview_after
+        if preview_after is not None:
+            root.after_cancel(preview_after)
+        preview_after = root.after(PREVIEW_DELAY_MS, update_preview)
+    
+    jobs = JobQueue(job_frame, executor, log, on_finished=lambda job: schedule_preview())
+    jobs.pack(fill="x")
+    app.bind_changes(schedule_preview)
+    
+    def submit(paths):
+        """paths を現在の設定で変換ジョブに登録する"""
+        nonlocal conversion_cache, mission_cache
+        try:
+            params = app.get_params()
+        except ValueError as e:
+            messagebox.showwarning("警告", str(e))
+            return
+        params["log"] = log.with_verbose(params.pop("verbose_log"))
+        if params.pop("use_cache"):
+            if conversion_cache is None:
+                from kmz_cache import ConversionCache
+                conversion_cache = ConversionCache()
+            params["cache"] = conversion_cache
+        # 解析結果の再利用はメモリ上の処理なので、作業フォルダを使う設定のときは使わない
+        # （バリエーション一括出力は常にメモリ上で処理する）
+        if params["in_memory"] or params["variants"]:
+            if mission_cache is None:
+                from kmz_converter import MissionCache
+                mission_cache = MissionCache()
+            params["missions"] = mission_cache
+        
+        jobs.submit(paths, params)
     
     def on_drop(event):
-        path = event.data.strip("{}")
-        if not path.lower().endswith(".kmz"):
-            messagebox.showwarning("警告", ".kmz ファイルのみ対応しています。")
+        # 複数ファイル・空白を含むパス（{...} で囲まれる）は Tcl のリストとして分割する
+        paths, skipped = collect_kmz_paths(drop.tk.splitlist(event.data))
+        if skipped:
+            log.insert(tk.END, f"出力済み KMZ を除外: {skipped} 件\n")
+        if not paths:
+            messagebox.showwarning("警告", ".kmz ファイル（またはそれを含むフォルダ）のみ対応しています。")
             return
         
-        params = app.get_params()
-        params.update({"path": path, "log": log})
-        
-        threading.Thread(target=process_kmz, kwargs=params, daemon=True).start()
+        last_paths[:] = paths
+        reconvert_button.configure(state="normal")
+        submit(paths)
+        schedule_preview()
+    
+    def on_reconvert():
+        # 最後にドロップした KMZ を現在の設定で変換し直す（解析結果は mission_cache から再利用）
+        submit(last_paths)
     
     drop.dnd_bind("<<Drop>>", on_drop)
+    reconvert_button.configure(command=on_reconvert)
+
+    if os.environ.get(STARTUP_PROBE_ENV):
+        # 起動時間の計測: 最初のウィンドウを描画したら終了する
+        root.after_idle(lambda: (root.update(), root.destroy()))
+    else:
+        # 最初のウィンドウを描画した後、変換処理をワーカースレッドで先読みする
+        root.after_idle(lambda: [executor.submit(importlib.import_module, name)
+                                 for name in PRELOAD_MODULES])
     root.mainloop()
+    jobs.stop()
+    executor.shutdown(wait=False, cancel_futures=True)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -22,11 +22,8 @@ from lxml import etree
 # pip install simplekml
 import simplekml
 
-# KML 名前空間
-NS = {
-    "kml":   "http://www.opengis.net/kml/2.2",
-    "wpml":  "http://www.dji.com/wpmz/1.0.6"
-}
+# KML 名前空間・コンパイル済み XPath
+import wpml_xpath as xp
 
 def extract_kmz(kmz_path, work_dir="_kmz_work"):
     if os.path.isdir(work_dir):
@@ -44,11 +41,11 @@ def extract_kmz(kmz_path, work_dir="_kmz_work"):
 def parse_waypoints(kml_file):
     tree = etree.parse(kml_file)
     pts = []
-    for pm in tree.findall(".//kml:Placemark", NS):
-        idx = pm.findtext("wpml:index", namespaces=NS)
-        coord = pm.findtext("kml:Point/kml:coordinates", namespaces=NS)
-        alt = pm.findtext("wpml:height", namespaces=NS) or pm.findtext("wpml:ellipsoidHeight", namespaces=NS) or "0"
-        if coord and idx is not None:
+    for pm in xp.PLACEMARKS(tree):
+        idx = xp.WP_INDEX_TEXT(pm)
+        coord = xp.WP_COORDINATES(pm)
+        alt = xp.WP_HEIGHT(pm) or xp.WP_ELLIPSOID_HEIGHT(pm) or "0"
+        if coord and idx:
             lon, lat = map(float, coord.split(",")[:2])
             pts.append((int(idx), lon, lat, float(alt)))
     # インデックス順にソート
@@ -1,5 +1,11 @@
+import os
+import sys
 from lxml import etree
 
+# リポジトリ直下の wpml_actions（アクションのプロトタイプ複製）を使う
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from wpml_actions import action_template, new_action_group
+
 # --- 設定パラメータ（用途コメント付き） ---
 BASE_HEIGHT = 613.5            # 高度変換時の基準高さ[m]
 NEW_HEIGHT_MODE = 'als'        # 高度基準（'als':絶対高度基準, 'relativeToStartPoint'等）
@@ -20,6 +26,38 @@ PAYLOAD_POSITION_INDEX = '0'   # ペイロード位置インデックス
 INPUT_KML = r"C:\Users\keita\Documents\local\M30_GPS\1Q_RL\wpmz\template.kml"
 OUTPUT_KML = r"C:\Users\keita\Documents\local\M30_GPS\1Q_RL\wpmz\template_movie.kml"
 
+# --- アクション（プロトタイプを 1 回だけ作り、複製して使う） ---
+GIMBAL_ACTION = action_template('gimbalRotate', [
+    ('gimbalRotateMode', 'absoluteAngle'),
+    ('gimbalPitchRotateEnable', '1'),
+    ('gimbalPitchRotateAngle', GIMBAL_PITCH),
+    ('gimbalRollRotateEnable', '0'),
+    ('gimbalRollRotateAngle', '0'),
+    ('gimbalYawRotateEnable', '0'),
+    ('gimbalYawRotateAngle', '0'),
+    ('gimbalRotateTimeEnable', '0'),
+    ('gimbalRotateTime', '0'),
+    ('payloadPositionIndex', PAYLOAD_POSITION_INDEX),
+])
+HOVER_ACTION = action_template('stayForSeconds', [
+    ('stayTime', HOVER_SECONDS),
+    ('gimbalPitchRotateAngle', GIMBAL_PITCH),
+    ('aircraftHeading', YAW_ANGLE),
+])
+
+def video_actions(func, action_ids):
+    """有効なカメラ種別（zoom, wide, ir の順）ごとの録画開始/停止アクション"""
+    actions = []
+    for enabled, video_type, action_id in zip((ENABLE_ZOOM, ENABLE_WIDE, ENABLE_IR),
+                                             ('zoom', 'wide', 'ir'), action_ids):
+        if not enabled:
+            continue
+        params = [('payloadPositionIndex', PAYLOAD_POSITION_INDEX), ('videoType', video_type)]
+        if video_type == 'zoom':
+            params.append(('zoomFactor', ZOOM_FACTOR))
+        actions.append(action_template(func, params).make(action_id=action_id))
+    return actions
+
 def convert_kml(input_kml, output_kml):
     ns = {
         'kml': 'http://www.opengis.net/kml/2.2',
@@ -96,13 +134,7 @@ def convert_kml(input_kml, output_kml):
 
         # actionGroup がなければ作成
         if action_group is None:
-            action_group = etree.SubElement(placemark, '{http://www.dji.com/wpmz/1.0.6}actionGroup')
-            etree.SubElement(action_group, '{http://www.dji.com/wpmz/1.0.6}actionGroupId').text = str(i)
-            etree.SubElement(action_group, '{http://www.dji.com/wpmz/1.0.6}actionGroupStartIndex').text = str(i)
-            etree.SubElement(action_group, '{http://www.dji.com/wpmz/1.0.6}actionGroupEndIndex').text = str(i)
-            etree.SubElement(action_group, '{http://www.dji.com/wpmz/1.0.6}actionGroupMode').text = 'sequence'
-            trigger = etree.SubElement(action_group, '{http://www.dji.com/wpmz/1.0.6}actionTrigger')
-            etree.SubElement(trigger, '{http://www.dji.com/wpmz/1.0.6}actionTriggerType').text = 'reachPoint'
+            action_group = new_action_group(placemark, i)
 
         actions = action_group.findall('wpml:action', ns)
         new_actions = []
@@ -116,86 +148,17 @@ def convert_kml(input_kml, output_kml):
 
         # 動画開始（最初のみ、各カメラ種別ごとに追加）
         if i == 0:
-            if ENABLE_ZOOM:
-                video_start = etree.Element('{http://www.dji.com/wpmz/1.0.6}action')
-                etree.SubElement(video_start, '{http://www.dji.com/wpmz/1.0.6}actionId').text = '998'
-                etree.SubElement(video_start, '{http://www.dji.com/wpmz/1.0.6}actionActuatorFunc').text = 'startRecordVideo'
-                param = etree.SubElement(video_start, '{http://www.dji.com/wpmz/1.0.6}actionActuatorFuncParam')
-                etree.SubElement(param, '{http://www.dji.com/wpmz/1.0.6}payloadPositionIndex').text = PAYLOAD_POSITION_INDEX
-                etree.SubElement(param, '{http://www.dji.com/wpmz/1.0.6}videoType').text = 'zoom'
-                etree.SubElement(param, '{http://www.dji.com/wpmz/1.0.6}zoomFactor').text = str(ZOOM_FACTOR)
-                new_actions.append(video_start)
-            if ENABLE_WIDE:
-                video_start = etree.Element('{http://www.dji.com/wpmz/1.0.6}action')
-                etree.SubElement(video_start, '{http://www.dji.com/wpmz/1.0.6}actionId').text = '9981'
-                etree.SubElement(video_start, '{http://www.dji.com/wpmz/1.0.6}actionActuatorFunc').text = 'startRecordVideo'
-                param = etree.SubElement(video_start, '{http://www.dji.com/wpmz/1.0.6}actionActuatorFuncParam')
-                etree.SubElement(param, '{http://www.dji.com/wpmz/1.0.6}payloadPositionIndex').text = PAYLOAD_POSITION_INDEX
-                etree.SubElement(param, '{http://www.dji.com/wpmz/1.0.6}videoType').text = 'wide'
-                new_actions.append(video_start)
-            if ENABLE_IR:
-                video_start = etree.Element('{http://www.dji.com/wpmz/1.0.6}action')
-                etree.SubElement(video_start, '{http://www.dji.com/wpmz/1.0.6}actionId').text = '9982'
-                etree.SubElement(video_start, '{http://www.dji.com/wpmz/1.0.6}actionActuatorFunc').text = 'startRecordVideo'
-                param = etree.SubElement(video_start, '{http://www.dji.com/wpmz/1.0.6}actionActuatorFuncParam')
-                etree.SubElement(param, '{http://www.dji.com/wpmz/1.0.6}payloadPositionIndex').text = PAYLOAD_POSITION_INDEX
-                etree.SubElement(param, '{http://www.dji.com/wpmz/1.0.6}videoType').text = 'ir'
-                new_actions.append(video_start)
+            new_actions.extend(video_actions('startRecordVideo', ('998', '9981', '9982')))
 
         # ジンバルを動かしてからホバリング
-        gimbal_action = etree.Element('{http://www.dji.com/wpmz/1.0.6}action')
-        etree.SubElement(gimbal_action, '{http://www.dji.com/wpmz/1.0.6}actionId').text = '1001'
-        etree.SubElement(gimbal_action, '{http://www.dji.com/wpmz/1.0.6}actionActuatorFunc').text = 'gimbalRotate'
-        param = etree.SubElement(gimbal_action, '{http://www.dji.com/wpmz/1.0.6}actionActuatorFuncParam')
-        etree.SubElement(param, '{http://www.dji.com/wpmz/1.0.6}gimbalRotateMode').text = 'absoluteAngle'
-        etree.SubElement(param, '{http://www.dji.com/wpmz/1.0.6}gimbalPitchRotateEnable').text = '1'
-        etree.SubElement(param, '{http://www.dji.com/wpmz/1.0.6}gimbalPitchRotateAngle').text = str(GIMBAL_PITCH)
-        etree.SubElement(param, '{http://www.dji.com/wpmz/1.0.6}gimbalRollRotateEnable').text = '0'
-        etree.SubElement(param, '{http://www.dji.com/wpmz/1.0.6}gimbalRollRotateAngle').text = '0'
-        etree.SubElement(param, '{http://www.dji.com/wpmz/1.0.6}gimbalYawRotateEnable').text = '0'
-        etree.SubElement(param, '{http://www.dji.com/wpmz/1.0.6}gimbalYawRotateAngle').text = '0'
-        etree.SubElement(param, '{http://www.dji.com/wpmz/1.0.6}gimbalRotateTimeEnable').text = '0'
-        etree.SubElement(param, '{http://www.dji.com/wpmz/1.0.6}gimbalRotateTime').text = '0'
-        etree.SubElement(param, '{http://www.dji.com/wpmz/1.0.6}payloadPositionIndex').text = PAYLOAD_POSITION_INDEX
-        new_actions.append(gimbal_action)
+        new_actions.append(GIMBAL_ACTION.make(action_id='1001'))
 
         # ホバリング追加（各ポイント共通）
-        hover_action = etree.Element('{http://www.dji.com/wpmz/1.0.6}action')
-        etree.SubElement(hover_action, '{http://www.dji.com/wpmz/1.0.6}actionId').text = '999'
-        etree.SubElement(hover_action, '{http://www.dji.com/wpmz/1.0.6}actionActuatorFunc').text = 'stayForSeconds'
-        param = etree.SubElement(hover_action, '{http://www.dji.com/wpmz/1.0.6}actionActuatorFuncParam')
-        etree.SubElement(param, '{http://www.dji.com/wpmz/1.0.6}stayTime').text = str(HOVER_SECONDS)
-        etree.SubElement(param, '{http://www.dji.com/wpmz/1.0.6}gimbalPitchRotateAngle').text = str(GIMBAL_PITCH)
-        etree.SubElement(param, '{http://www.dji.com/wpmz/1.0.6}aircraftHeading').text = str(YAW_ANGLE)
-        new_actions.append(hover_action)
+        new_actions.append(HOVER_ACTION.make(action_id='999'))
 
         # 動画停止（最後のみ、各カメラ種別ごとに追加）
         if i == len(placemarks) - 1:
-            if ENABLE_ZOOM:
-                video_stop = etree.Element('{http://www.dji.com/wpmz/1.0.6}action')
-                etree.SubElement(video_stop, '{http://www.dji.com/wpmz/1.0.6}actionId').text = '997'
-                etree.SubElement(video_stop, '{http://www.dji.com/wpmz/1.0.6}actionActuatorFunc').text = 'stopRecordVideo'
-                param = etree.SubElement(video_stop, '{http://www.dji.com/wpmz/1.0.6}actionActuatorFuncParam')
-                etree.SubElement(param, '{http://www.dji.com/wpmz/1.0.6}payloadPositionIndex').text = PAYLOAD_POSITION_INDEX
-                etree.SubElement(param, '{http://www.dji.com/wpmz/1.0.6}videoType').text = 'zoom'
-                etree.SubElement(param, '{http://www.dji.com/wpmz/1.0.6}zoomFactor').text = str(ZOOM_FACTOR)
-                new_actions.append(video_stop)
-            if ENABLE_WIDE:
-                video_stop = etree.Element('{http://www.dji.com/wpmz/1.0.6}action')
-                etree.SubElement(video_stop, '{http://www.dji.com/wpmz/1.0.6}actionId').text = '9971'
-                etree.SubElement(video_stop, '{http://www.dji.com/wpmz/1.0.6}actionActuatorFunc').text = 'stopRecordVideo'
-                param = etree.SubElement(video_stop, '{http://www.dji.com/wpmz/1.0.6}actionActuatorFuncParam')
-                etree.SubElement(param, '{http://www.dji.com/wpmz/1.0.6}payloadPositionIndex').text = PAYLOAD_POSITION_INDEX
-                etree.SubElement(param, '{http://www.dji.com/wpmz/1.0.6}videoType').text = 'wide'
-                new_actions.append(video_stop)
-            if ENABLE_IR:
-                video_stop = etree.Element('{http://www.dji.com/wpmz/1.0.6}action')
-                etree.SubElement(video_stop, '{http://www.dji.com/wpmz/1.0.6}actionId').text = '9972'
-                etree.SubElement(video_stop, '{http://www.dji.com/wpmz/1.0.6}actionActuatorFunc').text = 'stopRecordVideo'
-                param = etree.SubElement(video_stop, '{http://www.dji.com/wpmz/1.0.6}actionActuatorFuncParam')
-                etree.SubElement(param, '{http://www.dji.com/wpmz/1.0.6}payloadPositionIndex').text = PAYLOAD_POSITION_INDEX
-                etree.SubElement(param, '{http://www.dji.com/wpmz/1.0.6}videoType').text = 'ir'
-                new_actions.append(video_stop)
+            new_actions.extend(video_actions('stopRecordVideo', ('997', '9971', '9972')))
 
         # 古いアクションを削除して新しいものに置換
         for old_action in actions:
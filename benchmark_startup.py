@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+benchmark_startup.py
+
+GUI の起動時間（最初のウィンドウを描画するまで）の計測。GUI のバージョン間で起動が遅くなっていないかを確認する。
+• スクリプト: 各 GUI の main() を実行し、mainloop に入る時点（ウィンドウ描画後）で終了させて計測する
+  （GUI 側の変更は不要なので、古いバージョンとも比較できる）
+• exe: 環境変数 KMZ_STARTUP_PROBE=1 で起動し、終了までの時間を計測する
+  （GUI69 以降のビルドのみ。それ以前の exe はウィンドウを閉じるまで終わらない）
+• -X importtime: スクリプトの起動時に読み込むモジュールを、累積時間の大きい順に表示する
+• 各計測は別プロセスで行い、最小値・中央値を出す（初回はディスクキャッシュの影響があるので 1 回捨てる）
+
+使い方:
+    python benchmark_startup.py GUI68.py GUI69.py
+    python benchmark_startup.py --repeat 10 --top 30 GUI69.py
+    python benchmark_startup.py --exe dist/GUI69.exe
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+# --- 計測用ドライバ ----------------------------------------------------------
+# 別プロセスで GUI スクリプトを __main__ として実行する。mainloop を差し替え、
+# ウィンドウを描画した時点の経過時間（インタプリタ起動後）を標準出力に書いて終了する
+
+DRIVER = r"""
+import sys, time, runpy
+t0 = time.perf_counter()
+import tkinter
+
+def mainloop(self, n=0):
+    self.update()
+    print(f"STARTUP {time.perf_counter() - t0:.6f}", flush=True)
+    self.destroy()
+
+tkinter.Misc.mainloop = mainloop
+sys.argv = [sys.argv[1]]
+runpy.run_path(sys.argv[0], run_name="__main__")
+"""
+
+PROBE_ENV = "KMZ_STARTUP_PROBE"
+
+# --- 計測 ------------------------------------------------------------------
+
+def run_script(script, extra_args=()):
+    """
+    ドライバで script を 1 回起動する。
+    戻り値: (プロセス全体の時間, ウィンドウ描画までの時間, 標準エラー出力)
+    """
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, *extra_args, "-c", DRIVER, script],
+                          capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(script)))
+    wall = time.perf_counter() - started
+    window = None
+    for line in proc.stdout.splitlines():
+        if line.startswith("STARTUP "):
+            window = float(line.split()[1])
+    if window is None:
+        raise RuntimeError(f"{script} の起動に失敗しました:\n{proc.stderr}")
+    return wall, window, proc.stderr
+
+def run_exe(exe, timeout=120):
+    """exe を KMZ_STARTUP_PROBE 付きで 1 回起動し、終了までの時間を返す"""
+    env = dict(os.environ, **{PROBE_ENV: "1"})
+    started = time.perf_counter()
+    subprocess.run([exe], env=env, timeout=timeout, cwd=os.path.dirname(os.path.abspath(exe)))
+    return time.perf_counter() - started
+
+def parse_importtime(stderr):
+    """
+    -X importtime の出力を解析する。
+    戻り値: [(累積時間 µs, 自身の時間 µs, モジュール名), ...]（累積時間の大きい順）
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()))
+    rows.sort(reverse=True)
+    return rows
+
+def summarize(values):
+    return f"最小 {min(values) * 1e3:8.1f} ms  中央値 {statistics.median(values) * 1e3:8.1f} ms"
+
+# --- 表示 ------------------------------------------------------------------
+
+def bench_script(script, repeat, top):
+    run_script(script)  # 1 回目は捨てる
+    walls, windows = [], []
+    for _ in range(repeat):
+        wall, window, _ = run_script(script)
+        walls.append(wall)
+        windows.append(window)
+
+    print(f"\n=== {os.path.basename(script)} ===")
+    print(f"ウィンドウ描画まで : {summarize(windows)}")
+    print(f"プロセス全体       : {summarize(walls)}")
+
+    _, _, stderr = run_script(script, ["-X", "importtime"])
+    rows = parse_importtime(stderr)
+    total = sum(self_us for _, self_us, _ in rows)
+    print(f"\n--- -X importtime（モジュール {len(rows)} 個、合計 {total / 1e3:.1f} ms、累積時間の上位 {top} 件） ---")
+    print(f"{'累積 ms':>10}{'自身 ms':>10}  モジュール")
+    for cumulative_us, self_us, name in rows[:top]:
+        print(f"{cumulative_us / 1e3:>10.1f}{self_us / 1e3:>10.1f}  {name}")
+    return statistics.median(windows)
+
+def bench_exe(exe, repeat):
+    run_exe(exe)
+    walls = [run_exe(exe) for _ in range(repeat)]
+    print(f"\n=== {os.path.basename(exe)} ===")
+    print(f"起動～終了 : {summarize(walls)}")
+    return statistics.median(walls)
+
+def main():
+    parser = argparse.ArgumentParser(description="GUI の起動時間の計測")
+    parser.add_argument("scripts", nargs="*", metavar="SCRIPT", help="計測する GUI スクリプト（例: GUI68.py GUI69.py）")
+    parser.add_argument("--exe", action="append", default=[], metavar="EXE",
+                        help="計測する exe（KMZ_STARTUP_PROBE に対応したビルド。複数指定可）")
+    parser.add_argument("--repeat", type=int, default=5, help="計測回数（既定: 5）")
+    parser.add_argument("--top", type=int, default=20, help="-X importtime で表示するモジュール数（既定: 20）")
+    args = parser.parse_args()
+    if not args.scripts and not args.exe:
+        parser.error("GUI スクリプトか --exe を指定してください。")
+
+    medians = {}
+    for script in args.scripts:
+        medians[os.path.basename(script)] = bench_script(script, args.repeat, args.top)
+    for exe in args.exe:
+        medians[os.path.basename(exe)] = bench_exe(exe, args.repeat)
+
+    if len(medians) > 1:
+        print("\n--- 比較（中央値） ---")
+        base = next(iter(medians.values()))
+        for name, median in medians.items():
+            print(f"{name:<30}{median * 1e3:>10.1f} ms{median / base:>8.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+benchmark_xpath.py
+
+wpml_xpath のコンパイル済み XPath と、従来の find/findall/findtext の速度比較。
+• 合成した 5,000 ウェイポイントの template.kml で各検索を計測する
+• 出力は 1 回あたりの平均時間（ドキュメント全体の検索は ms、要素単位の検索は µs）
+
+使い方:
+    python benchmark_xpath.py [ウェイポイント数] [繰り返し回数]
+"""
+
+import sys
+import timeit
+from lxml import etree
+
+import wpml_xpath as xp
+from wpml_xpath import NS
+
+# --- 合成テンプレート --------------------------------------------------------
+
+def build_template(n):
+    """DJI template.kml と同じ構造の合成ツリーを作る"""
+    K = f"{{{NS['kml']}}}"
+    W = f"{{{NS['wpml']}}}"
+    root = etree.Element(K + "kml", nsmap={None: NS["kml"], "wpml": NS["wpml"]})
+    doc = etree.SubElement(root, K + "Document")
+
+    mc = etree.SubElement(doc, W + "missionConfig")
+    etree.SubElement(mc, W + "takeOffSecurityHeight").text = "20"
+    etree.SubElement(mc, W + "globalTransitionalSpeed").text = "10"
+
+    fld = etree.SubElement(doc, K + "Folder")
+    etree.SubElement(fld, W + "autoFlightSpeed").text = "10"
+    cs = etree.SubElement(fld, W + "waylineCoordinateSysParam")
+    etree.SubElement(cs, W + "heightMode").text = "EGM96"
+    pp = etree.SubElement(fld, W + "payloadParam")
+    etree.SubElement(pp, W + "payloadPositionIndex").text = "0"
+    etree.SubElement(pp, W + "imageFormat").text = "wide,zoom"
+    etree.SubElement(fld, W + "globalWaypointTurnMode").text = "coordinateTurn"
+    etree.SubElement(fld, W + "globalHeight").text = "50"
+    hp = etree.SubElement(fld, W + "globalWaypointHeadingParam")
+    etree.SubElement(hp, W + "waypointHeadingMode").text = "followWayline"
+    etree.SubElement(hp, W + "waypointHeadingAngle").text = "0"
+
+    for i in range(n):
+        pm = etree.SubElement(fld, K + "Placemark")
+        pt = etree.SubElement(pm, K + "Point")
+        etree.SubElement(pt, K + "coordinates").text = f"{139.0 + i * 1e-5:.8f},{35.0 + i * 1e-5:.8f}"
+        etree.SubElement(pm, W + "index").text = str(i)
+        etree.SubElement(pm, W + "height").text = "50"
+        etree.SubElement(pm, W + "ellipsoidHeight").text = "50"
+        etree.SubElement(pm, W + "waypointSpeed").text = "10"
+        ag = etree.SubElement(pm, W + "actionGroup")
+        for func in ("gimbalRotate", "rotateYaw", "orientedShoot"):
+            act = etree.SubElement(ag, W + "action")
+            etree.SubElement(act, W + "actionActuatorFunc").text = func
+            p = etree.SubElement(act, W + "actionActuatorFuncParam")
+            etree.SubElement(p, W + "gimbalPitchRotateAngle").text = "-45"
+            etree.SubElement(p, W + "gimbalYawRotateAngle").text = "90"
+            etree.SubElement(p, W + "aircraftHeading").text = "90"
+    return etree.ElementTree(root)
+
+# --- 計測 ------------------------------------------------------------------
+
+def bench(func, number):
+    return min(timeit.repeat(func, number=number, repeat=3)) / number
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    number = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    tree = build_template(n)
+    pm = xp.PLACEMARKS(tree)[n // 2]
+    action = xp.WP_ACTIONS(pm)[0]
+
+    # (名前, 従来の検索, コンパイル済み XPath, 1 回あたりの単位)
+    doc_cases = [
+        ("Placemark 一覧",
+         lambda: tree.findall(".//kml:Placemark", NS),
+         lambda: xp.PLACEMARKS(tree)),
+        ("payloadParam/imageFormat",
+         lambda: tree.findtext(".//wpml:payloadParam/wpml:imageFormat", namespaces=NS),
+         lambda: xp.PAYLOAD_IMAGE_FORMAT(tree)),
+        ("globalWaypointTurnMode",
+         lambda: tree.find(".//wpml:globalWaypointTurnMode", NS),
+         lambda: xp.first(xp.GLOBAL_TURN_MODE, tree)),
+        ("globalWaypointHeadingParam",
+         lambda: tree.findall(".//wpml:globalWaypointHeadingParam", NS),
+         lambda: xp.GLOBAL_HEADING_PARAMS(tree)),
+        ("heightMode（全体）",
+         lambda: tree.findall(".//wpml:heightMode", NS),
+         lambda: xp.HEIGHT_MODES(tree)),
+        ("takeOffSecurityHeight",
+         lambda: tree.find(".//wpml:takeOffSecurityHeight", NS),
+         lambda: xp.first(xp.TAKEOFF_SECURITY_HEIGHT, tree)),
+    ]
+    elem_cases = [
+        ("index",
+         lambda: pm.findtext("wpml:index", namespaces=NS),
+         lambda: xp.WP_INDEX_TEXT(pm)),
+        ("Point/coordinates",
+         lambda: pm.findtext("kml:Point/kml:coordinates", namespaces=NS),
+         lambda: xp.WP_COORDINATES(pm)),
+        ("action 一覧",
+         lambda: pm.findall(".//wpml:action", NS),
+         lambda: xp.WP_ACTIONS(pm)),
+        ("actionActuatorFunc",
+         lambda: action.findtext("wpml:actionActuatorFunc", namespaces=NS),
+         lambda: xp.ACTION_FUNC(action)),
+        ("gimbalPitchRotateAngle",
+         lambda: action.findtext(".//wpml:gimbalPitchRotateAngle", namespaces=NS),
+         lambda: xp.ACTION_PITCH_ANGLE(action)),
+    ]
+
+    print(f"ウェイポイント数: {n}")
+    print("\n--- ドキュメント全体（ms/回） ---")
+    print(f"{'検索':<30}{'find系':>10}{'XPath':>10}{'倍率':>8}")
+    for name, old, new in doc_cases:
+        t_old = bench(old, number) * 1e3
+        t_new = bench(new, number) * 1e3
+        print(f"{name:<30}{t_old:>10.3f}{t_new:>10.3f}{t_old / t_new:>7.1f}x")
+
+    print("\n--- 要素単位（µs/回） ---")
+    print(f"{'検索':<30}{'find系':>10}{'XPath':>10}{'倍率':>8}")
+    for name, old, new in elem_cases:
+        t_old = bench(old, number * 1000) * 1e6
+        t_new = bench(new, number * 1000) * 1e6
+        print(f"{name:<30}{t_old:>10.2f}{t_new:>10.2f}{t_old / t_new:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
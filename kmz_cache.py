@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+kmz_cache.py
+
+変換結果 KMZ のディスクキャッシュ。
+• キー = 入力 KMZ の SHA-256 + 変換パラメータを正規化した JSON
+• ヒット時は保存済み KMZ をハードリンク（不可ならコピー）で出力先に置く
+• 合計サイズが上限を超えたら、最終利用が古いものから削除する（LRU）
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import threading
+
+# --- 定数 ------------------------------------------------------------------
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".kmz_convert_cache")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# 変換ロジックの出力が変わる修正をしたら更新する（古いキャッシュを無効化するため）
+CACHE_VERSION = "GUI69-4"
+
+# --- キー計算 ---------------------------------------------------------------
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def canonical_params(params):
+    """パラメータ dict をキー順・区切り固定の JSON 文字列にする"""
+    return json.dumps(params, sort_keys=True, ensure_ascii=False,
+                      separators=(",", ":"), default=str)
+
+def make_cache_key(input_digest, params):
+    payload = f"{CACHE_VERSION}\n{input_digest}\n{canonical_params(params)}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+# --- キャッシュ本体 ---------------------------------------------------------
+
+class ConversionCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def __getstate__(self):
+        # ロックは複製できないので、別プロセスへ渡すときは設定だけ送る
+        return {"cache_dir": self.cache_dir, "max_bytes": self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key + ".kmz")
+
+    def fetch(self, key, out_path):
+        """キャッシュにあれば out_path に置いて True を返す"""
+        src = self._entry_path(key)
+        if not os.path.exists(src):
+            return False
+
+        tmp = out_path + ".cache"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        try:
+            os.link(src, tmp)
+        except OSError:
+            # 別ドライブなどでハードリンク不可の場合はコピー
+            try:
+                shutil.copyfile(src, tmp)
+            except FileNotFoundError:
+                return False  # 別ジョブの追い出しと競合
+        os.replace(tmp, out_path)
+
+        # 最終利用時刻として mtime を更新（LRU 用）
+        try:
+            os.utime(src)
+        except OSError:
+            pass
+        return True
+
+    def store(self, key, kmz_path):
+        """変換結果をキャッシュに登録し、容量上限を超えた分を追い出す"""
+        dst = self._entry_path(key)
+        tmp = f"{dst}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copyfile(kmz_path, tmp)
+        os.replace(tmp, dst)
+        self.evict()
+
+    def evict(self):
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith(".kmz"):
+                    continue
+                try:
+                    st = os.stat(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, name))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+    def clear(self):
+        with self._lock:
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(".kmz"):
+                    os.remove(os.path.join(self.cache_dir, name))
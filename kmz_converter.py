@@ -0,0 +1,2303 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+kmz_converter.py
+
+DJI WPML（KMZ）変換の本体。tkinter に依存しないので、GUI（GUI69.py）・CLI（kmzconv.py）・
+バッチスクリプトから同じように使える。
+• convert_kmz: KMZ 1 件を変換して ConversionResult を返す（エラーは例外）
+• ログは insert(index, text) / detail(text) / see(index) を持つオブジェクトに書き込む
+  （tkinter の Text 互換。index には END を渡す）。log=None ならログは捨てる
+
+使い方:
+    from kmz_converter import convert_kmz
+    result = convert_kmz("mission.kmz", do_photo=True, sensor_modes=["Wide", "Zoom"], speed=12)
+    print(result.outputs)
+"""
+
+import os
+import io
+import sys
+import copy
+import math
+import threading
+import shutil
+import struct
+import time
+import zipfile
+import glob
+import tempfile
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field, replace
+from functools import lru_cache
+import numpy as np
+from lxml import etree
+from kmz_cache import file_sha256, make_cache_key
+from kmz_options import (SENSOR_MODES, SENSOR_CODES, DEFAULT_VARIANT_SPEC, MAX_WORKERS,
+                         OUTPUT_KMZ_PATTERN, HEADING_MODE_NAMES, collect_kmz_paths, parse_variant_spec)
+import wpml_xpath as xp
+import wpml_actions as wa
+import wpml_model as wm
+import wpml_geometry as geo
+import wpml_estimate as wpe
+import wpml_simulate as wps
+from wpml_model import Action, ActionGroup, GimbalInfo, HeadingParam
+
+# --- 定数 ------------------------------------------------------------------
+
+# ログ（tkinter の Text 互換オブジェクト）への書き込み位置。END と同じ値
+END = "end"
+
+# 解析済みミッションを保持する件数（MissionCache の既定値）
+MISSION_CACHE_SIZE = 5
+
+# --- ジンバル・ズーム情報取得 ---------------------------------------------
+
+def gimbal_info_from_actions(actions, payload_zoom):
+    """
+    1 ウェイポイント分のアクション (wpml_model.Action) からジンバルピッチ／ヨー／機体ヘディング／焦点距離を取得。
+    - アクションを 1 回だけ走査し、actionActuatorFunc 毎に候補値を集める。
+    - 優先順位は orientedShoot → gimbalRotate → rotateYaw → zoom アクション、
+    - 最後に payloadParam の zoom 設定 (payload_zoom) をフォールバックで補う。
+    情報が無ければ None を返す。
+    """
+    # 各アクション種別で最初に見つかった値（文字列のまま保持し、採用時に float 化）
+    shoot = None               # 最初の orientedShoot のパラメータ
+    gr_pitch = gr_yaw = None   # gimbalRotate（有効フラグ=1 のもの）
+    ry_heading = None          # rotateYaw
+    zoom_seen = False          # 最初の zoom アクションのみ参照
+    zoom_focal = None
+
+    for action in actions:
+        func = action.func
+        params = action.params
+
+        if func == "orientedShoot":
+            if shoot is None:
+                shoot = params
+
+        elif func == "gimbalRotate":
+            if gr_pitch is not None and gr_yaw is not None:
+                continue
+            if gr_pitch is None and params.get("gimbalPitchRotateEnable") == "1":
+                gr_pitch = params.get("gimbalPitchRotateAngle") or None
+            if gr_yaw is None and params.get("gimbalYawRotateEnable") == "1":
+                gr_yaw = params.get("gimbalYawRotateAngle") or None
+
+        elif func == "rotateYaw":
+            if ry_heading is None:
+                ry_heading = params.get("aircraftHeading") or None
+
+        elif func == "zoom":
+            if not zoom_seen:
+                zoom_seen = True
+                zoom_focal = params.get("focalLength") or None
+
+    info = GimbalInfo()
+
+    # 1) orientedShoot から pitch/yaw/heading/focalLength
+    if shoot is not None:
+        p = shoot.get("gimbalPitchRotateAngle")
+        y = shoot.get("gimbalYawRotateAngle")
+        h = shoot.get("aircraftHeading")
+        f = shoot.get("focalLength")
+        if p: info.pitch   = float(p)
+        if y: info.yaw     = float(y)
+        if h: info.heading = float(h)
+        if f:
+            info.focal_length = float(f)
+            info.zoom_ratio   = info.focal_length / 24.0
+
+    # 2) gimbalRotate から pitch/yaw （フォールバック）
+    if info.pitch is None and gr_pitch:
+        info.pitch = float(gr_pitch)
+    if info.yaw is None and gr_yaw:
+        info.yaw = float(gr_yaw)
+
+    # 3) rotateYaw から heading （フォールバック）
+    if info.heading is None and ry_heading:
+        info.heading = float(ry_heading)
+
+    # 4) zoom アクションから focalLength （フォールバック）
+    if info.zoom_ratio is None and zoom_focal:
+        info.focal_length = float(zoom_focal)
+        info.zoom_ratio   = info.focal_length / 24.0
+
+    # 5) payloadParam に zoom 指定がある場合は、値が無くても「元設定維持」として情報ありにする
+    if not payload_zoom and info == GimbalInfo():
+        return None
+    return info
+
+def extract_original_gimbal_angles(mission):
+    """
+    各ウェイポイントの元のジンバルピッチ／ヨー／機体ヘディング／焦点距離を Waypoint.gimbal に設定する。
+    （1 ウェイポイント分の処理は gimbal_info_from_actions）
+    戻り値: 情報を持つウェイポイント数
+    """
+    # payloadParam はテンプレート全体で共通なのでループ外で 1 回だけ判定
+    payload_zoom = "zoom" in (mission.image_format or "").lower()
+
+    count = 0
+    for wp in mission.waypoints:
+        wp.gimbal = gimbal_info_from_actions(wp.actions(), payload_zoom)
+        if wp.gimbal is not None:
+            count += 1
+    return count
+
+def calculate_gimbal_heading_direction(gimbal_yaw, aircraft_heading):
+    """ジンバルヨー角と機体ヘディングから撮影方向を計算（-180 ~ 180 に正規化）"""
+    # ジンバルヨーは機体基準での角度、機体ヘディングは北基準
+    # 撮影方向 = 機体ヘディング + ジンバルヨー
+    return float(geo.normalize_angle(aircraft_heading + gimbal_yaw))
+
+def shooting_direction(gimbal):
+    """GimbalInfo（None 可）の撮影方向。ジンバルヨーか機体ヘディングが無ければ None"""
+    if gimbal is not None and gimbal.yaw is not None and gimbal.heading is not None:
+        return calculate_gimbal_heading_direction(gimbal.yaw, gimbal.heading)
+    return None
+
+def mission_geometry(mission):
+    """ミッションの wpml_geometry.MissionGeometry（初回に作って Mission.geometry に保持する）"""
+    if mission.geometry is None:
+        mission.geometry = geo.MissionGeometry.from_waypoints(mission.waypoints)
+    return mission.geometry
+
+def nan_to_none(values):
+    """NumPy 配列を、NaN を None にした Python の float のリストにする"""
+    return [None if math.isnan(v) else v for v in values.tolist()]
+
+def zoom_ratio_to_focal_length(ratio):
+    return ratio * 24.0
+
+# --- KMZ ユーティリティ -----------------------------------------------------
+def extract_kmz(path, work_dir=None):
+    """
+    KMZ を作業フォルダに展開する。
+    work_dir 未指定時はジョブ毎に一時フォルダを作成するため、並行処理でも衝突しない。
+    """
+    if work_dir is None:
+        work_dir = tempfile.mkdtemp(prefix="_kmz_work_")
+    else:
+        if os.path.exists(work_dir):
+            shutil.rmtree(work_dir)
+        os.makedirs(work_dir)
+    
+    with zipfile.ZipFile(path, "r") as zf:
+        zf.extractall(work_dir)
+    
+    return work_dir
+
+def output_base_name(input_kmz, do_photo, do_video, sensor_modes):
+    """出力名（拡張子なし）: <元ファイル名>_<Photo|Video|None>[_<センサー略称>]"""
+    base = os.path.splitext(os.path.basename(input_kmz))[0]
+    
+    if do_photo:
+        mode_suffix = "Photo"
+    elif do_video:
+        mode_suffix = "Video"
+    else:
+        mode_suffix = "None"
+    
+    sensor_suffix = ""
+    if sensor_modes:
+        chars = []
+        for s in sensor_modes:
+            if s == "Wide": chars.append("W")
+            elif s == "Zoom": chars.append("Z")
+            elif s == "IR": chars.append("IR")
+        sensor_suffix = "".join(chars)
+    
+    if sensor_suffix:
+        return f"{base}_{mode_suffix}_{sensor_suffix}"
+    return f"{base}_{mode_suffix}"
+
+def output_kmz_path(input_kmz, do_photo, do_video, sensor_modes):
+    """出力 KMZ のパス（入力 KMZ と同じフォルダ）"""
+    return os.path.join(os.path.dirname(input_kmz),
+                        output_base_name(input_kmz, do_photo, do_video, sensor_modes) + ".kmz")
+
+def prepare_output_dirs(input_kmz, do_photo, do_video, sensor_modes):
+    out_root = os.path.join(os.path.dirname(input_kmz),
+                            output_base_name(input_kmz, do_photo, do_video, sensor_modes))
+    
+    if os.path.exists(out_root):
+        shutil.rmtree(out_root)
+    os.makedirs(out_root)
+    
+    wpmz_dir = os.path.join(out_root, "wpmz")
+    os.makedirs(wpmz_dir)
+    
+    return out_root, wpmz_dir
+
+# --- zip エントリの無変換コピー ---
+# zipfile には圧縮済みのバイト列のままエントリを追加する公開 API が無いので、書き込み側の内部状態
+# （_lock / _writing / _seekable / start_dir / filelist / NameToInfo / _didModify）を直接更新する。
+# 動作を確認した Python の範囲内で、かつ初回の往復チェック（raw_copy_supported）に通った場合だけ使い、
+# それ以外は展開・再圧縮でコピーする。
+
+# 無変換コピーを確認した Python のバージョン（この範囲外は再圧縮でコピーする）
+RAW_COPY_PYTHON = ((3, 8), (3, 13))
+
+# ローカルファイルヘッダ（APPNOTE 4.3.7）の固定長部分とファイル名長・拡張フィールド長の位置
+LOCAL_HEADER_SIZE = 30
+LOCAL_HEADER_LENGTHS = struct.Struct("<HH")
+LOCAL_HEADER_LENGTHS_OFFSET = 26
+
+# zip64 拡張フィールドのヘッダ ID（書き込み時に zipfile が付け直す）
+ZIP64_EXTRA_ID = 0x0001
+
+def strip_zip64_extra(extra):
+    """拡張フィールドのバイト列から zip64 のレコードを除く（タイムスタンプなど他のレコードは残す）"""
+    kept = []
+    pos = 0
+    while pos + 4 <= len(extra):
+        header_id, size = struct.unpack_from("<HH", extra, pos)
+        end = pos + 4 + size
+        if header_id != ZIP64_EXTRA_ID:
+            kept.append(extra[pos:end])
+        pos = end
+    return b"".join(kept)
+
+def read_raw_member(src_zf, info):
+    """info の圧縮済みデータ（ローカルヘッダの後ろ compress_size バイト）を読む"""
+    fp = src_zf.fp
+    fp.seek(info.header_offset)
+    header = fp.read(LOCAL_HEADER_SIZE)
+    if len(header) != LOCAL_HEADER_SIZE or header[:4] != zipfile.stringFileHeader:
+        raise zipfile.BadZipFile(f"ローカルヘッダが不正です: {info.filename}")
+    name_length, extra_length = LOCAL_HEADER_LENGTHS.unpack_from(header, LOCAL_HEADER_LENGTHS_OFFSET)
+    fp.seek(name_length + extra_length, os.SEEK_CUR)
+    return fp.read(info.compress_size)
+
+def raw_member_info(info):
+    """info と同じ CRC・サイズ・圧縮方式・属性・拡張フィールドを持つ書き込み用の ZipInfo"""
+    zinfo = zipfile.ZipInfo(info.filename, info.date_time)
+    zinfo.compress_type = info.compress_type
+    zinfo.CRC = info.CRC
+    zinfo.compress_size = info.compress_size
+    zinfo.file_size = info.file_size
+    zinfo.external_attr = info.external_attr
+    zinfo.create_system = info.create_system
+    zinfo.extra = strip_zip64_extra(info.extra)
+    # サイズは既知なのでデータディスクリプタ無しのローカルヘッダで書く
+    zinfo.flag_bits = info.flag_bits & ~0x08
+    return zinfo
+
+def _append_raw_member(dst_zf, zinfo, data):
+    """zipfile の内部状態を更新して、圧縮済みの data をエントリとして追加する"""
+    with dst_zf._lock:
+        if dst_zf._writing:
+            raise ValueError("書き込み中のエントリがある ZipFile にはコピーできません")
+        if dst_zf._seekable:
+            dst_zf.fp.seek(dst_zf.start_dir)
+        zinfo.header_offset = dst_zf.fp.tell()
+        dst_zf._writecheck(zinfo)
+        dst_zf._didModify = True
+        dst_zf.fp.write(zinfo.FileHeader(zinfo.file_size > zipfile.ZIP64_LIMIT
+                                         or zinfo.compress_size > zipfile.ZIP64_LIMIT))
+        dst_zf.fp.write(data)
+        dst_zf.start_dir = dst_zf.fp.tell()
+        dst_zf.filelist.append(zinfo)
+        dst_zf.NameToInfo[zinfo.filename] = zinfo
+
+@lru_cache(maxsize=None)
+def raw_copy_supported():
+    """
+    この Python で無変換コピーを使えるか。バージョンが RAW_COPY_PYTHON の範囲内で、
+    メモリ上の zip で往復（CRC・サイズ・拡張フィールドが変わらず testzip が通る）を確認できた場合に True。
+    """
+    low, high = RAW_COPY_PYTHON
+    if not low <= sys.version_info[:2] <= high:
+        return False
+    try:
+        src = io.BytesIO()
+        with zipfile.ZipFile(src, "w") as zf:
+            stamp = zipfile.ZipInfo("check/deflated.txt", (2020, 1, 2, 3, 4, 6))
+            stamp.extra = struct.pack("<HHBl", 0x5455, 5, 1, 1577934246)   # 拡張タイムスタンプ
+            zf.writestr(stamp, b"raw copy check " * 64, zipfile.ZIP_DEFLATED)
+            zf.writestr("check/stored.txt", b"stored", zipfile.ZIP_STORED)
+        dst = io.BytesIO()
+        with zipfile.ZipFile(src) as src_zf, zipfile.ZipFile(dst, "w") as dst_zf:
+            dst_zf.writestr("first.txt", b"written before the copy")
+            for info in src_zf.infolist():
+                _append_raw_member(dst_zf, raw_member_info(info), read_raw_member(src_zf, info))
+            dst_zf.writestr("last.txt", b"written after the copy")
+        with zipfile.ZipFile(src) as src_zf, zipfile.ZipFile(dst) as dst_zf:
+            if dst_zf.testzip() is not None:
+                return False
+            for info in src_zf.infolist():
+                copied = dst_zf.getinfo(info.filename)
+                if ((copied.CRC, copied.file_size, copied.compress_size, copied.extra)
+                        != (info.CRC, info.file_size, info.compress_size, info.extra)
+                        or dst_zf.read(info.filename) != src_zf.read(info)):
+                    return False
+        return True
+    except Exception:
+        return False
+
+def copy_zip_member_raw(src_zf, dst_zf, info):
+    """
+    エントリを展開・再圧縮せず、圧縮済みバイト列のまま src_zf から dst_zf へコピーする。
+    CRC・圧縮サイズ・元サイズ・圧縮方式・拡張フィールドは元エントリの値をそのまま引き継ぐ。
+    無変換コピーを使えない Python（raw_copy_supported）では展開・再圧縮してコピーする。
+    """
+    zinfo = raw_member_info(info)
+    if raw_copy_supported():
+        _append_raw_member(dst_zf, zinfo, read_raw_member(src_zf, info))
+    else:
+        dst_zf.writestr(zinfo, src_zf.read(info))
+
+def copy_passthrough_members(src_kmz, dst_zf, names):
+    """元 KMZ の未変更エントリ names を無変換コピーする（書き込み済みの名前は飛ばす）"""
+    if not names:
+        return 0
+    copied = 0
+    with zipfile.ZipFile(src_kmz, "r") as src_zf:
+        for name in names:
+            if name in dst_zf.NameToInfo:
+                continue
+            copy_zip_member_raw(src_zf, dst_zf, src_zf.getinfo(name))
+            copied += 1
+    return copied
+
+def repackage_to_kmz(out_root, input_kmz, do_photo, do_video, sensor_modes, passthrough=()):
+    """
+    out_root 以下の変換済みファイルを圧縮して KMZ にまとめる。
+    passthrough に指定した元 KMZ のエントリは再圧縮せずそのままコピーする。
+    """
+    out_kmz = output_kmz_path(input_kmz, do_photo, do_video, sensor_modes)
+    
+    tmp = out_kmz + ".zip"
+    
+    with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as zf:
+        for root_dir, _, files in os.walk(out_root):
+            for f in files:
+                if f.lower().endswith(".wpml"):
+                    continue
+                full = os.path.join(root_dir, f)
+                rel = os.path.relpath(full, out_root)
+                zf.write(full, rel)
+        copy_passthrough_members(input_kmz, zf, passthrough)
+    
+    if os.path.exists(out_kmz):
+        os.remove(out_kmz)
+    os.rename(tmp, out_kmz)
+    
+    return out_kmz
+
+# --- WPML 逐次書き出し -----------------------------------------------------
+# ツリー全体を直列化したバイト列を作らず、Placemark 単位で出力先（zip エントリなど）へ書き出す
+
+class WpmlWriter:
+    """
+    etree.xmlfile へ要素を逐次書き出す（write_template と TemplateStreamer で共用）。
+    • start / end で開始・終了タグだけを書き、その間の子要素は 1 つずつ書く
+    • Placemark は write で部分木ごと、それ以外の小さな要素は write_nested で要素ごとに書く
+      （xmlfile は部分木ごとに名前空間宣言を付け直すため、宣言の繰り返しを Placemark だけにする）
+    • pretty_print=True なら etree.tostring(pretty_print=True) と同じ 2 スペースのインデントを付ける
+    """
+
+    def __init__(self, xf, pretty_print=True):
+        self.xf = xf
+        self.pretty_print = pretty_print
+        self.open_elements = []     # 書き出し中の xf.element コンテキスト
+
+    def _newline(self, level):
+        if self.pretty_print and level:
+            self.xf.write("\n" + "  " * level)
+
+    def write(self, el, level):
+        """el を部分木ごと書き出す（インデント用に el の text / tail を書き換える）"""
+        el.tail = None
+        if self.pretty_print:
+            etree.indent(el, level=level)
+        self._newline(level)
+        self.xf.write(el)
+
+    def write_nested(self, el, level):
+        """el を要素ごとに開始・終了タグに分けて書き出す（要素数の少ない部分木用）"""
+        if not isinstance(el.tag, str):
+            self.write(el, level)   # コメント・処理命令
+            return
+        self.start(el, level)
+        if el.text and not len(el):
+            self.xf.write(el.text)
+        for child in el:
+            self.write_nested(child, level + 1)
+        self.end(level, inline=not len(el))
+
+    def start(self, el, level):
+        """el の開始タグを書く（ルートの名前空間宣言と、親から増えた宣言だけを付ける）"""
+        parent = el.getparent()
+        nsmap = el.nsmap
+        if parent is not None:
+            inherited = parent.nsmap
+            nsmap = {k: v for k, v in nsmap.items() if inherited.get(k) != v}
+        self._newline(level)
+        cm = self.xf.element(el.tag, dict(el.attrib), nsmap=nsmap or None)
+        cm.__enter__()
+        self.open_elements.append(cm)
+
+    def end(self, level, inline=False):
+        """最後に start した要素の終了タグを書く（inline=True なら改行せずに閉じる）"""
+        if not inline:
+            if self.pretty_print:
+                self.xf.write("\n" + "  " * level)
+        self.open_elements.pop().__exit__(None, None, None)
+
+    def write_split(self, el, level, open_path, release=False):
+        """
+        open_path に含まれる要素は開始・終了タグに分けて子要素ごとに書き出す。
+        release=True なら書き出した子要素をツリーから外し、書き出しながらメモリを解放する。
+        """
+        if el not in open_path:
+            if el.tag == wm.KML + "Placemark":
+                self.write(el, level)
+            else:
+                self.write_nested(el, level)
+            return
+        self.start(el, level)
+        for child in el:
+            self.write_split(child, level + 1, open_path, release)
+            if release:
+                # 書き出し済みの直前の要素を外す（反復中の要素は次の要素に進んでから外す）
+                prev = child.getprevious()
+                if prev is not None:
+                    el.remove(prev)
+        self.end(level)
+
+def write_template(tree, out, pretty_print=True, release=False):
+    """
+    template.kml のツリーを out（バイナリのファイルオブジェクト）に逐次書き出す。
+    kml / Document / Folder は開始・終了タグに分け、その子要素（Placemark など）を 1 つずつ書く。
+    release=True なら書き出した要素をツリーから外す（書き出し後にツリーを使わない場合用）。
+    """
+    folder = xp.first(xp.FOLDERS, tree)
+    open_path = []
+    if folder is not None:
+        document = folder.getparent()
+        open_path = [document.getparent(), document, folder]
+
+    with etree.xmlfile(out, encoding="utf-8") as xf:
+        xf.write_declaration()
+        WpmlWriter(xf, pretty_print).write_split(tree.getroot(), 0, open_path, release)
+
+# --- KMZ メモリ上処理 -------------------------------------------------------
+# 作業フォルダへ展開せず、ZipFile から直接読み書きする
+
+def is_res_member(name):
+    """res フォルダ配下のエントリか判定（ディスク処理で削除していたもの）"""
+    return "res" in name.split("/")[:-1]
+
+def template_members(zf):
+    """ZipFile 内の template.kml の ZipInfo のリスト（res 配下は除外）"""
+    return [info for info in zf.infolist()
+            if not info.is_dir() and not is_res_member(info.filename)
+            and os.path.basename(info.filename) == "template.kml"]
+
+def read_templates_from_kmz(zf):
+    """ZipFile 内の template.kml を (エントリ名, ツリー) のリストで返す（res 配下は除外）"""
+    templates = []
+    for info in template_members(zf):
+        parser = etree.XMLParser(remove_blank_text=True)
+        root = etree.fromstring(zf.read(info), parser)
+        templates.append((info.filename, root.getroottree()))
+    return templates
+
+def write_kmz_from_memory(out_kmz, members, src_kmz=None, passthrough=(), pretty_print=True):
+    """
+    (エントリ名, ツリー) のリストから KMZ を直接書き出す。
+    ツリーは write_template で zip エントリへ逐次書き出す（直列化と圧縮を同時に進める）。
+    書き出した要素はツリーから外すので、書き出し後のツリーは使わないこと。
+    passthrough に指定した src_kmz のエントリは再圧縮せずそのままコピーする。
+    """
+    tmp = out_kmz + ".zip"
+    
+    with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as zf:
+        for arcname, tree in members:
+            with zf.open(arcname, "w", force_zip64=True) as dst:
+                write_template(tree, dst, pretty_print, release=True)
+        if src_kmz is not None:
+            copy_passthrough_members(src_kmz, zf, passthrough)
+    
+    os.replace(tmp, out_kmz)
+    
+    return out_kmz
+
+# --- KML 変換 ---------------------------------------------------------------
+# 変換ルールは wpml_model のミッションモデルを書き換えるだけで、DOM への書き戻しは最後に 1 回行う。
+# グローバル設定の変換と Placemark 単位の変換に分けてあり、
+# convert_kml はミッション全体に、TemplateStreamer は 1 Placemark ずつ適用する。
+
+ASL_HEIGHT_MODES = ("ASL", "EGM96", "absoluteHeight", "WGS84")
+
+HEADING_APPLY_MESSAGES = {
+    "follow_wayline": "飛行経路に従う設定を適用",
+    "original": "元のヘディング設定を維持",
+    "follow_gimbal": "撮影方向に合わせる設定を適用",
+    "manually": "手動モード設定を適用",
+}
+
+def int_text(value):
+    """WPML の数値テキストを整数表記にする（"45.5" → "45"）。None はそのまま"""
+    return None if value is None else str(int(float(value)))
+
+def create_gimbal_yaw_action(yaw_angle):
+    return Action.of(wa.GIMBAL_ROTATE,
+                     gimbalYawRotateEnable="1",
+                     gimbalYawRotateAngle=str(yaw_angle))
+
+@lru_cache(maxsize=None)
+def fixed_heading(mode, angle):
+    """mode / angle（POI なし・followBadArc）の waypointHeadingParam"""
+    return HeadingParam(mode, angle, "0.000000,0.000000,0.000000", "followBadArc", "0")
+
+def update_existing(heading, **values):
+    """heading のうち元から設定のある項目だけを置き換える（グローバル設定には項目を追加しない）"""
+    return replace(heading, **{k: v for k, v in values.items() if getattr(heading, k) is not None})
+
+def apply_global_heading_settings(mission, heading_mode):
+    """globalWaypointHeadingParam にヘディング設定を適用"""
+    gh = mission.heading
+    if gh is None:
+        return
+
+    if heading_mode == "follow_wayline":
+        # 飛行経路に従う
+        mission.heading = update_existing(gh, mode="followWayline")
+
+    elif heading_mode == "original":
+        # グローバル設定復元（角度・POI index は整数表記）
+        mission.heading = replace(gh, angle=int_text(gh.angle), poi_index=int_text(gh.poi_index))
+
+    elif heading_mode == "follow_gimbal":
+        # 各ウェイポイントで撮影方向を指定するため、グローバルは固定モード
+        mission.heading = update_existing(gh, mode="fixed")
+
+    elif heading_mode == "manually":
+        # 必要に応じて angle もデフォルト0に
+        mission.heading = update_existing(gh, mode="manually", angle="0")
+
+def apply_waypoint_heading_settings(wp, heading_mode, next_direction, log):
+    """
+    1 ウェイポイント分のヘディング設定を適用。
+    next_direction は次のウェイポイント（index 順）の撮影方向（無ければ None）。
+    """
+    if heading_mode in ("follow_wayline", "manually"):
+        # グローバル設定を使用（local 設定は削除）
+        wp.heading = None
+
+    elif heading_mode == "original":
+        # ローカル設定復元（角度・POI index は整数表記、経路モードの既定は followBadArc）
+        h = wp.heading
+        if h is not None:
+            wp.heading = replace(h,
+                                 angle=int_text(h.angle),
+                                 path_mode=h.path_mode if h.path_mode is not None else "followBadArc",
+                                 poi_index=int_text(h.poi_index))
+
+    elif heading_mode == "follow_gimbal":
+        if next_direction is not None:
+            # ローカル設定で次のウェイポイントの撮影方向を設定
+            wp.heading = fixed_heading("fixed", str(int(next_direction)))
+            log.detail(f"[WP {wp.index}] 次の撮影方向: {next_direction:.1f}°\n")
+        else:
+            # 撮影方向が取得できない場合はfollowWaylineを使用
+            wp.heading = fixed_heading("followWayline", "0")
+            log.detail(f"[WP {wp.index}] 撮影方向取得不可→経路に従う\n")
+
+def apply_heading_settings(mission, heading_mode, log):
+    """ヘディング設定を適用"""
+    log.insert(END, "\n=== 機体ヘディング制御設定 ===\n")
+    log.insert(END, f"制御モード: {heading_mode}\n")
+
+    if heading_mode in HEADING_APPLY_MESSAGES:
+        log.insert(END, HEADING_APPLY_MESSAGES[heading_mode] + "\n")
+
+    apply_global_heading_settings(mission, heading_mode)
+
+    # 次のウェイポイントの撮影方向はミッション全体でまとめて計算する
+    if heading_mode == "follow_gimbal":
+        next_directions = nan_to_none(mission_geometry(mission).next_shooting_directions())
+    else:
+        next_directions = [None] * len(mission)
+    for wp, next_direction in zip(mission.waypoints, next_directions):
+        apply_waypoint_heading_settings(wp, heading_mode, next_direction, log)
+
+    if heading_mode == "manually":
+        log.insert(END, "手動モード：グローバルmanuallyを適用し、各WPではlocal設定をクリア\n")
+
+    log.insert(END, "=== 機体ヘディング制御設定完了 ===\n\n")
+    log.see(END)
+
+def set_global_turn_mode(mission, wp_stop_mode, log):
+    if mission.turn_mode is not None:
+        if wp_stop_mode == "stop":
+            mission.turn_mode = "toPointAndStopWithDiscontinuityCurvature"
+        else:
+            mission.turn_mode = "coordinateTurn"
+        log.insert(END, f"globalWaypointTurnMode → {mission.turn_mode}\n")
+
+def log_placemark_heights(wp, global_height_mode, log):
+    """
+    Placemark の高度を（補正せずに）ログに出す。
+    戻り値: (処理点数, ASL スキップ点数)
+    """
+    idx = "不明" if wp.index is None else wp.index
+    height_mode = wp.height_mode if wp.height_mode is not None else global_height_mode
+
+    # ASL判定
+    is_asl = height_mode in ASL_HEIGHT_MODES
+
+    processed_count = 0
+    skipped_count = 0
+    for text in (wp.height, wp.ellipsoid_height):
+        if text:
+            try:
+                original_height = float(text)
+                log.detail(f"[WP {idx}] 標高モード: {height_mode}, 高度維持: {original_height}m\n")
+                if is_asl:
+                    skipped_count += 1
+                else:
+                    processed_count += 1
+            except ValueError:
+                log.detail(f"[WP {idx}] 高度値解析エラー: {text}\n")
+    return processed_count, skipped_count
+
+def normalise_height_mode(mode, log, label="高度モード変更"):
+    """ASL 系以外の heightMode を EGM96 にした値を返す（None は未設定のまま）"""
+    if mode is not None and mode not in ASL_HEIGHT_MODES:
+        log.insert(END, f"{label}: {mode} → EGM96\n")
+        return "EGM96"
+    return mode
+
+def set_global_speed(mission, speed):
+    mission.transitional_speed = str(speed)
+    mission.auto_flight_speed = str(speed)
+
+def set_waypoint_speed(wp, speed):
+    wp.speed = str(speed)
+    wp.use_global_speed = "1"
+
+def remove_action_groups(wp):
+    wp.action_groups = []
+
+def set_payload_sensors(mission, sensor_modes):
+    """payloadParam の imageFormat を選択センサーに置き換える（未選択なら削除）"""
+    if sensor_modes:
+        mission.image_format = ",".join(m.lower() for m in sensor_modes)
+    else:
+        mission.image_format = None
+
+def fix_global_heading(mission, yaw_angle):
+    if mission.heading is not None:
+        mission.heading = update_existing(mission.heading, mode="fixed", angle=str(int(yaw_angle)))
+
+def add_waypoint_actions(wp, first, last,
+                         do_photo, do_video,
+                         do_gimbal, gimbal_pitch_angle, gimbal_pitch_mode,
+                         yaw_fix, yaw_angle, yaw_mode,
+                         sensor_modes, hover_time,
+                         zoom_ratio, zoom_mode):
+    """
+    1 ウェイポイント分の actionGroup を作ってウェイポイントに設定する。
+    first / last は最初・最後のウェイポイントか（動画の開始・停止を入れる）。
+    元の撮影姿勢は wp.gimbal（extract_original_gimbal_angles で設定）を使う。
+    """
+    idx = wp.index
+    original = wp.gimbal
+    actions = []
+
+    # 動画開始 (最初のみ)
+    if do_video and first:
+        actions.append(Action.of(wa.START_RECORD))
+
+    # ヨー固定
+    if yaw_fix:
+        yt = None
+        if yaw_mode == "original" and original is not None:
+            yt = original.heading
+        elif yaw_angle is not None:
+            yt = yaw_angle
+
+        if yt is not None:
+            actions.append(Action.of(wa.ROTATE_YAW, aircraftHeading=str(int(yt))))
+
+        # ジンバルヨー自動維持
+        if yaw_mode == "original" and original is not None:
+            gy = original.yaw
+            if gy is not None:
+                actions.append(create_gimbal_yaw_action(gy))
+
+    # ジンバルピッチ
+    if do_gimbal:
+        pt = None
+        if gimbal_pitch_mode == "original" and original is not None:
+            pt = original.pitch
+        elif gimbal_pitch_angle is not None:
+            pt = gimbal_pitch_angle
+
+        if pt is not None:
+            actions.append(Action.of(wa.GIMBAL_ROTATE,
+                                     gimbalPitchRotateEnable="1",
+                                     gimbalPitchRotateAngle=str(int(pt))))
+
+    # Zoom センサー選択時
+    if "Zoom" in sensor_modes:
+        if zoom_mode == "fixed" and zoom_ratio is not None:
+            # 指定倍率設定
+            ft = zoom_ratio_to_focal_length(zoom_ratio)
+            actions.append(Action.of(wa.ZOOM, focalLength=str(ft)))
+        elif zoom_mode == "original" and original is not None:
+            # 元データの focal_length を維持
+            ft = original.focal_length
+            if ft is not None:
+                actions.append(Action.of(wa.ZOOM, focalLength=str(ft)))
+
+    # 写真撮影
+    if do_photo and not do_video:
+        # 先にホバリング
+        if hover_time > 0:
+            actions.append(Action.of(wa.HOVER, hoverTime=str(int(hover_time))))
+
+        # その後に写真撮影
+        actions.append(Action.of(wa.TAKE_PHOTO, fileSuffix=f"ウェイポイント{idx}"))
+
+    # 動画モードホバリング（制御後）
+    if do_video and hover_time > 0:
+        actions.append(Action.of(wa.HOVER, hoverTime=str(int(hover_time))))
+
+    # 動画停止 (最後のみ)
+    if do_video and last:
+        actions.append(Action.of(wa.STOP_RECORD))
+
+    wp.action_groups = [ActionGroup.at(idx, actions)]
+
+# --- rotateYaw の回転方向 ---
+# rotateYaw の aircraftPathMode には最短の向きの指定が無く、プロトタイプの既定（counterClockwise）のままだと
+# 北をまたぐ回転などで 360° 近く回ることがある。到着時の機体ヘディングから回転量の小さい向きを選ぶ。
+# （waypointHeadingPathMode の followBadArc は最短の向きで回るので変えない）
+
+def shortest_yaw_path(current, target):
+    """current から target への回転量が小さい方の aircraftPathMode（ちょうど 180° なら時計回り）"""
+    return "clockwise" if geo.angle_difference(target, current) >= 0 else "counterClockwise"
+
+def _heading_value(text):
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return None
+
+def departure_heading(wp, next_wp, mission, current):
+    """
+    wp から next_wp（無ければ None）へ向かうときの機体ヘディング（不明なら None）。
+    wp のヘディング設定（無ければグローバル）で決まる向き（fixed / smoothTransition = 設定角度、
+    followWayline = 進行方位。垂直な区間では current のまま）。
+    """
+    heading = wp.heading if wp.heading is not None else mission.heading
+    mode = heading.mode if heading is not None else None
+    if mode in ("fixed", "smoothTransition"):
+        return _heading_value(heading.angle)
+    if mode == "followWayline":
+        if next_wp is None or None in (wp.lon, wp.lat, next_wp.lon, next_wp.lat):
+            return None
+        if geo.haversine_distances(wp.lon, wp.lat, next_wp.lon, next_wp.lat) <= wps.MIN_HEADING_DISTANCE_M:
+            return current
+        return float(geo.initial_bearings(wp.lon, wp.lat, next_wp.lon, next_wp.lat))
+    return None
+
+class YawPathPlanner:
+    """
+    変換後のウェイポイントを index 順に 1 点ずつ update に渡し、rotateYaw の回転方向を最短にする
+    （convert_kml とストリーミング変換で共通）。
+    到着時の機体ヘディングは departure_heading で直前の点から求め、不明な場合は向きを変えない。
+    """
+
+    def __init__(self, mission, aircraft=None):
+        self.mission = mission              # グローバルのヘディング設定を読む
+        self.yaw_rate = (aircraft or wpe.AircraftLimits()).yaw_rate
+        self.heading = None                 # 現在の機体ヘディング（不明なら None）
+        self.count = 0                      # 向きを変えた rotateYaw の数
+        self.travel = 0.0                   # 決めた向きでの回転量（度）
+        self.default_travel = 0.0           # 元の向き（既定は counterClockwise）での回転量（度）
+
+    def update(self, wp, next_wp):
+        """wp の rotateYaw の向きを決め、next_wp（無ければ None）へ向かうときのヘディングに進める"""
+        for action in wp.actions():
+            if action.func != "rotateYaw":
+                continue
+            target = _heading_value(wpe.action_param(action, "aircraftHeading"))
+            if target is None:
+                continue
+            if self.heading is not None:
+                mode = shortest_yaw_path(self.heading, target)
+                travel = wpe.yaw_travel(self.heading, target, wpe.action_param(action, "aircraftPathMode"))
+                shortest = wpe.yaw_travel(self.heading, target, mode)
+                self.default_travel += travel
+                if shortest < travel:
+                    action.params["aircraftPathMode"] = mode
+                    self.count += 1
+                self.travel += min(shortest, travel)
+            self.heading = target
+        self.heading = departure_heading(wp, next_wp, self.mission, self.heading)
+
+    def report(self, log):
+        if self.count == 0:
+            return
+        saved = self.default_travel - self.travel
+        log.insert(END, f"rotateYaw 回転方向: {self.count} 個を最短の向きに変更"
+                        f"（回転量 {self.default_travel:.0f}° → {self.travel:.0f}°、"
+                        f"約 {saved / self.yaw_rate:.0f} 秒短縮）\n")
+
+# --- ホバリング時間の自動調整 ---
+# 一律のホバリング時間では、機体・ジンバル・ズームを動かさない点でも最悪の場合の静定時間を待つことになる。
+# 前の点からの機体ヘディング・ジンバルピッチ／ヨー・焦点距離の変化量を AircraftLimits の settle_*_rate で
+# 割った時間（最も長いもの。設定したホバリング時間が上限）を各点のホバリング時間にする。
+
+class HoverPlanner:
+    """
+    変換後のウェイポイントを index 順に 1 点ずつ update に渡し、hover の hoverTime を
+    その点で必要な静定時間（秒。切り上げ、hover_time が上限）にする（convert_kml とストリーミング変換で共通）。
+    • 変化量は直前の点の設定値との差。直前の値が不明な動き（最初の点など）は hover_time のまま
+    • 何も動かさない点の hover は削除する
+    """
+
+    def __init__(self, mission, hover_time, aircraft=None):
+        self.mission = mission
+        self.limits = aircraft or wpe.AircraftLimits()
+        self.hover_time = int(hover_time)
+        self.heading = None         # 機体ヘディング
+        self.pitch = None           # ジンバルピッチ
+        self.gimbal_yaw = None
+        self.focal_length = None
+        self.count = 0              # hover のあった点の数
+        self.removed = 0            # hover を削除した点の数
+        self.total = 0              # 調整後のホバリング時間の合計（秒）
+
+    def update(self, wp, next_wp):
+        """wp の hover を調整し、next_wp（無ければ None）へ向かうときの状態に進める"""
+        settle = self._settle(wp.actions())
+        hover = self.hover_time if settle is None else min(self.hover_time, math.ceil(settle - 1e-9))
+        self.heading = departure_heading(wp, next_wp, self.mission, self.heading)
+
+        groups = []
+        changed = False
+        for group in wp.action_groups:
+            if not any(action.func == "hover" for action in group.actions):
+                groups.append(group)
+                continue
+            self.count += 1
+            self.total += hover
+            changed = True
+            if hover > 0:
+                actions = [Action.of(wa.HOVER, hoverTime=str(hover)) if action.func == "hover" else action
+                           for action in group.actions]
+            else:
+                self.removed += 1
+                actions = [action for action in group.actions if action.func != "hover"]
+            if actions:
+                groups.append(replace(group, actions=actions))
+        if changed:
+            wp.action_groups = groups
+
+    def _settle(self, actions):
+        """actions による動きの静定に必要な時間（秒。直前の値が不明な動きがあれば None）。状態を進める"""
+        limits = self.limits
+        times = [0.0]
+        unknown = False
+        for action in actions:
+            param = lambda name: wpe.action_param(action, name)
+            func = action.func
+            if func == "rotateYaw":
+                target = _heading_value(param("aircraftHeading"))
+                if target is None or self.heading is None:
+                    unknown = True
+                else:
+                    times.append(abs(geo.angle_difference(target, self.heading)) / limits.settle_yaw_rate)
+                self.heading = target
+            elif func == "zoom":
+                focal = _heading_value(param("focalLength"))
+                if not focal or not self.focal_length:
+                    unknown = True
+                else:
+                    times.append(abs(math.log2(focal / self.focal_length)) / limits.settle_zoom_rate)
+                self.focal_length = focal
+            elif func == "gimbalRotate":
+                if param("gimbalRotateMode") != "absoluteAngle" or param("gimbalRotateTimeEnable") == "1":
+                    unknown = True
+                    self.pitch = self.gimbal_yaw = None
+                    continue
+                for axis, attr in (("Pitch", "pitch"), ("Yaw", "gimbal_yaw")):
+                    if param(f"gimbal{axis}RotateEnable") != "1":
+                        continue
+                    angle = _heading_value(param(f"gimbal{axis}RotateAngle"))
+                    previous = getattr(self, attr)
+                    if angle is None or previous is None:
+                        unknown = True
+                    else:
+                        times.append(abs(geo.angle_difference(angle, previous)) / limits.settle_gimbal_rate)
+                    setattr(self, attr, angle)
+        return None if unknown else max(times)
+
+    def report(self, log):
+        if self.count == 0:
+            return
+        saved = self.count * self.hover_time - self.total
+        log.insert(END, f"ホバリング時間の自動調整: {self.count} 点で平均 {self.total / self.count:.1f} 秒"
+                        f"（設定 {self.hover_time} 秒、{self.removed} 点は省略）、約 {saved:.0f} 秒短縮\n")
+
+# --- 重複アクションの削除 ---
+# 前のウェイポイントで設定した値のままのジンバル・ズーム・機体ヨーのアクションは何もしないので削除する
+
+# 同じ値とみなす角度・焦点距離の差
+SAME_ANGLE_DEG = 0.5
+SAME_FOCAL_LENGTH = 0.5
+
+class ActionPruner:
+    """
+    変換後のウェイポイントを index 順に 1 点ずつ update に渡し、直前の状態から変わらない
+    gimbalRotate（絶対角度）・zoom・rotateYaw を削除する（convert_kml とストリーミング変換で共通）。
+    • 機体ヘディングは departure_heading で追う（不明なら rotateYaw は残す）
+    • ジンバルヨーは機体ヘディングが設定時から変わっていない場合のみ同じとみなす
+    • 回転時間を指定した gimbalRotate・相対角度の gimbalRotate は残す（以後のジンバルの状態は不明とする）
+    • アクションが無くなった actionGroup は削除する
+    """
+
+    def __init__(self, mission):
+        self.mission = mission
+        self.heading = None         # 機体ヘディング
+        self.pitch = None           # ジンバルピッチ
+        self.gimbal_yaw = None      # (ジンバルヨー, 設定時の機体ヘディング)
+        self.focal_length = None
+        self.removed = Counter()    # actionActuatorFunc → 削除数
+        self.points = 0             # アクションを削除した点の数
+
+    def update(self, wp, next_wp):
+        """wp の重複アクションを削除し、next_wp（無ければ None）へ向かうときの状態に進める"""
+        removed = 0
+        groups = []
+        for group in wp.action_groups:
+            kept = [action for action in group.actions if not self._redundant(action)]
+            removed += len(group.actions) - len(kept)
+            if kept:
+                groups.append(replace(group, actions=kept) if len(kept) != len(group.actions) else group)
+        if removed:
+            wp.action_groups = groups
+            self.points += 1
+        self.heading = departure_heading(wp, next_wp, self.mission, self.heading)
+
+    def _redundant(self, action):
+        """action が直前の状態から何も変えないか（状態は action の後の値に進める）"""
+        param = lambda name: wpe.action_param(action, name)
+        func = action.func
+        if func == "rotateYaw":
+            target = _heading_value(param("aircraftHeading"))
+            same = (target is not None and self.heading is not None
+                    and abs(geo.angle_difference(target, self.heading)) < SAME_ANGLE_DEG)
+            if target is not None:
+                self.heading = target
+            return self._count(func, same)
+
+        if func == "zoom":
+            focal = _heading_value(param("focalLength"))
+            same = (focal is not None and self.focal_length is not None
+                    and abs(focal - self.focal_length) < SAME_FOCAL_LENGTH)
+            self.focal_length = focal
+            return self._count(func, same)
+
+        if func == "gimbalRotate":
+            if param("gimbalRotateMode") != "absoluteAngle" or param("gimbalRotateTimeEnable") == "1":
+                self.pitch = self.gimbal_yaw = None
+                return False
+            same = param("gimbalRollRotateEnable") != "1"
+            if param("gimbalPitchRotateEnable") == "1":
+                pitch = _heading_value(param("gimbalPitchRotateAngle"))
+                same = (same and pitch is not None and self.pitch is not None
+                        and abs(pitch - self.pitch) < SAME_ANGLE_DEG)
+                self.pitch = pitch
+            if param("gimbalYawRotateEnable") == "1":
+                yaw = _heading_value(param("gimbalYawRotateAngle"))
+                previous = self.gimbal_yaw
+                same = (same and yaw is not None and previous is not None and self.heading is not None
+                        and previous[1] == self.heading
+                        and abs(geo.angle_difference(yaw, previous[0])) < SAME_ANGLE_DEG)
+                self.gimbal_yaw = None if yaw is None else (yaw, self.heading)
+            return self._count(func, same)
+        return False
+
+    def _count(self, func, redundant):
+        if redundant:
+            self.removed[func] += 1
+        return redundant
+
+    def report(self, log):
+        total = sum(self.removed.values())
+        if total == 0:
+            return
+        detail = ", ".join(f"{func} {n}" for func, n in self.removed.most_common())
+        log.insert(END, f"重複アクション削除: {self.points} 点で {total} 個（{detail}）\n")
+
+# --- アクションの並列実行 ---
+# 機体ヨー・ジンバル・ズームは別々の機構なので同時に動かせる。連続するこれらのアクションを parallel の
+# actionGroup にまとめ、撮影などの後続のアクションは（sequence の次のグループで）その完了を待つ。
+
+# 同時に実行できるアクション → 動かす機構（同じ機構のアクションは同時に実行しない）
+PARALLEL_ACTUATORS = {"rotateYaw": "aircraft", "gimbalRotate": "gimbal", "zoom": "camera"}
+
+GIMBAL_AXES = ("Pitch", "Roll", "Yaw")
+
+def gimbal_axes(action):
+    """
+    Action.of(GIMBAL_ROTATE) で作った gimbalRotate の、動かす軸のパラメータ名の集合。
+    軸の指定以外のパラメータ（回転モード・回転時間など）を変えたものは None（まとめない）。
+    """
+    if action.template is not wa.GIMBAL_ROTATE:
+        return None
+    keys = set()
+    for axis in GIMBAL_AXES:
+        if action.params.get(f"gimbal{axis}RotateEnable") == "1":
+            keys.update((f"gimbal{axis}RotateEnable", f"gimbal{axis}RotateAngle"))
+    return keys if keys and set(action.params) <= keys else None
+
+def merge_gimbal_rotations(actions):
+    """動かす軸が重ならない gimbalRotate（ジンバルヨーとピッチなど）を 1 つにまとめたリストを返す"""
+    merged = []
+    gimbal = None   # merged 内の gimbalRotate の位置
+    for action in actions:
+        if action.func == "gimbalRotate":
+            axes = gimbal_axes(action)
+            previous = gimbal_axes(merged[gimbal]) if gimbal is not None else None
+            if axes is not None and previous is not None and not (axes & previous):
+                merged[gimbal] = Action.of(wa.GIMBAL_ROTATE, **merged[gimbal].params, **action.params)
+                continue
+            gimbal = len(merged)
+        merged.append(action)
+    return merged
+
+def parallel_action_groups(index, actions):
+    """
+    1 ウェイポイント分のアクションを actionGroup のリストにする。
+    連続する PARALLEL_ACTUATORS のアクションは機構が重ならなければ parallel のグループにし、
+    それ以外は元の順序のまま sequence のグループにする。
+    """
+    runs = []   # [(同時に実行できるか, [アクション, ...]), ...]
+    for action in actions:
+        movable = action.func in PARALLEL_ACTUATORS
+        if runs and runs[-1][0] == movable:
+            runs[-1][1].append(action)
+        else:
+            runs.append((movable, [action]))
+
+    groups = []
+    for movable, run in runs:
+        if movable:
+            run = merge_gimbal_rotations(run)
+            actuators = [PARALLEL_ACTUATORS[action.func] for action in run]
+            if len(run) > 1 and len(set(actuators)) == len(actuators):
+                groups.append(ActionGroup.at(index, run, "parallel"))
+                continue
+        if groups and groups[-1].mode == "sequence":
+            groups[-1].actions.extend(run)
+        else:
+            groups.append(ActionGroup.at(index, run))
+    return groups
+
+class ParallelActionPlanner:
+    """
+    変換後のウェイポイントを index 順に 1 点ずつ update に渡し、アクションを parallel_action_groups で
+    組み直す（convert_kml とストリーミング変換で共通）。1 点に複数のグループができるので、
+    actionGroupId はミッション全体の通し番号にする。
+    """
+
+    def __init__(self):
+        self.next_id = 0
+        self.parallel = 0           # parallel のグループを作った点の数
+        self.merged = 0             # まとめた gimbalRotate の数
+
+    def update(self, wp):
+        groups = []
+        for group in wp.action_groups:
+            planned = parallel_action_groups(wp.index, group.actions)
+            self.merged += len(group.actions) - sum(len(g.actions) for g in planned)
+            groups.extend(planned)
+        if any(group.mode == "parallel" for group in groups):
+            self.parallel += 1
+        for group in groups:
+            group.group_id = str(self.next_id)
+            self.next_id += 1
+        wp.action_groups = groups
+
+    def report(self, log):
+        log.insert(END, f"並列アクショングループ: {self.parallel} 点（gimbalRotate の統合 {self.merged} 個）\n")
+
+def convert_kml(mission,
+                do_photo, do_video,
+                do_gimbal, gimbal_pitch_angle, gimbal_pitch_mode,
+                yaw_fix, yaw_angle, yaw_mode, speed,
+                sensor_modes, hover_time,
+                zoom_ratio, zoom_mode,
+                heading_mode, log, wp_stop_mode, write_back=True, aircraft=None, prune_actions=False,
+                parallel_actions=False, adaptive_hover=False):
+    """
+    解析済みのミッション（元の撮影姿勢は Waypoint.gimbal）を変換し、元のツリーに書き戻す。
+    write_back=False の場合はモデルだけを変換し、ツリーには書き戻さない（プレビュー用）。
+    aircraft（wpml_estimate.AircraftLimits）は rotateYaw の短縮時間の表示とホバリング時間の自動調整に使う。
+    prune_actions=True の場合は前のウェイポイントと同じ値のジンバル・ズーム・ヨーのアクションを削除する。
+    parallel_actions=True の場合は機体ヨー・ジンバル・ズームのアクションを同時に実行するグループにまとめる。
+    adaptive_hover=True の場合はホバリング時間を各点のジンバル・機体ヨー・ズームの変化量に合わせて短くする。
+    """
+
+    # 1) グローバル WP 停止モード設定
+    set_global_turn_mode(mission, wp_stop_mode, log)
+
+    # グローバル高度モード確認
+    global_height_mode = mission.height_mode if mission.height_mode is not None else "ATL"
+
+    log.insert(END, "\n=== 高度補正なし処理 ===\n")
+    log.insert(END, f"グローバル高度モード: {global_height_mode}\n")
+    log.see(END)
+
+    processed_count = 0
+    skipped_count = 0
+
+    for wp in mission.placemarks:
+        processed, skipped = log_placemark_heights(wp, global_height_mode, log)
+        processed_count += processed
+        skipped_count += skipped
+
+    log.insert(END, f"処理サマリー: 処理点 {processed_count}点, ASLスキップ {skipped_count}点\n")
+    log.see(END)
+
+    # 高度モードをEGM96に統一
+    mission.height_mode = normalise_height_mode(mission.height_mode, log)
+    for wp in mission.placemarks:
+        wp.height_mode = normalise_height_mode(wp.height_mode, log)
+
+    # 機体ヘディング制御設定を適用
+    apply_heading_settings(mission, heading_mode, log)
+
+    # 速度設定
+    set_global_speed(mission, speed)
+    for wp in mission.placemarks:
+        set_waypoint_speed(wp, speed)
+
+    # アクション削除
+    for wp in mission.placemarks:
+        remove_action_groups(wp)
+
+    # センサー選択
+    set_payload_sensors(mission, sensor_modes)
+
+    # ヨー固定
+    if yaw_fix and yaw_mode != "original" and yaw_angle is not None:
+        fix_global_heading(mission, yaw_angle)
+        for wp in mission.placemarks:
+            wp.heading = fixed_heading("fixed", str(int(yaw_angle)))
+
+    # アクション追加
+    pms = mission.waypoints
+
+    for i, wp in enumerate(pms):
+        add_waypoint_actions(wp, i == 0, i == len(pms) - 1,
+                             do_photo, do_video,
+                             do_gimbal, gimbal_pitch_angle, gimbal_pitch_mode,
+                             yaw_fix, yaw_angle, yaw_mode,
+                             sensor_modes, hover_time,
+                             zoom_ratio, zoom_mode)
+
+    # ホバリング時間を動きに合わせる（重複アクションの削除前の設定値で変化量を求める）
+    if adaptive_hover and hover_time > 0:
+        hovers = HoverPlanner(mission, hover_time, aircraft)
+        for wp, next_wp in zip(pms, pms[1:] + [None]):
+            hovers.update(wp, next_wp)
+        hovers.report(log)
+
+    # 重複アクションの削除
+    if prune_actions:
+        pruner = ActionPruner(mission)
+        for wp, next_wp in zip(pms, pms[1:] + [None]):
+            pruner.update(wp, next_wp)
+        pruner.report(log)
+
+    # rotateYaw の回転方向を最短に
+    if yaw_fix:
+        planner = YawPathPlanner(mission, aircraft)
+        for wp, next_wp in zip(pms, pms[1:] + [None]):
+            planner.update(wp, next_wp)
+        planner.report(log)
+
+    # 機体ヨー・ジンバル・ズームを同時に実行するグループにまとめる
+    if parallel_actions:
+        groups = ParallelActionPlanner()
+        for wp in pms:
+            groups.update(wp)
+        groups.report(log)
+
+    # 変わった項目だけをツリーに書き戻す
+    if write_back:
+        wm.write_mission(mission)
+
+# --- ストリーミング変換 -----------------------------------------------------
+# 5 万点規模のテンプレートでも DOM 全体を持たずに、1 Placemark ずつ読み・変換・書き出しする
+
+def convert_globals(mission, opts, log):
+    """
+    convert_kml のうちグローバル設定（Placemark 以外）の変換。
+    戻り値: 変換前のグローバル高度モード（各 Placemark の高度ログに使う）
+    """
+    set_global_turn_mode(mission, opts["wp_stop_mode"], log)
+
+    global_height_mode = mission.height_mode if mission.height_mode is not None else "ATL"
+    log.insert(END, f"グローバル高度モード: {global_height_mode}\n")
+
+    mission.height_mode = normalise_height_mode(mission.height_mode, log)
+
+    apply_global_heading_settings(mission, opts["heading_mode"])
+    set_global_speed(mission, opts["speed"])
+    set_payload_sensors(mission, opts["sensor_modes"])
+
+    if opts["yaw_fix"] and opts["yaw_mode"] != "original" and opts["yaw_angle"] is not None:
+        fix_global_heading(mission, opts["yaw_angle"])
+
+    return global_height_mode
+
+def convert_placemark(wp, position, last, opts, next_direction, global_height_mode, log):
+    """
+    convert_kml のうち 1 Placemark 分の変換をまとめて行う（書き戻しは呼び出し側）。
+    index が None の Placemark（ウェイポイント以外）はヘディング制御とアクション追加をしない。
+    next_direction は撮影方向に合わせるヘディング制御で使う、次のウェイポイントの撮影方向（無ければ None）。
+    戻り値: (処理点数, ASL スキップ点数)
+    """
+    counts = log_placemark_heights(wp, global_height_mode, log)
+    wp.height_mode = normalise_height_mode(wp.height_mode, log)
+
+    if wp.index is not None:
+        apply_waypoint_heading_settings(wp, opts["heading_mode"], next_direction, log)
+
+    set_waypoint_speed(wp, opts["speed"])
+    remove_action_groups(wp)
+
+    if opts["yaw_fix"] and opts["yaw_mode"] != "original" and opts["yaw_angle"] is not None:
+        wp.heading = fixed_heading("fixed", str(int(opts["yaw_angle"])))
+
+    if wp.index is not None:
+        add_waypoint_actions(wp, position == 0, last,
+                             opts["do_photo"], opts["do_video"],
+                             opts["do_gimbal"], opts["gimbal_pitch_angle"], opts["gimbal_pitch_mode"],
+                             opts["yaw_fix"], opts["yaw_angle"], opts["yaw_mode"],
+                             opts["sensor_modes"], opts["hover_time"],
+                             opts["zoom_ratio"], opts["zoom_mode"])
+    return counts
+
+def read_template_skeleton(src):
+    """
+    1 パス目: Placemark を読み捨てながら template.kml を読み、Placemark 以外の骨格を返す。
+    （Placemark は読むそばから消すので、メモリはウェイポイント数によらずほぼ一定）
+    戻り値: (骨格の root 要素, Folder 内で最初の Placemark があった位置。無ければ None)
+    """
+    context = etree.iterparse(src, events=("end",), tag=wm.KML + "Placemark", remove_blank_text=True)
+    first_pos = None
+    for _, el in context:
+        parent = el.getparent()
+        if parent is None or parent.tag != wm.KML + "Folder":
+            continue
+        if first_pos is None:
+            first_pos = parent.index(el)
+        el.clear()
+        prev = el.getprevious()
+        while prev is not None and prev.tag == wm.KML + "Placemark":
+            parent.remove(prev)
+            prev = el.getprevious()
+
+    root = context.root
+    for pm in xp.PLACEMARKS(root):
+        pm.getparent().remove(pm)
+    return root, first_pos
+
+class TemplateStreamer:
+    """
+    template.kml を iterparse で読みながら 1 Placemark ずつ変換し、etree.xmlfile で書き出す。
+    • 1 パス目 (read_template_skeleton) で Placemark 以外の骨格を読み、convert_globals を適用する
+      （DJI の template.kml では payloadParam が Placemark の後ろにあるため、先に全体を見ておく）
+    • 2 パス目で Placemark を 1 つずつ変換・書き出しし、書き出したものは元ツリーから外すので、
+      メモリ使用量はウェイポイント数によらずほぼ一定
+    • 撮影方向に合わせるヘディング制御は次のウェイポイントの元アクションを参照するため、
+      ウェイポイント 1 つ分を先読みバッファに保持してから変換する
+    前提: Folder は 1 つで、ウェイポイントは文書順 = index 順（DJI が出力する template.kml の形式）。
+    Folder 内で Placemark の間に挟まった Placemark 以外の要素は、Placemark の後ろにまとめて書き出す。
+    """
+
+    def __init__(self, opts, log, pretty_print=True):
+        self.opts = opts
+        self.log = log
+        self.pretty_print = pretty_print
+
+    def run(self, open_src, out):
+        """
+        open_src: 呼ぶたびに template.kml を先頭から読むバイナリのファイルオブジェクトを返す関数（2 回呼ぶ）
+        out: 書き出し先のバイナリのファイルオブジェクト
+        戻り値: 変換したウェイポイント数
+        """
+        with open_src() as src:
+            skeleton, first_pos = read_template_skeleton(src)
+
+        self.pending = []           # 先読みバッファ（先頭がウェイポイント、続く Placemark はその後ろに書く）
+        self.position = 0
+        self.counts = [0, 0]
+        self.mission = None
+        self.hovers = None          # ホバリング時間の自動調整（HoverPlanner。adaptive_hover のときのみ）
+        self.pruner = None          # 重複アクションの削除（ActionPruner。prune_actions のときのみ）
+        self.yaw_paths = None       # rotateYaw の回転方向（YawPathPlanner。ヨー固定のときのみ）
+        self.groups = None          # アクションの並列実行（ParallelActionPlanner。parallel_actions のときのみ）
+        self.plans = []             # 飛行時間見積り用（Placemark を持たない WaypointPlan）
+        self.estimate = None
+
+        with etree.xmlfile(out, encoding="utf-8") as xf:
+            self.writer = w = WpmlWriter(xf, self.pretty_print)
+            xf.write_declaration()
+
+            if first_pos is None:
+                # Placemark の無いテンプレートは小さいので DOM で変換
+                return self._convert_whole(skeleton)
+
+            folder = xp.first(xp.FOLDERS, skeleton)
+            document = folder.getparent()
+            doc_pos = skeleton.index(document)
+            folder_pos = document.index(folder)
+
+            self._convert_skeleton(skeleton)
+
+            w.start(skeleton, 0)
+            for child in skeleton[:doc_pos]:
+                w.write_nested(child, 1)
+            w.start(document, 1)
+            for child in document[:folder_pos]:
+                w.write_nested(child, 2)
+            w.start(folder, 2)
+            for child in folder[:first_pos]:
+                w.write_nested(child, 3)
+
+            with open_src() as src:
+                for _, el in etree.iterparse(src, events=("end",), tag=wm.KML + "Placemark",
+                                             remove_blank_text=True):
+                    parent = el.getparent()
+                    if parent is None or parent.tag != wm.KML + "Folder":
+                        continue
+                    self._placemark(el)
+                    # 書き出し済みの要素は元ツリーから外す（先読み中のものは残す）
+                    keep = self.pending[0].placemark if self.pending else el
+                    while keep.getprevious() is not None:
+                        del parent[0]
+                self._flush(None, last=True)
+
+            # Placemark の後ろ（payloadParam やグローバル変換で追加した要素）
+            for child in folder[first_pos:]:
+                w.write_nested(child, 3)
+            w.end(2)
+            for child in document[folder_pos + 1:]:
+                w.write_nested(child, 2)
+            w.end(1)
+            for child in skeleton[doc_pos + 1:]:
+                w.write_nested(child, 1)
+            w.end(0)
+
+        self.log.insert(END,
+                        f"処理サマリー: 処理点 {self.counts[0]}点, ASLスキップ {self.counts[1]}点\n")
+        if self.hovers is not None:
+            self.hovers.report(self.log)
+        if self.pruner is not None:
+            self.pruner.report(self.log)
+        if self.yaw_paths is not None:
+            self.yaw_paths.report(self.log)
+        if self.groups is not None:
+            self.groups.report(self.log)
+        if self.opts.get("estimate"):
+            self.estimate = wpe.estimate_mission(self.plans, self.mission.turn_mode, self.opts.get("aircraft"))
+        return self.position
+
+    # --- 変換 ---
+
+    def _convert_skeleton(self, skeleton):
+        """骨格からグローバル設定を読み、グローバル変換を適用して書き戻す"""
+        mission = wm.parse_mission(skeleton.getroottree())
+        self.payload_zoom = "zoom" in (mission.image_format or "").lower()
+
+        global_height = mission.height if mission.height is not None else "未設定"
+        self.log.insert(END, f"グローバル高度: {global_height}\n")
+
+        self.global_height_mode = convert_globals(mission, self.opts, self.log)
+        wm.write_globals(mission)
+        self.mission = mission      # 見積りでグローバル設定（速度・ヘディング・ターンモード）を使う
+        if self.opts.get("adaptive_hover") and self.opts["hover_time"] > 0:
+            self.hovers = HoverPlanner(mission, self.opts["hover_time"], self.opts.get("aircraft"))
+        if self.opts.get("prune_actions"):
+            self.pruner = ActionPruner(mission)
+        if self.opts["yaw_fix"]:
+            self.yaw_paths = YawPathPlanner(mission, self.opts.get("aircraft"))
+        if self.opts.get("parallel_actions"):
+            self.groups = ParallelActionPlanner()
+
+    def _placemark(self, pm):
+        wp = wm.parse_waypoint(pm)
+        if wp.index is None:
+            # ウェイポイント以外は直前のウェイポイントの後ろに書く
+            if self.pending:
+                self.pending.append(wp)
+            else:
+                self._emit_other(wp)
+            return
+
+        wp.gimbal = gimbal_info_from_actions(wp.actions(), self.payload_zoom)
+        self._flush(wp, last=False)
+        self.pending = [wp]
+
+    def _flush(self, next_wp, last):
+        """先読みバッファのウェイポイントを（次のウェイポイントの情報を使って）変換して書き出す"""
+        if not self.pending:
+            return
+        wp, others = self.pending[0], self.pending[1:]
+        self.pending = []
+
+        next_direction = shooting_direction(next_wp.gimbal) if next_wp is not None else None
+        self._count(convert_placemark(wp, self.position, last, self.opts, next_direction,
+                                      self.global_height_mode, self.log))
+        self.position += 1
+        if self.hovers is not None:
+            self.hovers.update(wp, next_wp)
+        if self.pruner is not None:
+            self.pruner.update(wp, next_wp)
+        if self.yaw_paths is not None:
+            self.yaw_paths.update(wp, next_wp)
+        if self.groups is not None:
+            self.groups.update(wp)
+        if self.opts.get("estimate"):
+            self.plans.append(wpe.plan_waypoint(wp, self.mission))
+        wm.write_waypoint(wp)
+        self.writer.write(wp.placemark, 3)
+        for other in others:
+            self._emit_other(other)
+
+    def _emit_other(self, wp):
+        self._count(convert_placemark(wp, self.position, False, self.opts, None,
+                                      self.global_height_mode, self.log))
+        wm.write_waypoint(wp)
+        self.writer.write(wp.placemark, 3)
+
+    def _count(self, counts):
+        self.counts[0] += counts[0]
+        self.counts[1] += counts[1]
+
+    def _convert_whole(self, root):
+        mission = analyse_template(root.getroottree(), self.log)
+        self.estimate = convert_template(mission, self.opts, self.log)
+        self.writer.write(root, 0)
+        return len(mission)
+
+# --- ログ出力 ---------------------------------------------------------------
+# 変換処理はログウィジェット互換のオブジェクト（insert / see）に書き込む。
+# ウェイポイント毎の詳細は detail で書き込み、詳細ログを切った場合は捨てる。
+
+class NullLog:
+    """何も書き出さないログ（convert_kmz の log=None）"""
+
+    def insert(self, index, text):
+        pass
+
+    def detail(self, text):
+        pass
+
+    def see(self, index):
+        pass
+
+class BufferedLog:
+    """
+    ログウィジェット互換のバッファ。並列処理中の出力を貯めて、後で replay でまとめて書き出す。
+    detail は書き出し先のログで詳細ログの有無を判定するため、区別して貯める。
+    """
+
+    def __init__(self, keep_detail=True):
+        self.chunks = []
+        self.keep_detail = keep_detail
+
+    def insert(self, index, text):
+        self.chunks.append((False, text))
+
+    def detail(self, text):
+        if self.keep_detail:
+            self.chunks.append((True, text))
+
+    def see(self, index):
+        pass
+
+    def replay(self, log):
+        for is_detail, text in self.chunks:
+            if is_detail:
+                log.detail(text)
+            else:
+                log.insert(END, text)
+
+# --- KMZ 一括処理 -----------------------------------------------------------
+
+class ConversionCancelled(Exception):
+    """ジョブの中止（process_kmz の cancel がセットされた）"""
+
+def check_cancel(cancel):
+    """cancel (threading.Event or None) がセットされていれば ConversionCancelled を送出する"""
+    if cancel is not None and cancel.is_set():
+        raise ConversionCancelled()
+
+def load_kmz_templates(path, in_memory, log):
+    """
+    KMZ から template.kml を読み込む。
+    戻り値: ([(テンプレート名, ツリー), ...], res 配下のエントリ名, 作業フォルダ or None)
+    """
+    with zipfile.ZipFile(path, "r") as zf:
+        res_members = [n for n in zf.namelist() if is_res_member(n)]
+        if in_memory:
+            templates = read_templates_from_kmz(zf)
+
+    if in_memory:
+        if not templates:
+            raise FileNotFoundError("template.kml が見つかりませんでした。")
+        return templates, res_members, None
+
+    wd = extract_kmz(path)
+    try:
+        # 解凍後すぐに res フォルダを削除
+        res_paths = glob.glob(os.path.join(wd, "**", "res"), recursive=True)
+        for res_path in res_paths:
+            if os.path.isdir(res_path):
+                shutil.rmtree(res_path)
+                log.insert(END, f"削除: {res_path}\n")
+        
+        kmls = glob.glob(os.path.join(wd, "**", "template.kml"), recursive=True)
+        if not kmls:
+            raise FileNotFoundError("template.kml が見つかりませんでした。")
+
+        templates = []
+        for kml in kmls:
+            parser = etree.XMLParser(remove_blank_text=True)
+            templates.append((kml, etree.parse(kml, parser)))
+    except Exception:
+        shutil.rmtree(wd, ignore_errors=True)
+        raise
+
+    return templates, res_members, wd
+
+def log_conversion_settings(sensor_modes, heading_mode, zoom_mode, zoom_ratio, log):
+    sensor_list = ', '.join(sensor_modes) if sensor_modes else 'デフォルト'
+    log.insert(END, f"使用センサー: {sensor_list}\n")
+
+    heading_mode_name = HEADING_MODE_NAMES.get(heading_mode, "不明")
+    log.insert(END, f"機体ヘディング制御: {heading_mode_name}\n")
+
+    if "Zoom" in sensor_modes:
+        if zoom_mode == "original":
+            log.insert(END, "ズーム設定: 元を維持\n")
+        elif zoom_mode == "fixed" and zoom_ratio is not None:
+            log.insert(END, f"ズーム設定: {zoom_ratio:.1f}倍 ({zoom_ratio*24.0:.1f}mm)\n")
+
+def analyse_template(tree, log):
+    """
+    変換前のテンプレートを読み込んでミッションモデルにし、元の撮影姿勢を解析する。
+    戻り値: wpml_model.Mission（各 Waypoint.gimbal 設定済み）
+    """
+    mission = wm.parse_mission(tree)
+
+    global_height = mission.height if mission.height is not None else "未設定"
+    global_height_mode = mission.height_mode if mission.height_mode is not None else "未設定"
+
+    log.insert(END,
+               f"グローバル高度: {global_height}, 標高モード: {global_height_mode}\n")
+
+    log.insert(END, f"総ウェイポイント数: {len(mission)}\n")
+
+    gimbal_count = extract_original_gimbal_angles(mission)
+    if gimbal_count:
+        log.insert(END,
+                   f"ジンバル・ズーム情報を持つウェイポイント: {gimbal_count}個\n")
+    else:
+        log.insert(END, "元データにジンバル・ズーム情報なし\n")
+
+    geometry = mission_geometry(mission)
+    if len(geometry) > 1:
+        climbs = np.nan_to_num(geometry.climbs())
+        log.insert(END,
+                   f"総飛行距離: {np.nansum(geometry.segment_lengths()):.1f}m "
+                   f"(上昇 {climbs[climbs > 0].sum():.1f}m, 下降 {-climbs[climbs < 0].sum():.1f}m)\n")
+
+    log.insert(END, "元のヘディング設定取得完了\n")
+
+    # 各ウェイポイント詳細表示
+    for wp in mission.waypoints:
+        idx = wp.index
+        height_mode = wp.height_mode if wp.height_mode is not None else global_height_mode
+        if wp.ellipsoid_height is not None:
+            height_val = wp.ellipsoid_height
+        elif wp.height is not None:
+            height_val = wp.height
+        else:
+            height_val = global_height
+
+        g = wp.gimbal or GimbalInfo()
+        pitch = "N/A" if g.pitch is None else g.pitch
+        yaw   = "N/A" if g.yaw is None else g.yaw
+        head  = "N/A" if g.heading is None else g.heading
+        fl    = g.focal_length
+        zr    = g.zoom_ratio
+
+        # zoom_ratio が None の場合は "元設定維持"、数値ならフォーマット
+        if zr is None:
+            zoom_info = "元設定維持"
+        else:
+            zoom_info = f"{zr:.1f}倍({fl:.1f}mm)"
+
+        log.detail(f"[WP {idx}] 標高モード={height_mode}, 高度={height_val}, "
+                   f"ジンバルピッチ={pitch}°, ジンバルヨー={yaw}°, "
+                   f"機体ヘディング={head}°, ズーム={zoom_info}\n")
+
+    return mission
+
+def convert_template(mission, opts, log):
+    """
+    解析済みミッションを opts（convert_kml の変換設定）に従って変換し、ツリーに書き戻す。
+    戻り値: 変換後のミッションの飛行時間見積り（wpml_estimate.MissionEstimate。opts["estimate"] が偽なら None）
+    """
+    log.insert(END, "\n高度補正なし処理開始\n")
+
+    convert_kml(mission,
+                opts["do_photo"], opts["do_video"],
+                opts["do_gimbal"], opts["gimbal_pitch_angle"], opts["gimbal_pitch_mode"],
+                opts["yaw_fix"], opts["yaw_angle"], opts["yaw_mode"], opts["speed"],
+                opts["sensor_modes"], opts["hover_time"],
+                opts["zoom_ratio"], opts["zoom_mode"],
+                opts["heading_mode"], log, opts["wp_stop_mode"],
+                aircraft=opts.get("aircraft"), prune_actions=opts.get("prune_actions", False),
+                parallel_actions=opts.get("parallel_actions", False),
+                adaptive_hover=opts.get("adaptive_hover", False))
+
+    log.insert(END, "高度補正なし処理完了\n\n")
+    return estimate_converted(mission, opts)
+
+def estimate_converted(mission, opts):
+    """
+    変換後のミッションの飛行時間を opts["aircraft"]（AircraftLimits。None なら既定値）で見積もる
+    （opts["estimate"] が偽なら見積もらずに None）
+    """
+    if not opts.get("estimate"):
+        return None
+    plans = [wpe.plan_waypoint(wp, mission) for wp in mission.waypoints]
+    return wpe.estimate_mission(plans, mission.turn_mode, opts.get("aircraft"))
+
+def report_estimates(out_kmz, estimates, log):
+    """テンプレート毎の見積りをログに出し、<出力 KMZ 名>.estimate.json に書き出す"""
+    estimates = [e for e in estimates if e is not None]
+    if not estimates:
+        return None
+    for estimate in estimates:
+        log.insert(END, estimate.summary())
+    json_path = wpe.write_estimate_json(wpe.estimate_json_path(out_kmz), estimates, out_kmz)
+    log.insert(END, f"見積りを出力: {json_path}\n")
+    return json_path
+
+def estimate_kmz(path, aircraft=None):
+    """
+    KMZ（変換後のもの）の各テンプレートの飛行時間を変換せずに見積もる（キャッシュから出力した KMZ 用）。
+    戻り値: テンプレート毎の wpml_estimate.MissionEstimate のリスト
+    """
+    with zipfile.ZipFile(path, "r") as zf:
+        templates = read_templates_from_kmz(zf)
+    estimates = []
+    for _, tree in templates:
+        mission = wm.parse_mission(tree)
+        plans = [wpe.plan_waypoint(wp, mission) for wp in mission.waypoints]
+        estimates.append(wpe.estimate_mission(plans, mission.turn_mode, aircraft))
+    return estimates
+
+def convert_variant(path, analysed, opts, passthrough, pretty_print=True):
+    """
+    1 バリエーション分の変換: 解析済みツリーとミッションを複製して変換し、KMZ をメモリから書き出す。
+    戻り値: (出力 KMZ パス, このバリエーションのログ)
+    """
+    vlog = BufferedLog()
+    log_conversion_settings(opts["sensor_modes"], opts["heading_mode"],
+                            opts["zoom_mode"], opts["zoom_ratio"], vlog)
+
+    members = []
+    estimates = []
+    for kml, tree, mission in analysed:
+        # 解析結果はそのまま使い、複製したツリーに結び付け直す
+        work = copy.deepcopy(tree)
+        estimates.append(convert_template(mission.clone(work), opts, vlog))
+        members.append((f"wpmz/{os.path.basename(kml)}", work))
+
+    out_kmz = output_kmz_path(path, opts["do_photo"], opts["do_video"], opts["sensor_modes"])
+    write_kmz_from_memory(out_kmz, members, path, passthrough, pretty_print)
+    report_estimates(out_kmz, estimates, vlog)
+
+    return out_kmz, vlog
+
+def convert_variants(path, analysed, opts, variants, passthrough, log, pretty_print=True):
+    """
+    1 回の解析結果から複数バリエーション（撮影モード×センサー）の KMZ を並列に出力する。
+    各バリエーションのログはバリエーション毎にまとめて出力する。
+    """
+    variant_opts = []
+    for v in variants:
+        vo = dict(opts)
+        vo.update(v)
+        variant_opts.append(vo)
+
+    out_kmzs = []
+    with ThreadPoolExecutor(max_workers=min(len(variant_opts), MAX_WORKERS)) as ex:
+        futures = [ex.submit(convert_variant, path, analysed, vo, passthrough, pretty_print)
+                   for vo in variant_opts]
+        for vo, fut in zip(variant_opts, futures):
+            name = output_base_name(path, vo["do_photo"], vo["do_video"], vo["sensor_modes"])
+            log.insert(END, f"\n--- バリエーション: {name} ---\n")
+            out_kmz, vlog = fut.result()
+            vlog.replay(log)
+            log.insert(END, f"書き出し完了: {out_kmz}\n")
+            log.see(END)
+            out_kmzs.append(out_kmz)
+
+    return out_kmzs
+
+def stream_convert_kmz(path, opts, log, passthrough=(), pretty_print=True):
+    """
+    KMZ 内の template.kml を TemplateStreamer で変換し、出力 KMZ のエントリへ直接書き出す。
+    戻り値: 出力 KMZ のパス
+    """
+    out_kmz = output_kmz_path(path, opts["do_photo"], opts["do_video"], opts["sensor_modes"])
+    tmp = out_kmz + ".zip"
+
+    with zipfile.ZipFile(path, "r") as src_zf, \
+         zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as dst_zf:
+        infos = template_members(src_zf)
+        if not infos:
+            raise FileNotFoundError("template.kml が見つかりませんでした。")
+
+        estimates = []
+        for info in infos:
+            arcname = f"wpmz/{os.path.basename(info.filename)}"
+            log.insert(END, f"-- テンプレート読み込み (ストリーミング): {info.filename}\n")
+            with dst_zf.open(arcname, "w", force_zip64=True) as dst:
+                streamer = TemplateStreamer(opts, log, pretty_print)
+                count = streamer.run(lambda: src_zf.open(info), dst)
+            estimates.append(streamer.estimate)
+            log.insert(END, f"総ウェイポイント数: {count}\n")
+            log.insert(END, f"変換完了 (ストリーミング): {arcname}\n")
+            log.see(END)
+
+        copy_passthrough_members(path, dst_zf, passthrough)
+
+    os.replace(tmp, out_kmz)
+    report_estimates(out_kmz, estimates, log)
+    return out_kmz
+
+def stream_convert_kmz_file(path, opts, log, keep_res=False, variants=None, pretty_print=True,
+                            cancel=None):
+    """
+    convert_kmz_file のストリーミング版。テンプレート全体をメモリに載せずに変換する。
+    variants を指定した場合はバリエーション毎に読み直して順に出力する（メモリ使用量を一定に保つため）。
+    """
+    with zipfile.ZipFile(path, "r") as zf:
+        res_members = [n for n in zf.namelist() if is_res_member(n)]
+    passthrough = res_members if keep_res else []
+    if res_members and not keep_res:
+        log.insert(END, f"res 配下を除外: {len(res_members)} 件\n")
+
+    out_kmzs = []
+    for v in variants or [{}]:
+        check_cancel(cancel)
+        vo = dict(opts, **v)
+        if variants:
+            name = output_base_name(path, vo["do_photo"], vo["do_video"], vo["sensor_modes"])
+            log.insert(END, f"\n--- バリエーション: {name} ---\n")
+        log_conversion_settings(vo["sensor_modes"], vo["heading_mode"],
+                                vo["zoom_mode"], vo["zoom_ratio"], log)
+        out_kmzs.append(stream_convert_kmz(path, vo, log, passthrough, pretty_print))
+
+    if passthrough:
+        log.insert(END, f"res を無変換でコピー: {len(passthrough)} 件\n")
+    return out_kmzs
+
+# --- 解析済みミッションのキャッシュ -----------------------------------------
+# 設定だけを変えて同じ KMZ を変換し直すときに、読み込み・解析をやり直さない
+
+@dataclass(slots=True)
+class ParsedMission:
+    """
+    1 つの KMZ の読み込み・解析結果（MissionCache が保持する）。
+    analysed のツリーは変換前のまま保ち、変換は複製に対して行う（convert_variant）。
+    """
+    path: str
+    signature: tuple    # 入力 KMZ の (更新時刻, サイズ)。変わっていれば読み込み直す
+    analysed: list      # [(テンプレート名, ツリー, wpml_model.Mission), ...]
+    res_members: list   # res 配下のエントリ名
+
+def file_signature(path):
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+class MissionCache:
+    """
+    最近変換した KMZ の解析結果（ParsedMission）を max_entries 件まで保持する LRU キャッシュ。
+    キーは入力 KMZ の絶対パス。ファイルが更新されていれば、そのエントリは使わない。
+    ジョブのワーカースレッドと GUI のプレビューから同時に使える。
+    """
+
+    def __init__(self, max_entries=MISSION_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path, touch=True):
+        """path の解析結果（無い・ファイルが更新されている場合は None）。touch=False なら LRU の順を変えない"""
+        key = os.path.abspath(path)
+        try:
+            signature = file_signature(path)
+        except OSError:
+            signature = None
+        with self._lock:
+            parsed = self._entries.get(key)
+            if parsed is None:
+                return None
+            if parsed.signature != signature:
+                del self._entries[key]
+                return None
+            if touch:
+                self._entries.move_to_end(key)
+            return parsed
+
+    def put(self, parsed):
+        key = os.path.abspath(parsed.path)
+        with self._lock:
+            self._entries[key] = parsed
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def load(self, path, log):
+        """path の解析結果を返す（無ければ読み込み・解析してキャッシュに入れる）"""
+        parsed = self.get(path)
+        if parsed is not None:
+            log.insert(END, f"解析済みのミッションを再利用: {os.path.basename(path)}"
+                            f"（総ウェイポイント数: {sum(len(m) for _, _, m in parsed.analysed)}）\n")
+            return parsed
+
+        signature = file_signature(path)
+        templates, res_members, _ = load_kmz_templates(path, True, log)
+        analysed = []
+        for kml, tree in templates:
+            log.insert(END, f"-- テンプレート読み込み: {os.path.basename(kml)}\n")
+            analysed.append((kml, tree, analyse_template(tree, log)))
+        parsed = ParsedMission(path, signature, analysed, res_members)
+        self.put(parsed)
+        return parsed
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+def convert_parsed_mission(parsed, opts, log, keep_res=False, variants=None, pretty_print=True, cancel=None):
+    """
+    解析済みミッションを複製して変換し、出力 KMZ のパスのリストを返す（解析結果は変更しない）。
+    variants を指定した場合は各バリエーションを出力する。
+    """
+    path = parsed.path
+    passthrough = parsed.res_members if keep_res else []
+    if parsed.res_members and not keep_res:
+        log.insert(END, f"res 配下を除外: {len(parsed.res_members)} 件\n")
+    check_cancel(cancel)
+
+    if variants:
+        out_kmzs = convert_variants(path, parsed.analysed, opts, variants, passthrough, log, pretty_print)
+    else:
+        out_kmz, vlog = convert_variant(path, parsed.analysed, opts, passthrough, pretty_print)
+        vlog.replay(log)
+        log.insert(END, f"書き出し完了: {out_kmz}\n")
+        out_kmzs = [out_kmz]
+
+    if passthrough:
+        log.insert(END, f"res を無変換でコピー: {len(passthrough)} 件\n")
+    return out_kmzs
+
+@dataclass(slots=True)
+class ConversionPreview:
+    """preview_conversion の結果（変換後のミッションの概要）"""
+    path: str
+    waypoints: int = 0
+    actions: Counter = field(default_factory=Counter)        # actionActuatorFunc → 個数
+    heading_modes: Counter = field(default_factory=Counter)  # ウェイポイントの waypointHeadingMode → 個数
+    turn_mode: str | None = None
+    estimates: list = field(default_factory=list)            # テンプレート毎の wpml_estimate.MissionEstimate
+
+    def summary(self):
+        actions = sum(self.actions.values())
+        lines = [f"{os.path.basename(self.path)}: ウェイポイント {self.waypoints} 点、アクション {actions} 個"]
+        if self.actions:
+            lines.append("アクション: " + ", ".join(f"{func} {n}" for func, n in self.actions.most_common()))
+        if self.heading_modes:
+            lines.append("ヘディング: " + ", ".join(f"{mode} {n}" for mode, n in self.heading_modes.most_common()))
+        if self.turn_mode is not None:
+            lines.append(f"ターンモード: {self.turn_mode}")
+        if self.estimates:
+            total = sum(e.total_time for e in self.estimates)
+            fits = "" if all(e.fits_battery for e in self.estimates) else "（1 バッテリーに収まらない）"
+            lines.append(f"飛行時間見積り: {wpe.format_minutes(total)}{fits}")
+        return "\n".join(lines)
+
+def preview_conversion(parsed, opts):
+    """
+    解析済みミッションを opts で変換した結果の概要を返す。
+    モデルだけを複製して変換し、ツリーの複製・書き出しはしないので、設定を変える度に呼べる。
+    """
+    preview = ConversionPreview(parsed.path)
+    log = NullLog()
+    for _, tree, mission in parsed.analysed:
+        # 元のツリーに結び付けたままの複製（書き戻さないのでツリーは変わらない）
+        work = mission.clone(tree)
+        convert_kml(work,
+                    opts["do_photo"], opts["do_video"],
+                    opts["do_gimbal"], opts["gimbal_pitch_angle"], opts["gimbal_pitch_mode"],
+                    opts["yaw_fix"], opts["yaw_angle"], opts["yaw_mode"], opts["speed"],
+                    opts["sensor_modes"], opts["hover_time"],
+                    opts["zoom_ratio"], opts["zoom_mode"],
+                    opts["heading_mode"], log, opts["wp_stop_mode"], write_back=False,
+                    aircraft=opts.get("aircraft"), prune_actions=opts.get("prune_actions", False),
+                    parallel_actions=opts.get("parallel_actions", False),
+                    adaptive_hover=opts.get("adaptive_hover", False))
+        preview.waypoints += len(work)
+        preview.turn_mode = work.turn_mode
+        for wp in work.waypoints:
+            preview.actions.update(action.func for action in wp.actions())
+            if wp.heading is not None and wp.heading.mode is not None:
+                preview.heading_modes[wp.heading.mode] += 1
+        estimate = estimate_converted(work, opts)
+        if estimate is not None:
+            preview.estimates.append(estimate)
+    return preview
+
+def convert_kmz_file(path, opts, log, in_memory=False, keep_res=False, variants=None, streaming=False,
+                     pretty_print=True, cancel=None, missions=None):
+    """
+    KMZ を読み込んで変換し、出力 KMZ のパスのリストを返す。
+    variants を指定した場合は 1 回の解析から各バリエーションを出力する（常にメモリ上で処理）。
+    streaming=True の場合は stream_convert_kmz_file で 1 Placemark ずつ変換する。
+    pretty_print=False の場合は template.kml をインデントせずに書き出す。
+    cancel (threading.Event) がセットされると、テンプレート・バリエーションの区切りで中止する
+    （ConversionCancelled。出力 KMZ は書き出さない）。
+    missions (MissionCache) を指定した場合は解析結果をキャッシュから再利用する（常にメモリ上で処理）。
+    """
+    if streaming:
+        return stream_convert_kmz_file(path, opts, log, keep_res, variants, pretty_print, cancel)
+
+    if missions is not None:
+        parsed = missions.load(path, log)
+        return convert_parsed_mission(parsed, opts, log, keep_res, variants, pretty_print, cancel)
+
+    if variants:
+        in_memory = True
+
+    templates, res_members, wd = load_kmz_templates(path, in_memory, log)
+    try:
+        passthrough = res_members if keep_res else []
+        if in_memory and res_members and not keep_res:
+            log.insert(END, f"res 配下を除外: {len(res_members)} 件\n")
+
+        if not variants:
+            log_conversion_settings(opts["sensor_modes"], opts["heading_mode"],
+                                    opts["zoom_mode"], opts["zoom_ratio"], log)
+
+        analysed = []
+        for kml, tree in templates:
+            check_cancel(cancel)
+            log.insert(END, f"-- テンプレート読み込み: {os.path.basename(kml)}\n")
+            analysed.append((kml, tree, analyse_template(tree, log)))
+        check_cancel(cancel)
+
+        if variants:
+            out_kmzs = convert_variants(path, analysed, opts, variants, passthrough, log, pretty_print)
+        else:
+            do_photo, do_video, sensor_modes = opts["do_photo"], opts["do_video"], opts["sensor_modes"]
+            estimates = []
+            if in_memory:
+                out_members = []
+            else:
+                out_root, outdir = prepare_output_dirs(path, do_photo, do_video, sensor_modes)
+
+            while analysed:
+                # 書き出し時に Placemark を解放できるよう、変換済みのミッションへの参照は残さない
+                kml, tree, mission = analysed.pop(0)
+                estimates.append(convert_template(mission, opts, log))
+                mission = None
+                check_cancel(cancel)
+
+                if in_memory:
+                    arcname = f"wpmz/{os.path.basename(kml)}"
+                    out_members.append((arcname, tree))
+                    log.insert(END, f"変換完了 (メモリ上): {arcname}\n")
+                else:
+                    out_path = os.path.join(outdir, os.path.basename(kml))
+                    with open(out_path, "wb") as f:
+                        write_template(tree, f, pretty_print, release=True)
+                    log.insert(END, f"書き出し完了: {out_path}\n")
+
+            # リソースコピー部分を削除（resフォルダをコピーしない）
+            # 元のコードの以下の部分をコメントアウト
+            # for name in ["res"]:
+            #     srcs = glob.glob(os.path.join(wd, "**", name), recursive=True)
+            #     if srcs:
+            #         src = srcs[0]; dst = os.path.join(outdir, os.path.basename(src))
+            #         if os.path.isdir(src):
+            #             shutil.copytree(src, dst, dirs_exist_ok=True)
+            #         else:
+            #             shutil.copy2(src, dst)
+
+            if in_memory:
+                out_kmz = output_kmz_path(path, do_photo, do_video, sensor_modes)
+                write_kmz_from_memory(out_kmz, out_members, path, passthrough, pretty_print)
+            else:
+                out_kmz = repackage_to_kmz(out_root, path, do_photo, do_video, sensor_modes, passthrough)
+            report_estimates(out_kmz, estimates, log)
+            out_kmzs = [out_kmz]
+
+        if passthrough:
+            log.insert(END, f"res を無変換でコピー: {len(passthrough)} 件\n")
+        return out_kmzs
+    finally:
+        # このジョブの作業フォルダのみ削除（他ジョブの作業フォルダには触れない）
+        if wd is not None:
+            shutil.rmtree(wd, ignore_errors=True)
+
+@dataclass(slots=True)
+class ConversionResult:
+    """convert_kmz の結果"""
+    path: str                                   # 入力 KMZ
+    outputs: list = field(default_factory=list) # 出力 KMZ（キャッシュから出力したものを含む）
+    cached: list = field(default_factory=list)  # outputs のうちキャッシュから出力したもの
+    cancelled: bool = False                     # cancel で中止した（outputs は中止前に出力したもの）
+    elapsed: float = 0.0                        # 処理時間（秒）
+
+def convert_kmz(path,
+                do_photo=False, do_video=False,
+                do_gimbal=False, gimbal_pitch_angle=None, gimbal_pitch_mode="none",
+                yaw_fix=False, yaw_angle=None, yaw_mode="none",
+                speed=15, sensor_modes=(), hover_time=0,
+                zoom_ratio=None, zoom_mode="original",
+                heading_mode="follow_gimbal", wp_stop_mode="stop", log=None,
+                in_memory=True, keep_res=False, variants=None, cache=None, streaming=False,
+                pretty_print=True, cancel=None, missions=None, estimate=True, aircraft=None,
+                prune_actions=False, parallel_actions=False, adaptive_hover=False):
+    """
+    KMZ を変換して <元ファイル名>_<モード>_<センサー>.kmz を出力する（既定値は GUI の初期設定と同じ）。
+    in_memory=True の場合は作業フォルダを使わず、ZipFile から直接読み込み、
+    変換結果をメモリから直接 KMZ に書き出す。
+    keep_res=True の場合は res 配下を削除せず、圧縮済みのまま出力 KMZ にコピーする。
+    variants を指定した場合は 1 回の解析から各バリエーションの KMZ をまとめて出力する
+    （parse_variant_spec の戻り値。常にメモリ上で処理）。
+    cache (kmz_cache.ConversionCache) を指定した場合、入力と設定が同じ出力はキャッシュから返す。
+    streaming=True の場合はテンプレートを iterparse で 1 Placemark ずつ変換して書き出す
+    （大規模テンプレート向け。メモリ使用量がウェイポイント数によらずほぼ一定）。
+    pretty_print=False の場合は template.kml をインデントせずに書き出す（出力が小さく、書き出しも速い）。
+    cancel (threading.Event) がセットされると処理の区切りで中止する（ConversionResult.cancelled）。
+    missions (MissionCache) を指定した場合、同じ KMZ の読み込み・解析結果を再利用する
+    （設定だけを変えて変換し直す用。streaming=True の場合は使わない）。
+    aircraft（wpml_estimate.AircraftLimits。None なら既定値）は見積りとアクションの調整に使う機体の性能値。
+    estimate=True の場合は変換後のミッションの飛行時間を aircraft で見積もり、
+    ログと <出力 KMZ 名>.estimate.json に書き出す。
+    prune_actions=True の場合は前のウェイポイントと同じ値のジンバル・ズーム・ヨーのアクションを削除する。
+    parallel_actions=True の場合は機体ヨー・ジンバル・ズームのアクションを同時に実行するグループにまとめ、
+    撮影はその完了を待って行う（見積りは並列グループを考慮した停止点の待ち時間になる）。
+    adaptive_hover=True の場合は各点のホバリング時間を、前の点からのジンバル・機体ヨー・ズームの変化量と
+    aircraft の settle_*_rate から求めた静定時間（hover_time が上限）にする。
+    エラーはログに出した上で送出する。
+    """
+    if log is None:
+        log = NullLog()
+    opts = {
+        "do_photo": do_photo, "do_video": do_video,
+        "do_gimbal": do_gimbal, "gimbal_pitch_angle": gimbal_pitch_angle,
+        "gimbal_pitch_mode": gimbal_pitch_mode,
+        "yaw_fix": yaw_fix, "yaw_angle": yaw_angle, "yaw_mode": yaw_mode,
+        "speed": speed, "sensor_modes": list(sensor_modes), "hover_time": hover_time,
+        "zoom_ratio": zoom_ratio, "zoom_mode": zoom_mode,
+        "heading_mode": heading_mode, "wp_stop_mode": wp_stop_mode,
+        "aircraft": aircraft or wpe.AircraftLimits(),
+        "estimate": estimate,
+        "prune_actions": prune_actions,
+        "parallel_actions": parallel_actions,
+        "adaptive_hover": adaptive_hover,
+    }
+    result = ConversionResult(path)
+    started = time.perf_counter()
+
+    try:
+        check_cancel(cancel)
+        log.insert(END, f"=== 処理開始: {os.path.basename(path)} ===\n")
+
+        # キャッシュ確認: 出力済みのバリエーションは変換しない
+        cache_keys = {}
+        todo = variants or [{}]
+        if cache is not None:
+            input_digest = file_sha256(path)
+            remaining = []
+            for v in todo:
+                vo = dict(opts, **v)
+                out_kmz = output_kmz_path(path, vo["do_photo"], vo["do_video"], vo["sensor_modes"])
+                key = make_cache_key(input_digest, dict(vo, keep_res=keep_res, pretty_print=pretty_print))
+                if cache.fetch(key, out_kmz):
+                    log.insert(END, f"キャッシュから出力: {os.path.basename(out_kmz)}\n")
+                    # 見積りはキャッシュに無いので、出力した KMZ から見積もり直す
+                    if vo["estimate"]:
+                        report_estimates(out_kmz, estimate_kmz(out_kmz, vo["aircraft"]), log)
+                    result.outputs.append(out_kmz)
+                    result.cached.append(out_kmz)
+                else:
+                    cache_keys[out_kmz] = key
+                    remaining.append(v)
+            todo = remaining
+
+        if todo:
+            converted = convert_kmz_file(path, opts, log, in_memory, keep_res,
+                                         todo if variants else None, streaming, pretty_print, cancel,
+                                         missions)
+            for out_kmz in converted:
+                if out_kmz in cache_keys:
+                    cache.store(cache_keys[out_kmz], out_kmz)
+            result.outputs.extend(converted)
+
+        for out_kmz in result.outputs:
+            log.insert(END, f"最終KMZ: {out_kmz}\n")
+        log.insert(END, "=== 処理完了 ===\n\n")
+
+    except ConversionCancelled:
+        log.insert(END, f"=== 中止: {os.path.basename(path)} ===\n\n")
+        result.cancelled = True
+
+    except Exception as e:
+        log.insert(END, f"エラー: {e}\n\n")
+        raise
+
+    result.elapsed = time.perf_counter() - started
+    return result
+
+# --- ディレクトリ一括変換（プロセス並列） -----------------------------------
+
+def available_cpus():
+    """このプロセスが使える CPU 数"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+@dataclass(slots=True)
+class BatchReport:
+    """convert_batch の集計結果"""
+    results: list = field(default_factory=list)   # 変換できたファイルの ConversionResult（入力順）
+    failures: list = field(default_factory=list)  # 変換できなかったファイルの (入力 KMZ, エラー内容)
+    skipped: int = 0                              # 除外したこのツールの出力 KMZ の数
+    elapsed: float = 0.0                          # 全体の処理時間（秒）
+
+    @property
+    def ok(self):
+        return not self.failures
+
+    def summary(self):
+        """集計結果の文字列（失敗したファイルとエラー内容を含む）"""
+        outputs = sum(len(r.outputs) for r in self.results)
+        cached = sum(len(r.cached) for r in self.results)
+        lines = [f"一括変換: 成功 {len(self.results)} 件（出力 {outputs} 件、うちキャッシュ {cached} 件）、"
+                 f"失敗 {len(self.failures)} 件、{self.elapsed:.1f} 秒"]
+        if self.skipped:
+            lines.append(f"出力済み KMZ を除外: {self.skipped} 件")
+        for path, error in self.failures:
+            lines.append(f"失敗: {path}: {error}")
+        return "\n".join(lines) + "\n"
+
+def _convert_in_worker(path, settings, log_detail):
+    """
+    ワーカープロセスで 1 ファイルを変換する。
+    log_detail: None ならログを取らない。True / False はウェイポイント毎の詳細を含めるか。
+    戻り値: (ConversionResult or None, エラー内容 or None, BufferedLog or None)
+    """
+    log = BufferedLog(log_detail) if log_detail is not None else None
+    try:
+        return convert_kmz(path, log=log, **settings), None, log
+    except Exception as e:
+        return None, str(e), log
+
+def convert_batch(paths, log=None, workers=None, log_detail=True, **settings):
+    """
+    KMZ ファイル・フォルダ（再帰的に探し、このツールの出力 KMZ は除く）をまとめて変換する。
+    ファイル毎に別プロセスで convert_kmz を実行する（lxml の要素操作は GIL を手放さないため、
+    スレッドでは並列にならない）。
+    • workers: プロセス数（既定: 使える CPU 数。1 なら現在のプロセスで順に変換）
+    • settings: convert_kmz の設定（cache も可。各プロセスが同じキャッシュフォルダを使う）
+    • log には各ファイルのログを、終わった順にファイル単位でまとめて書き出す
+      （log_detail=False ならウェイポイント毎の詳細はワーカーから送らない）
+    個々のファイルのエラーは送出せず、BatchReport.failures に集める。
+    """
+    started = time.perf_counter()
+    kmz_paths, skipped = collect_kmz_paths(paths)
+    report = BatchReport(skipped=skipped)
+    workers = min(workers or available_cpus(), max(len(kmz_paths), 1))
+
+    outcomes = {}
+    if workers == 1:
+        for path in kmz_paths:
+            try:
+                outcomes[path] = (convert_kmz(path, log=log, **settings), None)
+            except Exception as e:
+                outcomes[path] = (None, str(e))
+    else:
+        capture = None if log is None else bool(log_detail)
+        ex = ProcessPoolExecutor(max_workers=workers)
+        try:
+            futures = {ex.submit(_convert_in_worker, path, settings, capture): path for path in kmz_paths}
+            for fut in as_completed(futures):
+                result, error, buffered = fut.result()
+                if buffered is not None:
+                    buffered.replay(log)
+                    log.see(END)
+                outcomes[futures[fut]] = (result, error)
+        except BaseException:
+            # Ctrl+C などで中断したときは、まだ始まっていないファイルを取り消して待たずに戻る
+            ex.shutdown(wait=False, cancel_futures=True)
+            raise
+        ex.shutdown()
+
+    for path in kmz_paths:
+        result, error = outcomes[path]
+        if error is None:
+            report.results.append(result)
+        else:
+            report.failures.append((path, error))
+    report.elapsed = time.perf_counter() - started
+    return report
+
+# --- 飛行シミュレーション ------------------------------------------------------
+
+def simulate_kmz(path, aircraft=None, log=None):
+    """
+    KMZ（通常は変換後のもの）の各テンプレートを変換せずに wpml_simulate で再生する。
+    aircraft は wpml_estimate.AircraftLimits（None なら既定値）。
+    戻り値: [(テンプレート名, wpml_simulate.Timeline), ...]
+    """
+    if log is None:
+        log = NullLog()
+    with zipfile.ZipFile(path, "r") as zf:
+        templates = read_templates_from_kmz(zf)
+    if not templates:
+        raise FileNotFoundError("template.kml が見つかりませんでした。")
+
+    timelines = []
+    for kml, tree in templates:
+        mission = wm.parse_mission(tree)
+        plans = [wpe.plan_waypoint(wp, mission) for wp in mission.waypoints]
+        timeline = wps.simulate_mission(plans, mission.turn_mode, aircraft)
+        log.insert(END, f"-- {os.path.basename(kml)}\n{timeline.summary()}")
+        timelines.append((kml, timeline))
+    return timelines
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+kmz_options.py
+
+変換設定の選択肢・既定値と、出力ファイル名・入力パスの扱い。
+lxml や変換処理を読み込まないので、GUI（GUI69.py）と CLI（kmzconv.py）が起動時に読み込んでも軽い。
+変換処理本体（kmz_converter）は最初の変換時に読み込む。kmz_converter からも同じ名前で使える。
+"""
+
+import os
+import re
+
+# --- 定数 ------------------------------------------------------------------
+
+SENSOR_MODES = ["Wide", "Zoom", "IR"]
+
+# 出力ファイル名・バリエーション指定で使うセンサー略称
+SENSOR_CODES = {"W": "Wide", "Z": "Zoom", "IR": "IR"}
+
+# バリエーション一括出力の初期値
+DEFAULT_VARIANT_SPEC = "W,Z,WZ,IR"
+
+# 同時に変換するジョブ・バリエーション数の上限（ジョブ毎にスレッドを増やさない）
+MAX_WORKERS = min(4, os.cpu_count() or 1)
+
+# フォルダから KMZ を集めるときに除外する、このツールの出力 KMZ（<元ファイル名>_<モード>[_<センサー略称>].kmz）
+OUTPUT_KMZ_PATTERN = re.compile(r"_(Photo|Video|None)(_(W|Z|IR)+)?\.kmz$", re.IGNORECASE)
+
+# 機体ヘディング制御モード → 表示名（GUI の選択肢とログで使う）
+HEADING_MODE_NAMES = {
+    "follow_gimbal": "次の撮影方向を向く",
+    "follow_wayline": "飛行方向を向く",
+    "original": "元の設定を維持",
+    "manually": "手動モード",
+}
+
+# --- 入力パス・バリエーション指定 --------------------------------------------
+
+def collect_kmz_paths(paths):
+    """
+    ドロップされたパスを KMZ ファイルのリストにする（重複は除く）。
+    フォルダは再帰的に探し、このツールの出力 KMZ は除外する（直接ドロップしたファイルはそのまま）。
+    戻り値: (KMZ パスのリスト, 除外した出力 KMZ の数)
+    """
+    found = []
+    skipped = 0
+    for p in paths:
+        if os.path.isdir(p):
+            for dirpath, dirnames, filenames in os.walk(p):
+                dirnames.sort()
+                for name in sorted(filenames):
+                    if not name.lower().endswith(".kmz"):
+                        continue
+                    if OUTPUT_KMZ_PATTERN.search(name):
+                        skipped += 1
+                    else:
+                        found.append(os.path.join(dirpath, name))
+        elif p.lower().endswith(".kmz"):
+            found.append(p)
+    return list(dict.fromkeys(found)), skipped
+
+def parse_variant_spec(spec, do_photo, do_video):
+    """
+    "W,Z,WZ,IR" や "Photo_WZ,Video_IR" 形式のバリエーション指定を解析する。
+    撮影モードの接頭辞 (Photo_/Video_/None_) が無い場合は do_photo / do_video を使う。
+    戻り値: [{"do_photo", "do_video", "sensor_modes"}, ...]（重複は除く）
+    """
+    variants = []
+    seen = set()
+    for token in spec.replace(" ", "").split(","):
+        if not token:
+            continue
+        photo, video = do_photo, do_video
+        mode, sep, codes = token.rpartition("_")
+        if sep:
+            mode = mode.lower()
+            if mode == "photo":
+                photo, video = True, False
+            elif mode == "video":
+                photo, video = False, True
+            elif mode == "none":
+                photo, video = False, False
+            else:
+                raise ValueError(f"不明な撮影モード: {token}")
+
+        sensors = set()
+        rest = codes.upper()
+        while rest:
+            code = next((c for c in SENSOR_CODES if rest.startswith(c)), None)
+            if code is None:
+                raise ValueError(f"不明なセンサー指定: {token}")
+            sensors.add(SENSOR_CODES[code])
+            rest = rest[len(code):]
+        sensor_modes = [m for m in SENSOR_MODES if m in sensors]
+
+        key = (photo, video, tuple(sensor_modes))
+        if key in seen:
+            continue
+        seen.add(key)
+        variants.append({"do_photo": photo, "do_video": video, "sensor_modes": sensor_modes})
+    return variants
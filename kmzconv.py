@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+kmzconv.py
+
+KMZ 変換のコマンドライン版（画面の無いサーバー・cron・バッチスクリプト用）。
+変換は kmz_converter で行い、tkinter / tkinterdnd2 は読み込まない。
+
+使い方:
+    python kmzconv.py convert --photo --sensors WZ --speed 12 *.kmz
+    python kmzconv.py convert --variants Photo_WZ,Video_IR -v missions/
+    python kmzconv.py simulate --actual 27:40 --csv mission_Photo_WZ.kmz
+• 設定の既定値は GUI の初期設定と同じ
+• フォルダを指定した場合は再帰的に KMZ を探す（フォルダ・ワイルドカードからはこのツールの出力 KMZ を除く）
+• ファイル毎に別プロセスで並列に変換する（-j でプロセス数。既定は CPU 数）
+• 出力 KMZ のパスを 1 行ずつ標準出力に、ログ（-v / -vv）と集計結果を標準エラー出力に書く
+• 終了コード: 0 = 成功、1 = 変換できなかったファイルがある、2 = 引数の誤り
+"""
+
+import os
+import sys
+import glob
+import argparse
+import multiprocessing
+
+from kmz_cache import DEFAULT_CACHE_DIR
+from kmz_options import HEADING_MODE_NAMES, OUTPUT_KMZ_PATTERN, collect_kmz_paths, parse_variant_spec
+
+# --- ログ出力 ---------------------------------------------------------------
+
+class StreamLog:
+    """ログをストリーム（標準エラー出力）に書き出す。verbose=False ならウェイポイント毎の詳細は捨てる"""
+
+    def __init__(self, stream, verbose=False):
+        self.stream = stream
+        self.verbose = verbose
+
+    def insert(self, index, text):
+        self.stream.write(text)
+
+    def detail(self, text):
+        if self.verbose:
+            self.stream.write(text)
+
+    def see(self, index):
+        self.stream.flush()
+
+# --- 引数 ------------------------------------------------------------------
+
+def original_or_number(text):
+    """"original" なら None、それ以外は数値（argparse の type）"""
+    if text.lower() == "original":
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"original か数値を指定してください: {text}")
+
+def sensor_list(text):
+    """"WZ" や "WZIR" のセンサー略称をセンサー名のリストにする（argparse の type）"""
+    try:
+        variants = parse_variant_spec(text, False, False) if "," not in text and "_" not in text else []
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    if len(variants) != 1:
+        raise argparse.ArgumentTypeError(f"センサーは W / Z / IR を続けて指定してください（例: WZ）: {text}")
+    return variants[0]["sensor_modes"]
+
+def duration(text):
+    """「秒」「分:秒」「時:分:秒」を秒数にする（argparse の type）"""
+    try:
+        seconds = 0.0
+        for part in text.split(":"):
+            seconds = seconds * 60 + float(part)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"秒、分:秒 または 時:分:秒 で指定してください: {text}")
+    return seconds
+
+def limit_setting(text):
+    """「名前=値」を (名前, 値) にする（argparse の type。名前は AircraftLimits の項目）"""
+    name, sep, value = text.partition("=")
+    try:
+        if not sep:
+            raise ValueError
+        return name.strip().replace("-", "_"), float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"名前=値 で指定してください（例: acceleration=2.5）: {text}")
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="kmzconv", description="DJI WPML（KMZ）ルート変換")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    conv = sub.add_parser("convert", help="KMZ を変換する",
+                          description="KMZ を変換して <元ファイル名>_<モード>_<センサー>.kmz を同じフォルダに出力する。")
+    conv.add_argument("paths", nargs="+", metavar="PATH", help="KMZ ファイルまたはフォルダ（ワイルドカード可）")
+
+    mode = conv.add_mutually_exclusive_group()
+    mode.add_argument("--photo", action="store_true", help="写真撮影")
+    mode.add_argument("--video", action="store_true", help="動画撮影")
+    conv.add_argument("--sensors", type=sensor_list, default=[], metavar="CODES",
+                      help="使用センサー（W / Z / IR を続けて指定。例: WZ）")
+    conv.add_argument("--speed", type=int, default=15, help="速度 1–15 m/s（既定: 15）")
+    conv.add_argument("--gimbal-pitch", type=original_or_number, default=None, metavar="ANGLE",
+                      help="撮影時のジンバルピッチ角（original = 元の角度維持。既定）")
+    conv.add_argument("--yaw", type=original_or_number, metavar="ANGLE", default=argparse.SUPPRESS,
+                      help="撮影時の機体ヨー角（original = 元の角度維持、または角度。省略時は変更しない）")
+    conv.add_argument("--zoom", type=original_or_number, default=None, metavar="RATIO",
+                      help="ズーム倍率（original = 元の設定を維持。既定）")
+    conv.add_argument("--heading", choices=list(HEADING_MODE_NAMES), default="follow_gimbal",
+                      help="ウェイポイント間の機体ヘディング（既定: follow_gimbal）")
+    conv.add_argument("--hover", type=float, default=0, metavar="SECONDS", help="ホバリング時間（秒）")
+    conv.add_argument("--adaptive-hover", action="store_true",
+                      help="ホバリング時間を各点のジンバル・機体ヨー・ズームの変化量に合わせて短くする（--hover が上限）")
+    conv.add_argument("--no-stop", action="store_true", help="ウェイポイントで停止しない")
+    conv.add_argument("--variants", metavar="SPEC",
+                      help="バリエーション一括出力（例: W,Z,WZ,IR / Photo_WZ,Video_IR）")
+
+    conv.add_argument("--streaming", action="store_true", help="ストリーミング処理（大規模テンプレート向け）")
+    conv.add_argument("--on-disk", action="store_true", help="作業フォルダに展開して処理する")
+    conv.add_argument("--keep-res", action="store_true", help="res フォルダを保持")
+    conv.add_argument("--compact", action="store_true", help="template.kml を整形せずに出力")
+    conv.add_argument("--prune-actions", action="store_true",
+                      help="前のウェイポイントと同じ値のジンバル・ズーム・ヨーのアクションを省く")
+    conv.add_argument("--parallel-actions", action="store_true",
+                      help="機体ヨー・ジンバル・ズームを同時に動かしてから撮影する（停止点の待ちを短くする）")
+    conv.add_argument("--no-estimate", action="store_true",
+                      help="飛行時間の見積り（<出力 KMZ 名>.estimate.json）を出力しない")
+    conv.add_argument("--battery", type=float, default=None, metavar="MINUTES",
+                      help="見積りに使う 1 バッテリーの飛行可能時間（分。既定: 30）")
+    conv.add_argument("--limit", type=limit_setting, action="append", default=[], metavar="NAME=VALUE",
+                      help="見積り・アクションの調整に使う機体の性能値を変更する（例: settle_gimbal_rate=30。"
+                           "複数指定可。項目は wpml_estimate.AircraftLimits）")
+    conv.add_argument("--no-cache", action="store_true", help="変換キャッシュを使わない")
+    conv.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="変換キャッシュの保存先")
+    conv.add_argument("-j", "--jobs", type=int, default=0, metavar="N",
+                      help="同時に変換するプロセス数（既定: CPU 数。1 なら順に変換）")
+    conv.add_argument("-v", "--verbose", action="count", default=0,
+                      help="ログを標準エラー出力に書く（-vv でウェイポイント毎の詳細も）")
+
+    sim = sub.add_parser("simulate", help="KMZ の飛行を再生して所要時間を見積もる",
+                         description="変換後の KMZ を運動学シミュレーションで再生し、所要時間を表示する"
+                                     "（加減速・旋回・機体とジンバルの回転・ホバリング・撮影を含む）。")
+    sim.add_argument("paths", nargs="+", metavar="KMZ", help="KMZ ファイル（ワイルドカード可。出力 KMZ も対象）")
+    sim.add_argument("--actual", type=duration, default=None, metavar="TIME",
+                     help="実際の飛行時間（秒、分:秒 または 時:分:秒）。指定した全 KMZ の合計と比較する")
+    sim.add_argument("--csv", action="store_true",
+                     help="タイムラインを <KMZ 名>.timeline.csv に書き出す")
+    sim.add_argument("--limit", type=limit_setting, action="append", default=[], metavar="NAME=VALUE",
+                     help="機体の性能値を変更する（例: acceleration=2.5 yaw_rate=45。複数指定可。"
+                          "項目は wpml_estimate.AircraftLimits）")
+    return parser
+
+def expand_paths(patterns):
+    """
+    引数のパスを KMZ のリストにする（シェルが展開しない環境向けにワイルドカードも展開）。
+    ワイルドカード・フォルダから見つけたこのツールの出力 KMZ は除く。
+    戻り値: (KMZ パスのリスト, 除外した出力 KMZ の数)
+    """
+    paths = []
+    skipped = 0
+    for p in patterns:
+        if any(c in p for c in "*?[") and not os.path.exists(p):
+            for match in sorted(glob.glob(p)):
+                if OUTPUT_KMZ_PATTERN.search(os.path.basename(match)):
+                    skipped += 1
+                else:
+                    paths.append(match)
+        else:
+            paths.append(p)
+    paths, found_skipped = collect_kmz_paths(paths)
+    return paths, skipped + found_skipped
+
+def conversion_settings(args):
+    """引数を convert_kmz の設定にする（GUI の get_params と同じ対応）"""
+    capture = args.photo or args.video
+    if not capture:
+        gimbal_pitch_mode = "none"
+    elif args.gimbal_pitch is None:
+        gimbal_pitch_mode = "original"
+    else:
+        gimbal_pitch_mode = "fixed"
+
+    yaw_fix = hasattr(args, "yaw")
+    yaw_angle = getattr(args, "yaw", None)
+    if not yaw_fix:
+        yaw_mode = "none"
+    elif yaw_angle is None:
+        yaw_mode = "original"
+    else:
+        yaw_mode = "fixed"
+
+    return {
+        "do_photo": args.photo,
+        "do_video": args.video,
+        "do_gimbal": gimbal_pitch_mode != "none",
+        "gimbal_pitch_angle": args.gimbal_pitch if capture else None,
+        "gimbal_pitch_mode": gimbal_pitch_mode,
+        "yaw_fix": yaw_fix,
+        "yaw_angle": yaw_angle,
+        "yaw_mode": yaw_mode,
+        "speed": max(1, min(15, args.speed)),
+        "sensor_modes": args.sensors,
+        "hover_time": max(0, args.hover),
+        "zoom_ratio": args.zoom,
+        "zoom_mode": "original" if args.zoom is None else "fixed",
+        "heading_mode": args.heading,
+        "wp_stop_mode": "continuous" if args.no_stop else "stop",
+        "in_memory": not args.on_disk,
+        "keep_res": args.keep_res,
+        "streaming": args.streaming,
+        "pretty_print": not args.compact,
+        "estimate": not args.no_estimate,
+        "prune_actions": args.prune_actions,
+        "parallel_actions": args.parallel_actions,
+        "adaptive_hover": args.adaptive_hover,
+    }
+
+def aircraft_limits(parser, limits, **values):
+    """--limit の (名前, 値) のリストと values から AircraftLimits を作る（不明な名前は parser.error）"""
+    from dataclasses import fields, replace
+    from wpml_estimate import AircraftLimits
+
+    names = {f.name for f in fields(AircraftLimits)}
+    unknown = [name for name, _ in limits if name not in names]
+    if unknown:
+        parser.error(f"不明な性能値: {', '.join(unknown)}（{', '.join(sorted(names))}）")
+    return replace(AircraftLimits(), **{**values, **dict(limits)})
+
+# --- コマンド ---------------------------------------------------------------
+
+def cmd_convert(args, parser):
+    # 変換処理（lxml を含む）は変換するときだけ読み込む（-h などを速くするため）
+    from kmz_cache import ConversionCache
+    from kmz_converter import convert_batch
+
+    settings = conversion_settings(args)
+    if args.variants:
+        try:
+            settings["variants"] = parse_variant_spec(args.variants, args.photo, args.video)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.battery is not None and args.battery <= 0:
+        parser.error("--battery には正の分数を指定してください。")
+    if args.battery is not None or args.limit:
+        battery = {} if args.battery is None else {"battery_time": args.battery * 60}
+        settings["aircraft"] = aircraft_limits(parser, args.limit, **battery)
+
+    paths, skipped = expand_paths(args.paths)
+    if not paths:
+        parser.error("KMZ ファイルが見つかりませんでした。")
+
+    if not args.no_cache:
+        settings["cache"] = ConversionCache(args.cache_dir)
+    log = StreamLog(sys.stderr, args.verbose >= 2) if args.verbose else None
+
+    report = convert_batch(paths, log, max(args.jobs, 0) or None, args.verbose >= 2, **settings)
+    for result in report.results:
+        for out_kmz in result.outputs:
+            print(out_kmz)
+    report.skipped += skipped
+    sys.stderr.write(report.summary())
+    return 0 if report.ok else 1
+
+def cmd_simulate(args, parser):
+    from kmz_converter import simulate_kmz
+
+    aircraft = aircraft_limits(parser, args.limit)
+
+    paths = []
+    for p in args.paths:
+        if any(c in p for c in "*?[") and not os.path.exists(p):
+            paths.extend(sorted(glob.glob(p)))
+        else:
+            paths.append(p)
+    if not paths:
+        parser.error("KMZ ファイルが見つかりませんでした。")
+
+    total = 0.0
+    failed = 0
+    for path in paths:
+        try:
+            timelines = simulate_kmz(path, aircraft)
+        except Exception as e:
+            print(f"エラー: {path}: {e}", file=sys.stderr)
+            failed += 1
+            continue
+        print(f"=== {path} ===")
+        for n, (kml, timeline) in enumerate(timelines):
+            if len(timelines) > 1:
+                print(f"-- {kml}")
+            sys.stdout.write(timeline.summary())
+            total += timeline.total_time
+            if args.csv:
+                suffix = f".{n}" if len(timelines) > 1 else ""
+                print(f"タイムライン: {timeline.write_csv(os.path.splitext(path)[0] + suffix + '.timeline.csv')}")
+
+    if args.actual is not None:
+        from wpml_simulate import compare_durations
+        sys.stdout.write(compare_durations(total, args.actual))
+    return 1 if failed else 0
+
+def main(argv=None):
+    # exe 化した場合にワーカープロセスとして起動されたときの処理
+    multiprocessing.freeze_support()
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        if args.command == "convert":
+            return cmd_convert(args, parser)
+        if args.command == "simulate":
+            return cmd_simulate(args, parser)
+    except KeyboardInterrupt:
+        print("中断しました。", file=sys.stderr)
+        return 130
+
+if __name__ == "__main__":
+    sys.exit(main())
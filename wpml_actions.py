@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+wpml_actions.py
+
+WPML アクション（wpml:action / wpml:actionGroup）のプロトタイプ複製ファクトリ。
+• アクション種別ごとにサブツリーを 1 回だけ組み立て、以後は deepcopy して可変項目だけ書き換える
+• SubElement を 10 数回呼ぶより 3 倍程度速い（大きなルートでの再生成が主な対象）
+• GUI69 と archive の動画スクリプト（movie4 など）の両方から使う
+
+使い方:
+    from wpml_actions import GIMBAL_ROTATE, HOVER, new_action_group
+    ag = new_action_group(pm, idx)
+    GIMBAL_ROTATE.make(ag, gimbalPitchRotateEnable="1", gimbalPitchRotateAngle="-90")
+    HOVER.make(ag, hoverTime="2")
+
+独自のアクションは action_template() で作る（同じ定義は 1 回だけ組み立てられる）:
+    VIDEO_START = action_template("startRecordVideo",
+                                  [("payloadPositionIndex", "0"), ("videoType", "zoom")])
+"""
+
+import copy
+from functools import lru_cache
+from lxml import etree
+
+# --- 定数 ------------------------------------------------------------------
+
+WPML_NS = "http://www.dji.com/wpmz/1.0.6"
+WPML = f"{{{WPML_NS}}}"
+
+# プロトタイプにも wpml 接頭辞を付けておく（テンプレートへ追加したとき冗長な xmlns が残らない）
+_NSMAP = {"wpml": WPML_NS}
+
+# --- アクション --------------------------------------------------------------
+
+class ActionTemplate:
+    """
+    1 種類のアクションのプロトタイプ。
+    構造: action / (actionId, actionActuatorFunc, actionActuatorFuncParam / 各パラメータ)
+    params は ((パラメータ名, 既定値), ...)。
+    """
+
+    __slots__ = ("func", "params", "proto", "slots")
+
+    def __init__(self, func, params):
+        self.func = func
+        self.params = tuple(params)
+        self.proto = etree.Element(WPML + "action", nsmap=_NSMAP)
+        etree.SubElement(self.proto, WPML + "actionId").text = "0"
+        etree.SubElement(self.proto, WPML + "actionActuatorFunc").text = func
+        p = etree.SubElement(self.proto, WPML + "actionActuatorFuncParam")
+        # パラメータ名 → actionActuatorFuncParam 内の位置
+        self.slots = {}
+        for i, (tag, default) in enumerate(params):
+            etree.SubElement(p, WPML + tag).text = default
+            self.slots[tag] = i
+
+    def make(self, parent=None, action_id=None, **values):
+        """
+        プロトタイプを複製し、指定パラメータのテキストだけ書き換える。
+        parent を渡すと末尾に追加する。値は文字列化済みのものを渡すこと。
+        """
+        act = copy.deepcopy(self.proto)
+        if action_id is not None:
+            act[0].text = str(action_id)
+        if values:
+            p = act[2]
+            slots = self.slots
+            for tag, value in values.items():
+                p[slots[tag]].text = value
+        if parent is not None:
+            parent.append(act)
+        return act
+
+@lru_cache(maxsize=None)
+def _cached_template(func, params):
+    return ActionTemplate(func, params)
+
+def action_template(func, params):
+    """(func, [(パラメータ名, 既定値), ...]) のプロトタイプを返す。同じ定義は使い回す"""
+    return _cached_template(func, tuple((tag, str(default)) for tag, default in params))
+
+# --- GUI69 で使うアクション ------------------------------------------------------
+
+GIMBAL_ROTATE = action_template("gimbalRotate", [
+    ("gimbalRotateMode", "absoluteAngle"),
+    ("gimbalPitchRotateEnable", "0"),
+    ("gimbalPitchRotateAngle", "0"),
+    ("gimbalRollRotateEnable", "0"),
+    ("gimbalRollRotateAngle", "0"),
+    ("gimbalYawRotateEnable", "0"),
+    ("gimbalYawRotateAngle", "0"),
+    ("gimbalRotateTimeEnable", "0"),
+    ("gimbalRotateTime", "0"),
+    ("payloadPositionIndex", "0"),
+])
+
+ROTATE_YAW = action_template("rotateYaw", [
+    ("aircraftHeading", "0"),
+    ("aircraftPathMode", "counterClockwise"),
+])
+
+ZOOM = action_template("zoom", [
+    ("focalLength", "0"),
+    ("payloadPositionIndex", "0"),
+])
+
+HOVER = action_template("hover", [
+    ("hoverTime", "0"),
+])
+
+TAKE_PHOTO = action_template("takePhoto", [
+    ("fileSuffix", ""),
+    ("payloadPositionIndex", "0"),
+    ("useGlobalPayloadLensIndex", "1"),
+])
+
+START_RECORD = action_template("startRecord", [
+    ("payloadPositionIndex", "0"),
+])
+
+STOP_RECORD = action_template("stopRecord", [
+    ("payloadPositionIndex", "0"),
+])
+
+# --- アクショングループ ----------------------------------------------------------
+
+_GROUP_PROTO = etree.Element(WPML + "actionGroup", nsmap=_NSMAP)
+for _tag, _text in (("actionGroupId", "0"), ("actionGroupStartIndex", "0"),
+                    ("actionGroupEndIndex", "0"), ("actionGroupMode", "sequence")):
+    etree.SubElement(_GROUP_PROTO, WPML + _tag).text = _text
+etree.SubElement(etree.SubElement(_GROUP_PROTO, WPML + "actionTrigger"),
+                 WPML + "actionTriggerType").text = "reachPoint"
+del _tag, _text
+
+def new_action_group(parent, index, mode="sequence"):
+    """
+    reachPoint トリガーの actionGroup を作って parent の末尾に追加する。
+    actionGroupId / StartIndex / EndIndex はすべて index。
+    """
+    ag = copy.deepcopy(_GROUP_PROTO)
+    text = str(index)
+    ag[0].text = text
+    ag[1].text = text
+    ag[2].text = text
+    if mode != "sequence":
+        ag[3].text = mode
+    if parent is not None:
+        parent.append(ag)
+    return ag
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+wpml_estimate.py
+
+変換後のミッションの飛行時間・距離・上昇量の見積り（1 バッテリーで飛べるかの確認用）。
+• WaypointPlan: 見積りに使うウェイポイント 1 点分の情報（座標・速度・ヘディング設定・アクション）。
+  Placemark への参照を持たないので、ストリーミング変換でも全点分を保持できる
+• 区間の飛行時間は wpml_geometry の区間距離から配列でまとめて計算する
+  （停止する端点では加速・減速する台形速度、上昇・下降速度の上限も考慮）
+• ウェイポイントのアクション時間は、機体ヘディング・ジンバル・ズームの状態を追いながら 1 点ずつ計算する
+• 機体の性能値は AircraftLimits（既定値は M30 / M3E 程度の控えめな値）
+
+使い方:
+    plans = [plan_waypoint(wp, mission) for wp in mission.waypoints]
+    est = estimate_mission(plans, mission.turn_mode, AircraftLimits(battery_time=25 * 60))
+    print(est.summary())
+    write_estimate_json(path, [est])
+
+離陸地点から最初のウェイポイントまで、最後のウェイポイントから帰還までの飛行は含まない。
+"""
+
+import os
+import json
+from dataclasses import dataclass, field, asdict
+
+import numpy as np
+
+import wpml_geometry as geo
+
+# --- 定数 ------------------------------------------------------------------
+
+# ウェイポイントで停止するターンモード（これ以外は停止せずに通過する）
+STOP_TURN_MODES = ("toPointAndStopWithDiscontinuityCurvature", "toPointAndStopWithContinuityCurvature")
+
+# 停止しないターンモードでも、通過中に実行できず停止して待つアクション
+BLOCKING_ACTIONS = ("hover",)
+
+# 速度の設定が無い区間の速度（m/s）
+DEFAULT_SPEED = 10.0
+
+# --- 機体の性能値 ------------------------------------------------------------
+
+@dataclass(frozen=True, slots=True)
+class AircraftLimits:
+    """見積りに使う機体の性能値（時間は秒、速度は m/s、角速度は °/s）"""
+    acceleration: float = 2.0       # 水平加速度・減速度（m/s²）
+    ascent_speed: float = 6.0       # 最大上昇速度
+    descent_speed: float = 5.0      # 最大下降速度
+    yaw_rate: float = 60.0          # 機体ヨー回転速度（rotateYaw）
+    gimbal_rate: float = 60.0       # ジンバル回転速度（gimbalRotate）
+    gimbal_settle: float = 0.5      # ジンバル回転後の静定時間（wpml_simulate のみ）
+    lateral_acceleration: float = 3.0   # 旋回時の横加速度（m/s²。wpml_simulate のみ）
+    turn_damping: float = 5.0       # 停止しないターンモードで旋回を始める距離（m。wpml_simulate のみ）
+    zoom_time: float = 1.0          # ズーム倍率変更の所要時間
+    photo_latency: float = 1.0      # 撮影 1 回の所要時間（takePhoto）
+    record_latency: float = 0.5     # 録画開始・停止の所要時間
+    settle_yaw_rate: float = 90.0   # 機体ヨーの回転量 ÷ この値 = 静定に必要なホバリング時間（°/s。adaptive_hover）
+    settle_gimbal_rate: float = 45.0    # ジンバルの回転量 ÷ この値 = 同上（°/s）
+    settle_zoom_rate: float = 1.0   # 焦点距離の変化の段数（2 倍 = 1 段）÷ この値 = 同上（段/s）
+    battery_time: float = 30 * 60   # 1 バッテリーの飛行可能時間
+    battery_reserve: float = 0.2    # 帰還・着陸用に残すバッテリーの割合
+
+    @property
+    def usable_time(self):
+        """ミッションに使える時間（秒）"""
+        return self.battery_time * (1.0 - self.battery_reserve)
+
+# --- 入力 ------------------------------------------------------------------
+
+@dataclass(slots=True)
+class WaypointPlan:
+    """見積り用のウェイポイント 1 点分（値が無い項目は None）"""
+    index: int
+    lon: float | None
+    lat: float | None
+    height: float | None
+    speed: float | None             # この点から次の点までの速度
+    heading_mode: str | None        # この点から次の点までの機体ヘディング（ローカル設定、無ければグローバル）
+    heading_angle: float | None
+    actions: tuple = ()             # wpml_model.Action（全アクショングループを順に並べたもの）
+    groups: tuple = ()              # actions の区切り ((actionGroupMode, アクション数), ...)。空なら全て順に実行
+
+def _float(text):
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return None
+
+def plan_waypoint(wp, mission):
+    """
+    変換後の wpml_model.Waypoint を WaypointPlan にする。
+    mission は速度・ヘディングのグローバル設定を読む wpml_model.Mission（骨格だけのものでも可）。
+    """
+    heading = wp.heading if wp.heading is not None else mission.heading
+    speed = _float(wp.speed) if wp.use_global_speed != "1" else None
+    if speed is None:
+        speed = _float(mission.auto_flight_speed)
+    return WaypointPlan(
+        wp.index, wp.lon, wp.lat,
+        _float(wp.height if wp.height is not None else wp.ellipsoid_height),
+        speed,
+        heading.mode if heading is not None else None,
+        _float(heading.angle) if heading is not None else None,
+        tuple(wp.actions()),
+        tuple((group.mode, len(group.actions)) for group in wp.action_groups),
+    )
+
+def action_param(action, name):
+    """アクションのパラメータ値（Action.of で作ったものはプロトタイプの既定値も見る。無ければ None）"""
+    value = action.params.get(name)
+    if value is None and action.template is not None:
+        value = dict(action.template.params).get(name)
+    return value
+
+# --- 結果 ------------------------------------------------------------------
+
+@dataclass(slots=True)
+class SegmentEstimate:
+    """区間 1 つ分（start → end のウェイポイント index）"""
+    start: int
+    end: int
+    distance: float     # 3 次元距離（m）
+    climb: float        # 高度変化（m。上昇が正）
+    speed: float        # 設定速度（m/s）
+    time: float         # 飛行時間（秒）
+
+@dataclass(slots=True)
+class WaypointEstimate:
+    """ウェイポイント 1 点分のアクション時間"""
+    index: int
+    stop: bool                                      # 停止するか
+    action_time: float = 0.0                        # アクションの待ち時間（秒。parallel のグループは最長のアクション分）
+    sequential_time: float = 0.0                    # 全アクションを順に実行した場合の待ち時間（秒）
+    actions: dict = field(default_factory=dict)     # actionActuatorFunc → 時間（秒）
+
+@dataclass(slots=True)
+class MissionEstimate:
+    """estimate_mission の結果"""
+    limits: AircraftLimits
+    turn_mode: str | None
+    waypoints: list = field(default_factory=list)   # WaypointEstimate
+    segments: list = field(default_factory=list)    # SegmentEstimate
+    distance: float = 0.0
+    climb: float = 0.0
+    descent: float = 0.0
+    flight_time: float = 0.0
+    action_time: float = 0.0
+    sequential_time: float = 0.0    # 全アクションを順に実行した場合の action_time
+
+    @property
+    def total_time(self):
+        return self.flight_time + self.action_time
+
+    @property
+    def fits_battery(self):
+        return self.total_time <= self.limits.usable_time
+
+    def summary(self):
+        """ログ用の概要（複数行）"""
+        usable = self.limits.usable_time
+        lines = [f"飛行時間見積り: 合計 {format_minutes(self.total_time)}"
+                 f"（飛行 {format_minutes(self.flight_time)}, アクション {format_minutes(self.action_time)}）",
+                 f"距離 {self.distance:.0f}m, 上昇 {self.climb:.0f}m, 下降 {self.descent:.0f}m, "
+                 f"ウェイポイント {len(self.waypoints)} 点"]
+        dwell = [w.action_time for w in self.waypoints if w.stop]
+        if self.sequential_time > self.action_time and dwell:
+            lines.append(f"並列実行: アクション {format_minutes(self.sequential_time)} → "
+                         f"{format_minutes(self.action_time)}（停止点の待ち 平均 {np.mean(dwell):.1f}秒, "
+                         f"最大 {max(dwell):.1f}秒）")
+        if usable > 0:
+            verdict = "収まる" if self.fits_battery else "収まらない"
+            lines.append(f"1 バッテリー（使用可能 {format_minutes(usable)}）に{verdict}"
+                         f"（{self.total_time / usable * 100:.0f}%）")
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self):
+        return {
+            "aircraft": asdict(self.limits),
+            "turn_mode": self.turn_mode,
+            "total": {
+                "distance_m": round(self.distance, 1),
+                "climb_m": round(self.climb, 1),
+                "descent_m": round(self.descent, 1),
+                "flight_time_s": round(self.flight_time, 1),
+                "action_time_s": round(self.action_time, 1),
+                "sequential_action_time_s": round(self.sequential_time, 1),
+                "total_time_s": round(self.total_time, 1),
+                "usable_battery_time_s": round(self.limits.usable_time, 1),
+                "fits_battery": self.fits_battery,
+            },
+            "segments": [asdict(s) for s in self.segments],
+            "waypoints": [asdict(w) for w in self.waypoints],
+        }
+
+def format_minutes(seconds):
+    m, s = divmod(int(round(seconds)), 60)
+    return f"{m}分{s:02d}秒"
+
+# --- 見積り ------------------------------------------------------------------
+
+def segment_times(distances, climbs, speeds, stop_start, stop_end, limits):
+    """
+    区間の飛行時間（配列でまとめて計算）。
+    停止する端点では limits.acceleration で加速・減速し、短い区間は設定速度に達しない（台形・三角形速度）。
+    上昇・下降速度の上限を超える区間は、高度変化にかかる時間とする。
+    """
+    a = limits.acceleration
+    v = np.maximum(speeds, 0.1)
+    ends = stop_start.astype(float) + stop_end.astype(float)   # 停止する端点の数（0〜2）
+
+    # 加速・減速に使う距離と、その分の余計な時間（停止端 1 つあたり v / 2a）
+    ramp = ends * v * v / (2 * a)
+    cruise = distances / v + ends * v / (2 * a)
+    # 設定速度に達しない区間（三角形速度）
+    short = np.sqrt(2 * ends * distances / a)
+    times = np.where(distances >= ramp, cruise, short)
+
+    vertical = np.where(climbs >= 0, climbs / limits.ascent_speed, -climbs / limits.descent_speed)
+    return np.maximum(times, vertical)
+
+def action_times(plans, headings, stops, limits):
+    """
+    各ウェイポイントのアクション時間を、機体ヘディング・ジンバル・ズームの状態を追いながら計算する。
+    headings は各点に到着したときの機体ヘディング（不明なら None = 直前の向きのまま）。
+    停止しない点では BLOCKING_ACTIONS だけを数える（他は通過中に実行する）。
+    待ち時間は WaypointPlan.groups の parallel のグループを最長のアクション分とする（group_time）。
+    """
+    heading = gimbal_pitch = gimbal_yaw = focal_length = None
+    estimates = []
+    for plan, arrival, stop in zip(plans, headings, stops):
+        if arrival is not None:
+            heading = arrival
+        est = WaypointEstimate(plan.index, bool(stop))
+        times = []
+        for action in plan.actions:
+            func = action.func
+            t = 0.0
+            if func == "rotateYaw":
+                target = _float(action_param(action, "aircraftHeading"))
+                if target is not None:
+                    if heading is not None:
+                        t = yaw_travel(heading, target, action_param(action, "aircraftPathMode")) / limits.yaw_rate
+                    heading = target
+            elif func == "gimbalRotate":
+                moves = []
+                if action_param(action, "gimbalPitchRotateEnable") == "1":
+                    pitch = _float(action_param(action, "gimbalPitchRotateAngle"))
+                    if pitch is not None:
+                        if gimbal_pitch is not None:
+                            moves.append(abs(pitch - gimbal_pitch))
+                        gimbal_pitch = pitch
+                if action_param(action, "gimbalYawRotateEnable") == "1":
+                    yaw = _float(action_param(action, "gimbalYawRotateAngle"))
+                    if yaw is not None:
+                        if gimbal_yaw is not None:
+                            moves.append(abs(float(geo.angle_difference(yaw, gimbal_yaw))))
+                        gimbal_yaw = yaw
+                if action_param(action, "gimbalRotateTimeEnable") == "1":
+                    t = _float(action_param(action, "gimbalRotateTime")) or 0.0
+                elif moves:
+                    t = max(moves) / limits.gimbal_rate
+            elif func == "zoom":
+                focal = _float(action_param(action, "focalLength"))
+                if focal is not None and focal != focal_length:
+                    if focal_length is not None:
+                        t = limits.zoom_time
+                    focal_length = focal
+            elif func == "hover":
+                t = _float(action_param(action, "hoverTime")) or 0.0
+            elif func == "takePhoto":
+                t = limits.photo_latency
+            elif func in ("startRecord", "stopRecord"):
+                t = limits.record_latency
+
+            if not stop and func not in BLOCKING_ACTIONS:
+                t = 0.0
+            if t > 0:
+                est.actions[func] = est.actions.get(func, 0.0) + t
+            times.append(t)
+        est.sequential_time = sum(times)
+        est.action_time = group_time(times, plan.groups)
+        estimates.append(est)
+    return estimates
+
+def group_time(times, groups):
+    """アクション毎の時間 times をグループ毎にまとめた待ち時間（sequence は合計、parallel は最長）"""
+    if not groups:
+        return sum(times)
+    total = 0.0
+    start = 0
+    for mode, count in groups:
+        part = times[start:start + count]
+        start += count
+        if part:
+            total += max(part) if mode == "parallel" else sum(part)
+    return total
+
+def yaw_travel(current, target, path_mode):
+    """current から target まで path_mode（clockwise / counterClockwise）の向きに回る角度（度）"""
+    if path_mode == "clockwise":
+        return (target - current) % 360.0
+    if path_mode == "counterClockwise":
+        return (current - target) % 360.0
+    return abs(float(geo.angle_difference(target, current)))
+
+def arrival_headings(plans, bearings):
+    """
+    各点に到着したときの機体ヘディング。区間 i → i+1 の機体ヘディングは点 i の設定で決まる
+    （fixed / smoothTransition = 設定角度、followWayline = 進行方位、それ以外は不明）。
+    """
+    headings = [None]
+    for plan, bearing in zip(plans[:-1], bearings.tolist()):
+        if plan.heading_mode == "followWayline" and not np.isnan(bearing):
+            headings.append(bearing)
+        elif plan.heading_mode in ("fixed", "smoothTransition") and plan.heading_angle is not None:
+            headings.append(plan.heading_angle)
+        else:
+            headings.append(None)
+    return headings
+
+def waypoint_stops(plans, turn_mode):
+    """各点で停止するか（停止しないターンモードでも、最初・最後と待機アクションのある点は停止）"""
+    stop_all = turn_mode is None or turn_mode in STOP_TURN_MODES
+    stops = np.full(len(plans), stop_all)
+    if len(plans):
+        stops[0] = stops[-1] = True
+    if not stop_all:
+        for i, plan in enumerate(plans):
+            if any(a.func in BLOCKING_ACTIONS for a in plan.actions):
+                stops[i] = True
+    return stops
+
+def estimate_mission(plans, turn_mode, limits=None):
+    """
+    WaypointPlan のリスト（index 順）の飛行時間を見積もる。
+    turn_mode は globalWaypointTurnMode（STOP_TURN_MODES なら各点で停止、None も停止として扱う）。
+    """
+    limits = limits or AircraftLimits()
+    est = MissionEstimate(limits, turn_mode)
+    n = len(plans)
+    if n == 0:
+        return est
+
+    lon = np.array([np.nan if p.lon is None else p.lon for p in plans])
+    lat = np.array([np.nan if p.lat is None else p.lat for p in plans])
+    height = np.array([np.nan if p.height is None else p.height for p in plans])
+    speed = np.array([np.nan if p.speed is None else p.speed for p in plans])
+
+    stops = waypoint_stops(plans, turn_mode)
+    horizontal = np.nan_to_num(geo.haversine_distances(lon[:-1], lat[:-1], lon[1:], lat[1:]))
+    climbs = np.nan_to_num(np.diff(height))
+    distances = np.hypot(horizontal, climbs)
+    speeds = np.nan_to_num(speed[:-1], nan=DEFAULT_SPEED)
+    times = segment_times(distances, climbs, speeds, stops[:-1], stops[1:], limits)
+    bearings = geo.initial_bearings(lon[:-1], lat[:-1], lon[1:], lat[1:])
+
+    est.segments = [SegmentEstimate(a.index, b.index, d, c, s, t)
+                    for a, b, d, c, s, t in zip(plans[:-1], plans[1:], distances.tolist(), climbs.tolist(),
+                                                speeds.tolist(), times.tolist())]
+    est.waypoints = action_times(plans, arrival_headings(plans, bearings), stops.tolist(), limits)
+
+    est.distance = float(distances.sum())
+    est.climb = float(climbs[climbs > 0].sum())
+    est.descent = float(np.abs(climbs[climbs < 0]).sum())
+    est.flight_time = float(times.sum())
+    est.action_time = sum(w.action_time for w in est.waypoints)
+    est.sequential_time = sum(w.sequential_time for w in est.waypoints)
+    return est
+
+# --- 出力 ------------------------------------------------------------------
+
+def estimate_json_path(kmz_path):
+    """出力 KMZ の見積り JSON のパス（<出力 KMZ 名>.estimate.json）"""
+    return os.path.splitext(kmz_path)[0] + ".estimate.json"
+
+def write_estimate_json(path, estimates, kmz_path=None):
+    """テンプレート毎の見積り（MissionEstimate のリスト）を JSON に書き出す"""
+    data = {
+        "kmz": kmz_path,
+        "total_time_s": round(sum(e.total_time for e in estimates), 1),
+        "fits_battery": all(e.fits_battery for e in estimates),
+        "templates": [e.to_dict() for e in estimates],
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    return path
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+wpml_geometry.py
+
+ウェイポイント列の幾何計算（NumPy でまとめて計算する）。
+• MissionGeometry.from_waypoints で座標・高度・元の撮影姿勢を 1 回だけ配列に読み込む
+• 区間距離・方位・上昇量・撮影方向・角度の正規化を、ウェイポイント毎のループを使わずに配列で計算する
+• 値が無い項目は NaN（区間の配列は長さ n-1、i 番目は i → i+1 の区間）
+• 機体ヘディング制御（kmz_converter）と、飛行時間の見積りなどの解析はこの上に作る
+
+使い方:
+    geo = MissionGeometry.from_waypoints(mission.waypoints)
+    print(geo.segment_distances().sum(), geo.climbs().clip(min=0).sum())
+    directions = geo.next_shooting_directions()
+"""
+
+import numpy as np
+
+# --- 定数 ------------------------------------------------------------------
+
+# 地球半径（m）。archive の haversine（GUI42）と同じ値
+EARTH_RADIUS_M = 6378137.0
+
+# 短い区間とみなす距離（m）。GUI63 の DIST_THRESHOLD_DEG（5 m 相当）と同じ
+SHORT_SEGMENT_M = 5.0
+
+# --- 角度 ------------------------------------------------------------------
+
+def normalize_angle(angle):
+    """角度（度。スカラーまたは配列）を -180 < a <= 180 に正規化する"""
+    return 180.0 - np.mod(180.0 - np.asarray(angle, dtype=float), 360.0)
+
+def angle_difference(target, current):
+    """current から target への最短の回転角（度。正 = 時計回り、-180 < d <= 180）"""
+    return normalize_angle(np.subtract(target, current))
+
+# --- 距離・方位 ---------------------------------------------------------------
+
+def haversine_distances(lon1, lat1, lon2, lat2):
+    """2 点間の水平距離（m）。引数は度（スカラーまたは配列）"""
+    lon1, lat1, lon2, lat2 = map(np.radians, (lon1, lat1, lon2, lat2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def initial_bearings(lon1, lat1, lon2, lat2):
+    """1 点目から 2 点目への方位（度。北 = 0、東 = 90、-180 < b <= 180）"""
+    lon1, lat1, lon2, lat2 = map(np.radians, (lon1, lat1, lon2, lat2))
+    dlon = lon2 - lon1
+    y = np.sin(dlon) * np.cos(lat2)
+    x = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlon)
+    return normalize_angle(np.degrees(np.arctan2(y, x)))
+
+# --- ミッション ----------------------------------------------------------------
+
+def _float_or_nan(text):
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return np.nan
+
+class MissionGeometry:
+    """
+    index 順のウェイポイントの座標・高度・元の撮影姿勢の配列（長さ n、値が無ければ NaN）。
+    高度は wpml:height（無ければ ellipsoidHeight）。撮影姿勢は Waypoint.gimbal（変換側の解析結果）。
+    配列は読み取り専用として扱うこと（Mission.clone で複製と共有する）。
+    """
+
+    __slots__ = ("indices", "lon", "lat", "height", "gimbal_pitch", "gimbal_yaw", "heading", "focal_length")
+
+    def __init__(self, indices, lon, lat, height, gimbal_pitch, gimbal_yaw, heading, focal_length):
+        self.indices = indices
+        self.lon = lon
+        self.lat = lat
+        self.height = height
+        self.gimbal_pitch = gimbal_pitch
+        self.gimbal_yaw = gimbal_yaw
+        self.heading = heading
+        self.focal_length = focal_length
+
+    @classmethod
+    def from_waypoints(cls, waypoints):
+        """wpml_model.Waypoint のリスト（index 順）から作る"""
+        n = len(waypoints)
+        table = np.full((7, n), np.nan)
+        for i, wp in enumerate(waypoints):
+            g = wp.gimbal
+            table[:, i] = (
+                np.nan if wp.lon is None else wp.lon,
+                np.nan if wp.lat is None else wp.lat,
+                _float_or_nan(wp.height if wp.height is not None else wp.ellipsoid_height),
+                np.nan if g is None or g.pitch is None else g.pitch,
+                np.nan if g is None or g.yaw is None else g.yaw,
+                np.nan if g is None or g.heading is None else g.heading,
+                np.nan if g is None or g.focal_length is None else g.focal_length,
+            )
+        indices = np.fromiter((wp.index for wp in waypoints), dtype=np.int64, count=n)
+        return cls(indices, *table)
+
+    def __len__(self):
+        return len(self.indices)
+
+    # --- 区間（長さ n-1） ---
+
+    def segment_distances(self):
+        """各区間の水平距離（m）"""
+        return haversine_distances(self.lon[:-1], self.lat[:-1], self.lon[1:], self.lat[1:])
+
+    def climbs(self):
+        """各区間の高度変化（m。上昇が正）"""
+        return np.diff(self.height)
+
+    def segment_lengths(self):
+        """各区間の 3 次元距離（m。高度が無い区間は水平距離）"""
+        return np.hypot(self.segment_distances(), np.nan_to_num(self.climbs()))
+
+    def bearings(self):
+        """各区間の進行方位（度。北 = 0、-180 < b <= 180）"""
+        return initial_bearings(self.lon[:-1], self.lat[:-1], self.lon[1:], self.lat[1:])
+
+    def climb_rates(self, speed):
+        """速度 speed（m/s。スカラーまたは区間毎の配列）で飛んだときの各区間の上昇率（m/s）"""
+        lengths = self.segment_lengths()
+        climbs = np.nan_to_num(self.climbs())
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rates = climbs * np.asarray(speed, dtype=float) / lengths
+        return np.where(lengths > 0, rates, 0.0)
+
+    def short_segments(self, min_distance=SHORT_SEGMENT_M):
+        """水平距離が min_distance（m）以下の区間（進行方位が定まらない区間）"""
+        return self.segment_distances() <= min_distance
+
+    # --- ウェイポイント（長さ n） ---
+
+    def shooting_directions(self):
+        """元の撮影方向（度。機体ヘディング + ジンバルヨー、-180 < d <= 180）"""
+        return normalize_angle(self.heading + self.gimbal_yaw)
+
+    def next_shooting_directions(self):
+        """次のウェイポイントの撮影方向（最後のウェイポイントは NaN）"""
+        directions = np.full(len(self), np.nan)
+        directions[:-1] = self.shooting_directions()[1:]
+        return directions
@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+wpml_model.py
+
+DJI WPML（template.kml）のミッションモデル。lxml の DOM から切り離した Python オブジェクトで変換する。
+• parse_mission / parse_waypoint で 1 回だけ読み込む（Placemark ごとに子要素を 1 回走査）
+• 変換ルールはモデルの属性を書き換えるだけで、DOM には触れない
+• write_mission / write_waypoint で、読み込み時から変わった項目だけを元の要素に書き戻す
+  （モデル化していない要素や未変更の項目はそのまま残る）
+
+数値項目は WPML のテキストのまま保持する（書き戻しで表記を変えないため）。
+HeadingParam は不変。属性の変更は必ず代入で行う（Mission.clone で複製と共有しているため、
+action_groups などのリストをその場で書き換えない）。
+
+使い方:
+    mission = parse_mission(tree)
+    for wp in mission.waypoints:
+        wp.speed = "12"
+        wp.action_groups = [ActionGroup.at(wp.index, [Action.of(HOVER, hoverTime="2")])]
+    write_mission(mission)
+"""
+
+import copy
+from dataclasses import dataclass, field
+from lxml import etree
+
+import wpml_xpath as xp
+from wpml_xpath import NS
+import wpml_actions as wa
+
+# --- 定数 ------------------------------------------------------------------
+
+WPML = f"{{{NS['wpml']}}}"
+KML = f"{{{NS['kml']}}}"
+
+# waypointHeadingParam の子要素（書き出し順）と HeadingParam の属性名
+HEADING_FIELDS = (
+    ("mode", WPML + "waypointHeadingMode"),
+    ("angle", WPML + "waypointHeadingAngle"),
+    ("poi_point", WPML + "waypointPoiPoint"),
+    ("path_mode", WPML + "waypointHeadingPathMode"),
+    ("poi_index", WPML + "waypointHeadingPoiIndex"),
+)
+_HEADING_ATTRS = {tag: name for name, tag in HEADING_FIELDS}
+
+# --- モデル ------------------------------------------------------------------
+
+@dataclass(frozen=True, slots=True)
+class HeadingParam:
+    """waypointHeadingParam / globalWaypointHeadingParam（要素が無い項目は None）"""
+    mode: str | None = None
+    angle: str | None = None
+    poi_point: str | None = None
+    path_mode: str | None = None
+    poi_index: str | None = None
+
+@dataclass(slots=True)
+class Action:
+    """
+    wpml:action。params は actionActuatorFuncParam の (パラメータ名 → テキスト)。
+    template 付き（Action.of で作ったもの）の params は、プロトタイプの既定値から変えた項目だけ。
+    """
+    func: str
+    params: dict = field(default_factory=dict)
+    action_id: str = "0"
+    template: wa.ActionTemplate | None = field(default=None, repr=False, compare=False)
+
+    @classmethod
+    def of(cls, template, **values):
+        """wpml_actions のプロトタイプの既定値を values で上書きしたアクション"""
+        return cls(template.func, values, "0", template)
+
+@dataclass(slots=True)
+class ActionGroup:
+    """wpml:actionGroup（actionTrigger は種別のみ保持）"""
+    group_id: str
+    start_index: str
+    end_index: str
+    mode: str = "sequence"
+    trigger: str = "reachPoint"
+    actions: list = field(default_factory=list)
+
+    @classmethod
+    def at(cls, index, actions, mode="sequence"):
+        """ウェイポイント index に到達したときに実行するグループ（Id / Start / End = index）"""
+        text = str(index)
+        return cls(text, text, text, mode, "reachPoint", actions)
+
+@dataclass(slots=True)
+class GimbalInfo:
+    """元のアクションから読み取った撮影姿勢（ジンバルピッチ／ヨー、機体ヘディング、焦点距離）"""
+    pitch: float | None = None
+    yaw: float | None = None
+    heading: float | None = None
+    focal_length: float | None = None
+    zoom_ratio: float | None = None
+
+@dataclass(slots=True)
+class Waypoint:
+    """
+    1 Placemark 分。index が None の Placemark（ウェイポイント以外）も同じ型で持つ。
+    gimbal は変換側の解析（元のアクション）で設定する。
+    """
+    index: int | None
+    placemark: etree._Element = field(repr=False, compare=False)
+    lon: float | None = None
+    lat: float | None = None
+    height: str | None = None
+    ellipsoid_height: str | None = None
+    height_mode: str | None = None
+    speed: str | None = None
+    use_global_speed: str | None = None
+    heading: HeadingParam | None = None
+    action_groups: list = field(default_factory=list)
+    gimbal: GimbalInfo | None = None
+    _src: tuple = field(default=(), repr=False, compare=False)
+
+    def actions(self):
+        """全アクショングループのアクションを順に返す"""
+        for group in self.action_groups:
+            yield from group.actions
+
+    def _snapshot(self):
+        return (self.height_mode, self.speed, self.use_global_speed,
+                self.heading, self.action_groups)
+
+@dataclass(slots=True)
+class Mission:
+    """
+    template.kml 全体。
+    - placemarks: 文書順の全 Waypoint（index の無いものも含む）
+    - waypoints: index 順の Waypoint リスト
+    - by_index: index → Waypoint
+    グローバル設定は要素が無ければ None。
+    geometry は変換側の解析で設定する（wpml_geometry.MissionGeometry。複製と共有する）。
+    """
+    tree: etree._ElementTree = field(repr=False, compare=False)
+    placemarks: list = field(default_factory=list)
+    waypoints: list = field(default_factory=list)
+    by_index: dict = field(default_factory=dict)
+    turn_mode: str | None = None
+    height_mode: str | None = None
+    height: str | None = None
+    auto_flight_speed: str | None = None
+    transitional_speed: str | None = None
+    image_format: str | None = None
+    heading: HeadingParam | None = None
+    geometry: object = field(default=None, repr=False, compare=False)
+    _src: tuple = field(default=(), repr=False, compare=False)
+
+    def __len__(self):
+        return len(self.waypoints)
+
+    def _index(self):
+        self.waypoints = sorted((wp for wp in self.placemarks if wp.index is not None),
+                                key=lambda w: w.index)
+        self.by_index = {wp.index: wp for wp in self.waypoints}
+
+    def _snapshot(self):
+        return (self.turn_mode, self.height_mode, self.auto_flight_speed,
+                self.transitional_speed, self.image_format, self.heading)
+
+    def clone(self, tree):
+        """
+        tree（このミッションの元ツリーを deepcopy したもの）に結び付けた複製を返す。
+        Waypoint は浅い複製なので、変換は属性の代入で行うこと。
+        """
+        placemarks = xp.PLACEMARKS(tree)
+        if len(placemarks) != len(self.placemarks):
+            raise ValueError("複製先のツリーと Placemark の数が一致しません。")
+        twin = copy.copy(self)
+        twin.tree = tree
+        twin.placemarks = []
+        for wp, pm in zip(self.placemarks, placemarks):
+            w = copy.copy(wp)
+            w.placemark = pm
+            twin.placemarks.append(w)
+        twin._index()
+        return twin
+
+# --- 読み込み ----------------------------------------------------------------
+
+def _to_float(text):
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return None
+
+def _text(node, query):
+    el = xp.first(query, node)
+    return el.text if el is not None else None
+
+def parse_heading(hp):
+    values = {}
+    for child in hp:
+        name = _HEADING_ATTRS.get(child.tag)
+        if name is not None:
+            values[name] = child.text
+    return HeadingParam(**values)
+
+def parse_action(el):
+    func = ""
+    action_id = "0"
+    params = {}
+    for child in el:
+        tag = child.tag
+        if tag == WPML + "actionActuatorFunc":
+            func = child.text or ""
+        elif tag == WPML + "actionActuatorFuncParam":
+            for p in child:
+                if isinstance(p.tag, str) and p.tag.startswith(WPML):
+                    params[p.tag[len(WPML):]] = p.text or ""
+        elif tag == WPML + "actionId":
+            action_id = child.text or "0"
+    return Action(func, params, action_id)
+
+def parse_action_group(el):
+    values = {}
+    actions = []
+    trigger = "reachPoint"
+    for child in el:
+        tag = child.tag
+        if tag == WPML + "action":
+            actions.append(parse_action(child))
+        elif tag == WPML + "actionTrigger":
+            trigger = _text(child, xp.TRIGGER_TYPE) or trigger
+        elif isinstance(tag, str):
+            values[tag] = child.text
+    return ActionGroup(values.get(WPML + "actionGroupId") or "0",
+                       values.get(WPML + "actionGroupStartIndex") or "0",
+                       values.get(WPML + "actionGroupEndIndex") or "0",
+                       values.get(WPML + "actionGroupMode") or "sequence",
+                       trigger, actions)
+
+def parse_waypoint(pm):
+    """Placemark の子要素を 1 回だけ走査して Waypoint を作る"""
+    wp = Waypoint(None, pm)
+    groups = []
+    for child in pm:
+        tag = child.tag
+        if tag == WPML + "index":
+            wp.index = int(child.text)
+        elif tag == KML + "Point":
+            coords = _text(child, xp.POINT_COORDINATES)
+            if coords:
+                parts = coords.strip().split(",")
+                if len(parts) >= 2:
+                    wp.lon = _to_float(parts[0])
+                    wp.lat = _to_float(parts[1])
+        elif tag == WPML + "height":
+            wp.height = child.text
+        elif tag == WPML + "ellipsoidHeight":
+            wp.ellipsoid_height = child.text
+        elif tag == WPML + "heightMode":
+            wp.height_mode = child.text
+        elif tag == WPML + "waypointSpeed":
+            wp.speed = child.text
+        elif tag == WPML + "useGlobalSpeed":
+            wp.use_global_speed = child.text
+        elif tag == WPML + "waypointHeadingParam":
+            wp.heading = parse_heading(child)
+        elif tag == WPML + "actionGroup":
+            groups.append(parse_action_group(child))
+    wp.action_groups = groups
+    wp._src = wp._snapshot()
+    return wp
+
+def parse_mission(tree):
+    """ツリー全体を読み込む（Placemark の無い骨格だけのツリーも可）"""
+    heading = xp.first(xp.GLOBAL_HEADING_PARAMS, tree)
+    payload = xp.first(xp.PAYLOAD_PARAM, tree)
+    mission = Mission(
+        tree,
+        placemarks=[parse_waypoint(pm) for pm in xp.PLACEMARKS(tree)],
+        turn_mode=_text(tree, xp.GLOBAL_TURN_MODE),
+        height_mode=_text(tree, xp.GLOBAL_HEIGHT_MODE),
+        height=_text(tree, xp.GLOBAL_HEIGHT),
+        auto_flight_speed=_text(tree, xp.AUTO_FLIGHT_SPEED),
+        transitional_speed=_text(tree, xp.GLOBAL_TRANSITIONAL_SPEED),
+        image_format=_text(payload, xp.IMAGE_FORMAT) if payload is not None else None,
+        heading=parse_heading(heading) if heading is not None else None,
+    )
+    mission._index()
+    mission._src = mission._snapshot()
+    return mission
+
+# --- 書き戻し ----------------------------------------------------------------
+
+def _set_child(parent, existing, tag, value):
+    """existing（parent の tag 要素 or None）を value に合わせる。None なら削除、無ければ末尾に追加"""
+    if value is None:
+        if existing is not None:
+            parent.remove(existing)
+    elif existing is not None:
+        existing.text = value
+    else:
+        etree.SubElement(parent, tag).text = value
+
+def write_heading(hp, heading):
+    """waypointHeadingParam の子要素を heading で作り直す"""
+    for child in list(hp):
+        hp.remove(child)
+    for name, tag in HEADING_FIELDS:
+        value = getattr(heading, name)
+        if value is not None:
+            etree.SubElement(hp, tag).text = value
+
+def write_action(parent, action):
+    if action.template is not None:
+        return action.template.make(parent,
+                                    None if action.action_id == "0" else action.action_id,
+                                    **action.params)
+    el = etree.SubElement(parent, WPML + "action")
+    etree.SubElement(el, WPML + "actionId").text = action.action_id
+    etree.SubElement(el, WPML + "actionActuatorFunc").text = action.func
+    p = etree.SubElement(el, WPML + "actionActuatorFuncParam")
+    for tag, text in action.params.items():
+        etree.SubElement(p, WPML + tag).text = text
+    return el
+
+def write_action_group(parent, group):
+    ag = wa.new_action_group(parent, group.start_index, group.mode)
+    if group.group_id != group.start_index:
+        ag[0].text = group.group_id
+    if group.end_index != group.start_index:
+        ag[2].text = group.end_index
+    if group.trigger != "reachPoint":
+        ag[4][0].text = group.trigger
+    for action in group.actions:
+        write_action(ag, action)
+    return ag
+
+def write_waypoint(wp):
+    """読み込み時から変わった項目だけを Placemark に書き戻す"""
+    src = wp._src
+    if (wp.height_mode == src[0] and wp.speed == src[1] and wp.use_global_speed == src[2]
+            and wp.heading == src[3] and wp.action_groups is src[4]):
+        return
+
+    pm = wp.placemark
+    found = {}
+    groups = []
+    for child in pm:
+        if child.tag == WPML + "actionGroup":
+            groups.append(child)
+        else:
+            found.setdefault(child.tag, child)
+
+    # 追加する要素は DJI の template.kml と同じ順（waypointSpeed → waypointHeadingParam → useGlobalSpeed）
+    if wp.height_mode != src[0]:
+        _set_child(pm, found.get(WPML + "heightMode"), WPML + "heightMode", wp.height_mode)
+    if wp.speed != src[1]:
+        _set_child(pm, found.get(WPML + "waypointSpeed"), WPML + "waypointSpeed", wp.speed)
+
+    if wp.heading != src[3]:
+        hp = found.get(WPML + "waypointHeadingParam")
+        if wp.heading is None:
+            if hp is not None:
+                pm.remove(hp)
+        else:
+            if hp is None:
+                hp = etree.SubElement(pm, WPML + "waypointHeadingParam")
+            write_heading(hp, wp.heading)
+
+    if wp.use_global_speed != src[2]:
+        _set_child(pm, found.get(WPML + "useGlobalSpeed"), WPML + "useGlobalSpeed", wp.use_global_speed)
+
+    if wp.action_groups is not src[4]:
+        for ag in groups:
+            pm.remove(ag)
+        for group in wp.action_groups:
+            write_action_group(pm, group)
+
+    wp._src = wp._snapshot()
+
+def write_globals(mission):
+    """グローバル設定のうち読み込み時から変わった項目を書き戻す"""
+    src = mission._src
+    tree = mission.tree
+    folder = xp.first(xp.FOLDERS, tree)
+
+    if mission.turn_mode != src[0]:
+        _set_child(folder, xp.first(xp.GLOBAL_TURN_MODE, tree),
+                   WPML + "globalWaypointTurnMode", mission.turn_mode)
+
+    if mission.height_mode != src[1]:
+        hm = xp.first(xp.GLOBAL_HEIGHT_MODE, tree)
+        if hm is not None:
+            hm.text = mission.height_mode
+
+    if mission.auto_flight_speed != src[2] and folder is not None:
+        _set_child(folder, xp.first(xp.AUTO_FLIGHT_SPEED, tree),
+                   WPML + "autoFlightSpeed", mission.auto_flight_speed)
+
+    if mission.transitional_speed != src[3]:
+        mc = xp.first(xp.MISSION_CONFIGS, tree)
+        if mc is not None:
+            _set_child(mc, xp.first(xp.GLOBAL_TRANSITIONAL_SPEED, tree),
+                       WPML + "globalTransitionalSpeed", mission.transitional_speed)
+
+    if mission.image_format != src[4]:
+        pp = xp.first(xp.PAYLOAD_PARAM, tree)
+        if pp is None and mission.image_format is not None and folder is not None:
+            pp = etree.SubElement(folder, WPML + "payloadParam")
+            etree.SubElement(pp, WPML + "payloadPositionIndex").text = "0"
+        if pp is not None:
+            _set_child(pp, xp.first(xp.IMAGE_FORMAT, pp), WPML + "imageFormat", mission.image_format)
+
+    if mission.heading != src[5] and mission.heading is not None:
+        old = src[5] or HeadingParam()
+        for hp in xp.GLOBAL_HEADING_PARAMS(tree):
+            for name, tag in HEADING_FIELDS:
+                value = getattr(mission.heading, name)
+                if value != getattr(old, name):
+                    _set_child(hp, hp.find(tag), tag, value)
+
+    mission._src = mission._snapshot()
+
+def write_mission(mission):
+    """グローバル設定と全 Placemark を書き戻す"""
+    write_globals(mission)
+    for wp in mission.placemarks:
+        write_waypoint(wp)
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+wpml_simulate.py
+
+変換後のミッションを時系列で再生する運動学シミュレーター（実際の飛行時間との比較、速度・ホバリング時間の調整用）。
+• 区間: 端点の通過速度（停止点は 0、停止しないターンモードの通過点は旋回角・旋回開始距離・横加速度から決める）と
+  設定速度（上昇・下降速度の上限で制限）から、加速・巡航・減速の速度プロファイルで飛行時間を計算する
+• 通過速度は前後の区間の加減速で到達できる値に制限する（前向き・後ろ向きの累積最小で計算し、ループを使わない）
+• アクション: rotateYaw（aircraftPathMode の回転方向）、gimbalRotate（回転 + 静定時間）、zoom、hover、撮影・録画の所要時間を、
+  機体ヘディング・ジンバル・ズームの状態を前方補完した配列から計算する（parallel のアクショングループは同時に開始し、
+  最長のアクションが終わるまで待つ）
+• 結果は Timeline（各ウェイポイントの到着・出発時刻、各アクションの開始・終了時刻）。CSV に書き出して実際の飛行と比較できる
+• 入力・機体の性能値は wpml_estimate（WaypointPlan / AircraftLimits）と共通
+
+使い方:
+    plans = [plan_waypoint(wp, mission) for wp in mission.waypoints]
+    timeline = simulate_mission(plans, mission.turn_mode, AircraftLimits())
+    print(timeline.summary())
+    print(timeline.compare(27 * 60 + 40))
+    timeline.write_csv("mission.timeline.csv")
+
+離陸地点から最初のウェイポイント、最後のウェイポイントから帰還までの飛行は含まない（時刻 0 = 最初のウェイポイント到着）。
+"""
+
+import csv
+from dataclasses import dataclass
+
+import numpy as np
+
+import wpml_geometry as geo
+import wpml_estimate as wpe
+
+# --- 定数 ------------------------------------------------------------------
+
+# 進行方位が定まらない（ほぼ垂直な）区間の水平距離（m）。この区間の前後の通過点では止まる
+MIN_HEADING_DISTANCE_M = 0.5
+
+# アクションの種類（Timeline.action_kinds の値）
+ACTION_KINDS = ("other", "rotateYaw", "gimbalRotate", "zoom", "hover", "takePhoto", "startRecord", "stopRecord")
+_KIND = {name: code for code, name in enumerate(ACTION_KINDS)}
+
+# rotateYaw の aircraftPathMode（0 = 最短、1 = 時計回り、2 = 反時計回り）
+_PATH_MODES = {"clockwise": 1, "counterClockwise": 2}
+
+# --- 結果 ------------------------------------------------------------------
+
+@dataclass(slots=True)
+class Timeline:
+    """
+    simulate_mission の結果。時刻は最初のウェイポイント到着からの秒。
+    ウェイポイントの配列は長さ n（index 順）、区間の配列は長さ n-1、アクションの配列は全アクション分（実行順）。
+    """
+    limits: wpe.AircraftLimits
+    turn_mode: str | None
+    indices: np.ndarray             # ウェイポイント index
+    arrive: np.ndarray              # 到着時刻
+    depart: np.ndarray              # 出発時刻（到着 + アクション）
+    stops: np.ndarray               # 停止するか
+    pass_speeds: np.ndarray         # 通過速度（m/s。停止点は 0）
+    distances: np.ndarray           # 区間の 3 次元距離（m）
+    cruise_speeds: np.ndarray       # 区間の巡航速度（m/s。上昇・下降速度の上限で制限した値）
+    segment_times: np.ndarray       # 区間の飛行時間
+    action_waypoints: np.ndarray    # アクションのウェイポイント（位置。indices の添字）
+    action_kinds: np.ndarray        # ACTION_KINDS の添字
+    action_start: np.ndarray
+    action_end: np.ndarray
+
+    @property
+    def total_time(self):
+        return float(self.depart[-1]) if len(self.depart) else 0.0
+
+    @property
+    def flight_time(self):
+        return float(self.segment_times.sum())
+
+    @property
+    def action_time(self):
+        """ウェイポイントでの待ち時間の合計（parallel のグループは最長のアクション分）"""
+        return float((self.depart - self.arrive).sum())
+
+    def action_times(self):
+        """アクションの種類 → 合計時間（秒。0 のものは除く）"""
+        totals = np.bincount(self.action_kinds, weights=self.action_end - self.action_start,
+                             minlength=len(ACTION_KINDS))
+        return {ACTION_KINDS[k]: float(t) for k, t in enumerate(totals) if t > 0}
+
+    def summary(self):
+        """ログ用の概要（複数行）"""
+        distance = float(self.distances.sum())
+        flight = self.flight_time
+        average = distance / flight if flight > 0 else 0.0
+        lines = [f"シミュレーション: 合計 {wpe.format_minutes(self.total_time)}"
+                 f"（飛行 {wpe.format_minutes(flight)}, アクション {wpe.format_minutes(self.action_time)}）",
+                 f"距離 {distance:.0f}m, 平均速度 {average:.1f}m/s, "
+                 f"ウェイポイント {len(self.indices)} 点（停止 {int(self.stops.sum())} 点）"]
+        actions = self.action_times()
+        if actions:
+            lines.append("アクション: " + ", ".join(f"{func} {t:.0f}秒"
+                                                   for func, t in sorted(actions.items(), key=lambda x: -x[1])))
+        return "\n".join(lines) + "\n"
+
+    def compare(self, actual):
+        """実際の飛行時間 actual（秒）との比較（1 行）"""
+        return compare_durations(self.total_time, actual)
+
+    def events(self):
+        """
+        時刻順のイベント [(開始, 終了, ウェイポイント index, イベント名, 速度), ...]。
+        ウェイポイントはイベント名 "waypoint"（到着〜出発、速度 = 通過速度）、アクションは actionActuatorFunc（速度 None）。
+        """
+        rows = [(a, d, i, "waypoint", v) for i, a, d, v in
+                zip(self.indices.tolist(), self.arrive.tolist(), self.depart.tolist(), self.pass_speeds.tolist())]
+        rows += [(s, e, i, ACTION_KINDS[k], None) for i, k, s, e in
+                 zip(self.indices[self.action_waypoints].tolist(), self.action_kinds.tolist(),
+                     self.action_start.tolist(), self.action_end.tolist())]
+        rows.sort(key=lambda row: (row[0], row[3] != "waypoint"))
+        return rows
+
+    def write_csv(self, path):
+        """events() を CSV に書き出す（列: waypoint, event, start_s, end_s, speed_mps）"""
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["waypoint", "event", "start_s", "end_s", "speed_mps"])
+            for start, end, index, event, speed in self.events():
+                writer.writerow([index, event, f"{start:.2f}", f"{end:.2f}",
+                                 "" if speed is None else f"{speed:.2f}"])
+        return path
+
+def compare_durations(simulated, actual):
+    """シミュレーションの時間 simulated と実際の飛行時間 actual（秒）の比較（1 行）"""
+    diff = simulated - actual
+    ratio = f", {diff / actual * 100:+.1f}%" if actual > 0 else ""
+    sign = "+" if diff >= 0 else "-"
+    return (f"実測 {wpe.format_minutes(actual)} / シミュレーション {wpe.format_minutes(simulated)}"
+            f"（差 {sign}{abs(diff):.0f}秒{ratio}）\n")
+
+# --- 区間 ------------------------------------------------------------------
+
+def cruise_speeds(distances, climbs, speeds, limits):
+    """設定速度を、上昇・下降速度の上限を超えないように下げた巡航速度"""
+    vertical = np.where(climbs >= 0, limits.ascent_speed, limits.descent_speed)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        capped = vertical * distances / np.abs(climbs)
+    return np.maximum(np.where(np.abs(climbs) > 0, np.minimum(speeds, capped), speeds), 0.1)
+
+def corner_speeds(horizontal, bearings, cruise, stops, limits):
+    """
+    各点の通過速度の上限（停止点は 0）。通過点では旋回開始距離 turn_damping の円弧で曲がるとして
+    半径 r = turn_damping / tan(旋回角 / 2)、速度 √(横加速度 × r) とし、前後の巡航速度も超えない。
+    """
+    n = len(stops)
+    speeds = np.zeros(n)
+    if n < 3:
+        return speeds
+    turn = np.radians(np.abs(geo.angle_difference(bearings[1:], bearings[:-1])))
+    with np.errstate(divide="ignore"):
+        radius = limits.turn_damping / np.tan(turn / 2)
+    passing = np.sqrt(limits.lateral_acceleration * radius)
+    passing = np.minimum(passing, np.minimum(cruise[:-1], cruise[1:]))
+    # 進行方位が定まらない区間の前後では止まる
+    straight = (horizontal[:-1] > MIN_HEADING_DISTANCE_M) & (horizontal[1:] > MIN_HEADING_DISTANCE_M)
+    speeds[1:-1] = np.where(straight & ~stops[1:-1], passing, 0.0)
+    return speeds
+
+def feasible_speeds(speeds, distances, acceleration):
+    """
+    通過速度を、前後の区間で加速・減速して到達できる値（v_i² ≤ v_(i±1)² + 2aL）に下げる。
+    累積距離 S で v_i² - 2aS_i の前向き累積最小、v_i² + 2aS_i の後ろ向き累積最小を取る。
+    """
+    s = np.concatenate(([0.0], np.cumsum(distances))) * 2 * acceleration
+    v2 = speeds * speeds
+    v2 = np.minimum.accumulate(v2 - s) + s
+    v2 = np.minimum.accumulate((v2 + s)[::-1])[::-1] - s
+    return np.sqrt(np.maximum(v2, 0.0))
+
+def profile_times(distances, v0, v1, cruise, acceleration):
+    """
+    始点速度 v0・終点速度 v1・巡航速度 cruise の加速・巡航・減速プロファイルの区間時間
+    （巡航速度に達しない区間は三角形プロファイル）
+    """
+    a = acceleration
+    ramp = (2 * cruise * cruise - v0 * v0 - v1 * v1) / (2 * a)
+    trapezoid = (2 * cruise - v0 - v1) / a + (distances - ramp) / cruise
+    peak = np.sqrt((2 * a * distances + v0 * v0 + v1 * v1) / 2)
+    triangle = (2 * peak - v0 - v1) / a
+    return np.where(distances >= ramp, trapezoid, triangle)
+
+# --- アクション ----------------------------------------------------------------
+
+def _number(action, name):
+    value = wpe.action_param(action, name)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+def action_row(action):
+    """アクション 1 つを数値の行にする（種類、ヨー目標、回転方向、ピッチ、ジンバルヨー、回転時間、焦点距離、ホバリング時間）"""
+    func = action.func
+    kind = _KIND.get(func, 0)
+    row = [kind, np.nan, 0, np.nan, np.nan, np.nan, np.nan, 0.0]
+    if func == "rotateYaw":
+        row[1] = _number(action, "aircraftHeading")
+        row[2] = _PATH_MODES.get(wpe.action_param(action, "aircraftPathMode"), 0)
+    elif func == "gimbalRotate":
+        if wpe.action_param(action, "gimbalPitchRotateEnable") == "1":
+            row[3] = _number(action, "gimbalPitchRotateAngle")
+        if wpe.action_param(action, "gimbalYawRotateEnable") == "1":
+            row[4] = _number(action, "gimbalYawRotateAngle")
+        if wpe.action_param(action, "gimbalRotateTimeEnable") == "1":
+            row[5] = _number(action, "gimbalRotateTime")
+    elif func == "zoom":
+        row[6] = _number(action, "focalLength")
+    elif func == "hover":
+        row[7] = np.nan_to_num(_number(action, "hoverTime"))
+    return row
+
+def forward_fill(values):
+    """NaN を直前の NaN でない値で埋める（先頭の NaN はそのまま）"""
+    filled = np.where(np.isnan(values), 0, np.arange(len(values)))
+    np.maximum.accumulate(filled, out=filled)
+    return values[filled]
+
+def previous_state(values):
+    """各要素の直前までの状態（values を前方補完して 1 つずらしたもの。最初は NaN）"""
+    state = np.full(len(values), np.nan)
+    state[1:] = forward_fill(values)[:-1]
+    return state
+
+def yaw_travels(current, target, path_modes):
+    """current から target までの回転角（度。path_modes: 0 = 最短、1 = 時計回り、2 = 反時計回り）"""
+    clockwise = np.mod(target - current, 360.0)
+    counter = np.mod(current - target, 360.0)
+    shortest = np.abs(geo.angle_difference(target, current))
+    return np.select([path_modes == 1, path_modes == 2], [clockwise, counter], shortest)
+
+def action_durations(table, action_wp, arrival_headings, stops, limits):
+    """
+    アクションの所要時間（配列）。機体ヘディングは到着時のヘディングと rotateYaw の目標を実行順に並べて前方補完し、
+    ジンバル・ズームはアクションの目標値を前方補完して、各アクションの直前の状態とする。
+    停止しない点では wpml_estimate.BLOCKING_ACTIONS だけが時間を使う。
+    """
+    kind = table[:, 0].astype(np.int64)
+    durations = np.zeros(len(table))
+
+    # 機体ヘディング: 各点の到着ヘディングの後ろにその点のアクションが続く並び
+    n = len(arrival_headings)
+    counts = np.bincount(action_wp, minlength=n)
+    arrival_pos = np.arange(n) + np.concatenate(([0], np.cumsum(counts)[:-1]))
+    first_action = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    action_pos = arrival_pos[action_wp] + 1 + (np.arange(len(table)) - first_action[action_wp])
+    sequence = np.full(n + len(table), np.nan)
+    sequence[arrival_pos] = arrival_headings
+    sequence[action_pos] = table[:, 1]
+    heading = previous_state(sequence)[action_pos]
+    yaw = kind == _KIND["rotateYaw"]
+    travel = np.nan_to_num(yaw_travels(heading, table[:, 1], table[:, 2].astype(np.int64)))
+    durations[yaw] = travel[yaw] / limits.yaw_rate
+
+    # ジンバル: 回転時間の指定があればそれ、無ければ大きい方の回転角 / 回転速度。動いたら静定時間を足す
+    gimbal = kind == _KIND["gimbalRotate"]
+    pitch_move = np.abs(table[:, 3] - previous_state(table[:, 3]))
+    yaw_move = np.abs(geo.angle_difference(table[:, 4], previous_state(table[:, 4])))
+    move = np.fmax(np.nan_to_num(pitch_move), np.nan_to_num(yaw_move))
+    rotate = np.where(np.isnan(table[:, 5]), move / limits.gimbal_rate, table[:, 5])
+    settle = np.where(rotate > 0, limits.gimbal_settle, 0.0)
+    durations[gimbal] = (rotate + settle)[gimbal]
+
+    # ズーム: 焦点距離が変わる場合のみ
+    focal = table[:, 6]
+    zoom = (kind == _KIND["zoom"]) & (np.abs(focal - previous_state(focal)) > 0)
+    durations[zoom] = limits.zoom_time
+
+    durations[kind == _KIND["hover"]] = table[kind == _KIND["hover"], 7]
+    durations[kind == _KIND["takePhoto"]] = limits.photo_latency
+    durations[(kind == _KIND["startRecord"]) | (kind == _KIND["stopRecord"])] = limits.record_latency
+
+    blocking = np.isin(kind, [_KIND[func] for func in wpe.BLOCKING_ACTIONS])
+    return np.where(stops[action_wp] | blocking, durations, 0.0)
+
+# --- シミュレーション ------------------------------------------------------------
+
+def simulate_mission(plans, turn_mode, limits=None):
+    """
+    WaypointPlan のリスト（index 順）を再生して Timeline を返す。
+    turn_mode は globalWaypointTurnMode（停止する点の判定は wpml_estimate.waypoint_stops と同じ）。
+    """
+    limits = limits or wpe.AircraftLimits()
+    n = len(plans)
+    if n == 0:
+        empty, none = np.zeros(0), np.zeros(0, dtype=np.int64)
+        return Timeline(limits, turn_mode, none, empty, empty, np.zeros(0, dtype=bool), empty,
+                        empty, empty, empty, none, none, empty, empty)
+    table_rows, action_wp, action_slot = [], [], []
+    slot = 0
+    points = np.full((6, n), np.nan)
+    modes = []
+    for i, plan in enumerate(plans):
+        points[:, i] = (np.nan if plan.lon is None else plan.lon,
+                        np.nan if plan.lat is None else plan.lat,
+                        np.nan if plan.height is None else plan.height,
+                        np.nan if plan.speed is None else plan.speed,
+                        np.nan if plan.heading_angle is None else plan.heading_angle,
+                        plan.index)
+        modes.append(plan.heading_mode)
+        for action in plan.actions:
+            table_rows.append(action_row(action))
+            action_wp.append(i)
+        # 同時に実行するアクション（parallel のグループ）は同じ枠、それ以外は 1 つずつ別の枠
+        for mode, count in plan.groups or (("sequence", len(plan.actions)),):
+            if mode == "parallel" and count:
+                action_slot += [slot] * count
+                slot += 1
+            else:
+                action_slot += range(slot, slot + count)
+                slot += count
+    lon, lat, height, speed, heading_angle, indices = points
+    table = np.array(table_rows, dtype=float).reshape(-1, 8)
+    action_wp = np.array(action_wp, dtype=np.int64)
+    stops = wpe.waypoint_stops(plans, turn_mode)
+
+    # 区間
+    horizontal = np.nan_to_num(geo.haversine_distances(lon[:-1], lat[:-1], lon[1:], lat[1:]))
+    climbs = np.nan_to_num(np.diff(height))
+    distances = np.hypot(horizontal, climbs)
+    bearings = geo.initial_bearings(lon[:-1], lat[:-1], lon[1:], lat[1:])
+    cruise = cruise_speeds(distances, climbs, np.nan_to_num(speed[:-1], nan=wpe.DEFAULT_SPEED), limits)
+    passing = feasible_speeds(corner_speeds(horizontal, bearings, cruise, stops, limits),
+                              distances, limits.acceleration)
+    times = profile_times(distances, passing[:-1], passing[1:], cruise, limits.acceleration)
+
+    # 到着時のヘディング（区間 i → i+1 の機体ヘディングは点 i の設定で決まる）
+    modes = np.array(modes, dtype=object)[:-1]
+    arrival = np.full(n, np.nan)
+    if n > 1:
+        arrival[1:] = np.select(
+            [(modes == "followWayline") & (horizontal > MIN_HEADING_DISTANCE_M),
+             (modes == "fixed") | (modes == "smoothTransition")],
+            [bearings, heading_angle[:-1]], np.nan)
+
+    # 時刻: 各点のアクションは到着後に枠の順に実行し（同じ枠は同時、枠の時間は最長のアクション分）、
+    # 終わったら出発する
+    durations = action_durations(table, action_wp, arrival, stops, limits)
+    action_slot = np.array(action_slot, dtype=np.int64)
+    slot_time = np.zeros(slot)
+    np.maximum.at(slot_time, action_slot, durations)
+    slot_wp = np.zeros(slot, dtype=np.int64)
+    slot_wp[action_slot] = action_wp
+    dwell = np.bincount(slot_wp, weights=slot_time, minlength=n)
+    arrive = np.concatenate(([0.0], np.cumsum(dwell[:-1] + times)))
+    depart = arrive + dwell
+    elapsed = np.cumsum(slot_time) - slot_time
+    before_wp = np.concatenate(([0.0], np.cumsum(dwell)[:-1]))
+    slot_start = arrive[slot_wp] + elapsed - before_wp[slot_wp]
+    action_start = slot_start[action_slot]
+
+    return Timeline(limits, turn_mode, indices.astype(np.int64), arrive, depart, stops, passing,
+                    distances, cruise, times, action_wp, table[:, 0].astype(np.int64),
+                    action_start, action_start + durations)
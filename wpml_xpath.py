@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+wpml_xpath.py
+
+DJI WPML（template.kml / waylines.wpml）用のコンパイル済み XPath 集。
+• 名前空間を束縛した etree.XPath をインポート時に 1 回だけコンパイルする
+• ドキュメント全体の検索は kml/Document/Folder の構造に固定したパスにして、
+  ".//" による全要素走査を避ける
+• 変換ツール (GUI69 / kmz_converter / wpml_model)、Google Earth 出力 (GoogleEarthPro1)、
+  archive の各スクリプトで使う検索を網羅（ウェイポイント速度・ヘディング設定・アクションパラメータの
+  要素単位の検索は、現在は archive のスクリプトの置き換え用）
+
+使い方:
+    from wpml_xpath import PLACEMARKS, first, GLOBAL_TURN_MODE
+    for pm in PLACEMARKS(tree): ...
+    turn = first(GLOBAL_TURN_MODE, tree)
+
+ベンチマークは benchmark_xpath.py を参照。
+"""
+
+from lxml import etree
+
+# --- 定数 ------------------------------------------------------------------
+
+NS = {
+    "kml": "http://www.opengis.net/kml/2.2",
+    "wpml": "http://www.dji.com/wpmz/1.0.6"
+}
+
+def _xp(expr):
+    return etree.XPath(expr, namespaces=NS)
+
+def first(query, node):
+    """要素を返すクエリの先頭要素（無ければ None）。find() の置き換え用"""
+    result = query(node)
+    return result[0] if result else None
+
+# クエリを組み立てるためのパス
+_DOCUMENT = "/kml:kml/kml:Document"
+_FOLDER = f"{_DOCUMENT}/kml:Folder"
+_MISSION_CONFIG = f"{_DOCUMENT}/wpml:missionConfig"
+
+# --- ドキュメント全体（ツリーまたはツリー内の任意の要素に適用） ----------------
+
+FOLDERS = _xp(_FOLDER)
+PLACEMARKS = _xp(f"{_FOLDER}/kml:Placemark")
+
+MISSION_CONFIGS = _xp(_MISSION_CONFIG)
+GLOBAL_TRANSITIONAL_SPEED = _xp(f"{_MISSION_CONFIG}/wpml:globalTransitionalSpeed")
+TAKEOFF_SECURITY_HEIGHT = _xp(f"{_MISSION_CONFIG}/wpml:takeOffSecurityHeight")
+
+AUTO_FLIGHT_SPEED = _xp(f"{_FOLDER}/wpml:autoFlightSpeed")
+GLOBAL_HEIGHT = _xp(f"{_FOLDER}/wpml:globalHeight")
+GLOBAL_HEIGHT_MODE = _xp(f"{_FOLDER}/wpml:waylineCoordinateSysParam/wpml:heightMode")
+GLOBAL_TURN_MODE = _xp(f"{_FOLDER}/wpml:globalWaypointTurnMode")
+GLOBAL_HEADING_PARAMS = _xp(f"{_FOLDER}/wpml:globalWaypointHeadingParam")
+PAYLOAD_PARAM = _xp(f"{_FOLDER}/wpml:payloadParam")
+PAYLOAD_IMAGE_FORMAT = _xp(f"string({_FOLDER}/wpml:payloadParam/wpml:imageFormat)")
+
+# グローバル設定と各 Placemark の heightMode すべて
+HEIGHT_MODES = _xp(
+    f"{_FOLDER}/wpml:waylineCoordinateSysParam/wpml:heightMode"
+    f" | {_FOLDER}/kml:Placemark/wpml:heightMode")
+
+# payloadParam 要素に適用
+IMAGE_FORMAT = _xp("wpml:imageFormat")
+
+# --- Placemark 単位（Placemark 要素に適用） -----------------------------------
+
+WP_INDEX = _xp("wpml:index")
+WP_INDEX_TEXT = _xp("string(wpml:index)")
+WP_COORDINATES = _xp("string(kml:Point/kml:coordinates)")
+WP_HEIGHT = _xp("string(wpml:height)")
+WP_ELLIPSOID_HEIGHT = _xp("string(wpml:ellipsoidHeight)")
+WP_HEIGHT_MODE = _xp("wpml:heightMode")
+WP_SPEED = _xp("wpml:waypointSpeed")
+WP_HEADING_PARAM = _xp("wpml:waypointHeadingParam")
+WP_ACTION_GROUPS = _xp("wpml:actionGroup")
+WP_ACTIONS = _xp("wpml:actionGroup/wpml:action")
+
+# Point 要素に適用
+POINT_COORDINATES = _xp("kml:coordinates")
+
+# --- ヘディング設定（globalWaypointHeadingParam / waypointHeadingParam に適用） --
+
+HEADING_MODE = _xp("wpml:waypointHeadingMode")
+HEADING_ANGLE = _xp("wpml:waypointHeadingAngle")
+HEADING_POI_POINT = _xp("wpml:waypointPoiPoint")
+HEADING_POI_INDEX = _xp("wpml:waypointHeadingPoiIndex")
+HEADING_PATH_MODE = _xp("wpml:waypointHeadingPathMode")
+
+# --- アクション（actionTrigger / action 要素に適用） ---------------------------
+
+TRIGGER_TYPE = _xp("wpml:actionTriggerType")
+
+ACTION_FUNC = _xp("string(wpml:actionActuatorFunc)")
+ACTION_PARAM = _xp("wpml:actionActuatorFuncParam")
+ACTION_PITCH_ANGLE = _xp("string(wpml:actionActuatorFuncParam/wpml:gimbalPitchRotateAngle)")
+ACTION_YAW_ANGLE = _xp("string(wpml:actionActuatorFuncParam/wpml:gimbalYawRotateAngle)")
+ACTION_PITCH_ENABLE = _xp("string(wpml:actionActuatorFuncParam/wpml:gimbalPitchRotateEnable)")
+ACTION_YAW_ENABLE = _xp("string(wpml:actionActuatorFuncParam/wpml:gimbalYawRotateEnable)")
+ACTION_AIRCRAFT_HEADING = _xp("string(wpml:actionActuatorFuncParam/wpml:aircraftHeading)")
+ACTION_FOCAL_LENGTH = _xp("string(wpml:actionActuatorFuncParam/wpml:focalLength)")